@@ -5,6 +5,7 @@ from app.api.routers.formats import router as formats_router
 from app.api.routers.admin_formats import router as admin_formats_router
 from app.api.routers.admin_rules import router as admin_rules_router
 from app.api.routers.admin_styles import router as admin_styles_router
+from app.api.routers.admin_queue import router as admin_queue_router
 
 __all__ = [
     "auth_router",
@@ -14,4 +15,5 @@ __all__ = [
     "admin_formats_router",
     "admin_rules_router",
     "admin_styles_router",
+    "admin_queue_router",
 ]
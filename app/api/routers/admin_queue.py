@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from typing import List
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+
+from app.dependencies import require_admin
+from app.services.scheduler import FairShareScheduler
+
+router = APIRouter(tags=["Admin - Queue"])
+
+
+class UserQueueDepth(BaseModel):
+    userId: str
+    queued: int
+    inFlight: int
+    maxInFlight: int
+    weight: int
+
+
+@router.get("/admin/queue", response_model=List[UserQueueDepth])
+def get_queue_depths(_: None = Depends(require_admin)):
+    """Per-user generation work waiting in the fair-share scheduler and currently running."""
+    return FairShareScheduler().queue_depths()
@@ -5,6 +5,12 @@ from sqlalchemy.orm import Session
 
 from app.dependencies import get_db, require_admin
 from app.models.app_settings import AppSettings
+from app.services.rule_service import (
+    DEFAULT_ADAPTATION,
+    DEFAULT_AI_BEHAVIOR,
+    DEFAULT_UPLOAD_MODERATION,
+    DEFAULT_MANUAL_EDITING,
+)
 from app.schemas.rules import (
     AdaptationRule,
     AIBehaviorRule,
@@ -14,30 +20,6 @@ from app.schemas.rules import (
 
 router = APIRouter(tags=["Admin - Rules & Controls"])
 
-DEFAULT_ADAPTATION = {
-    "focalPointLogic": "face-centric",
-    "layoutGuidance": {
-        "safeZone": {"top": 0.05, "bottom": 0.05, "left": 0.05, "right": 0.05},
-        "logoSize": 0.1,
-    },
-}
-DEFAULT_AI_BEHAVIOR = {
-    "adaptationStrategy": "crop",
-    "imageQuality": "medium",
-}
-DEFAULT_UPLOAD_MODERATION = {
-    "allowedImageTypes": ["jpeg", "png", "psd"],
-    "maxFileSizeMb": 20,
-    "nsfwAlertsActive": False,
-}
-DEFAULT_MANUAL_EDITING = {
-    "editingEnabled": True,
-    "croppingEnabled": True,
-    "saturationEnabled": True,
-    "addTextOrLogoEnabled": True,
-    "allowedLogoSources": {"types": ["jpeg", "png", "psd", "ai"], "maxSizeMb": 5},
-}
-
 
 def get_setting(db: Session, key: str) -> dict | None:
     setting = db.query(AppSettings).filter(AppSettings.rule_key == key).first()
@@ -1,19 +1,43 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import json
+import os
 import uuid
-from typing import Dict, List, Literal
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Dict, List, Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from app.config import get_settings
 from app.dependencies import get_db, get_current_user
 from app.models.generation_job import GenerationJob, JobStatus
 from app.models.generated_asset import GeneratedAsset
-from app.models.asset_format import AssetFormat
+from app.models.project import Project
 from app.schemas.generation import GenerationRequest, GenerationJobStatus
+from app.services.generation_service import (
+    JobProgressTracker,
+    estimate_job_outputs,
+    generated_asset_rows,
+    job_spec,
+    job_target_ids,
+    read_job_progress,
+)
+from app.services.download_service import archive_stream, plan_archive
+from app.services.edit_service import render_edited, render_preview, validate_edits
+from app.services.job_events import get_job_event_broker
+from app.services.rule_service import get_rule_value
 from app.models.user import User
+from app.utils.logging_utils import get_logger
+from app.utils.pagination import NEXT_CURSOR_HEADER, InvalidCursorError, apply_keyset, split_page
+from app.workers.celery_app import queue_for_job
 from app.workers.tasks_generation import process_generation_job
 
+settings = get_settings()
+logger = get_logger(__name__)
+
 router = APIRouter(tags=["Generation"])
 
 
@@ -34,13 +58,29 @@ def start_generation(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    job = GenerationJob(project_id=req.projectId, user_id=current_user.id, status=JobStatus.pending, progress=0)
+    project = db.get(Project, req.projectId)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    asset_ids: List[str] = []
+    target_ids = job_target_ids([str(fid) for fid in req.formatIds], req.customResizes)
+    job = GenerationJob(
+        project_id=req.projectId,
+        user_id=current_user.id,
+        status=JobStatus.pending,
+        progress=0,
+        spec=job_spec(asset_ids, target_ids),
+    )
     db.add(job)
     db.commit()
     db.refresh(job)
+    try:
+        JobProgressTracker(db, job.id).register(job)
+    except Exception as exc:
+        # Status reads fall back to Postgres.
+        logger.warning(f"job {job.id}: could not register progress in the state store ({exc})")
 
-    asset_ids: List[str] = []
-    process_generation_job.delay(str(job.id), str(req.projectId), asset_ids, [str(fid) for fid in req.formatIds])
+    queue = queue_for_job(estimate_job_outputs(db, req.projectId, current_user.id, asset_ids, target_ids))
+    process_generation_job.apply_async(args=[str(job.id), str(req.projectId), asset_ids, target_ids], queue=queue)
 
     return {"jobId": str(job.id)}
 
@@ -51,67 +91,157 @@ def generation_status(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    state = read_job_progress(jobId)
+    if state.get("status") and state.get("user_id") == str(current_user.id):
+        return GenerationJobStatus(status=state["status"], progress=int(state.get("progress", 0)))
+
     job = db.get(GenerationJob, jobId)
     if not job or job.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Job not found")
     return GenerationJobStatus(status=job.status.value, progress=job.progress)
 
 
+TERMINAL_STATUSES = {JobStatus.completed.value, JobStatus.failed.value}
+
+
+def _sse(event: dict) -> str:
+    return f"event: progress\ndata: {json.dumps(event)}\n\n"
+
+
+@router.get("/generate/{jobId}/events")
+def generation_events(
+    jobId: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Server-sent events with the job's status and progress, pushed as workers report them.
+
+    The stream opens with the current state and closes after the job completes or fails,
+    so one authenticated request replaces a polling loop on ``/status``.
+    """
+    snapshot = generation_status(jobId, db=db, current_user=current_user).dict()
+
+    async def stream():
+        subscription = await get_job_event_broker().subscribe(jobId)
+        try:
+            # Subscribed first, so nothing published after this read can be missed.
+            state = read_job_progress(jobId)
+            event = snapshot
+            if state.get("status"):
+                event = {"status": state["status"], "progress": int(state.get("progress", 0))}
+            yield _sse(event)
+            while event["status"] not in TERMINAL_STATUSES:
+                next_event = await subscription.next_event(timeout=settings.JOB_EVENTS_HEARTBEAT_SECONDS)
+                if next_event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event = next_event
+                yield _sse(event)
+        finally:
+            await subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Results of a completed job no longer change, so clients may reuse a page for this long
+# and revalidate it with If-None-Match afterwards.
+RESULTS_MAX_AGE_SECONDS = 300
+
+
+def _custom_format_name(dimensions: Optional[dict]) -> Optional[str]:
+    # Outputs of customResizes have no format record.
+    if not dimensions:
+        return None
+    return f"Custom {dimensions.get('width')}x{dimensions.get('height')}"
+
+
+def _serialize_generated_asset(ga: GeneratedAsset, format_name: Optional[str], platform_name: Optional[str]) -> dict:
+    return {
+        "id": str(ga.id),
+        "originalAssetId": str(ga.original_asset_id),
+        "filename": ga.storage_path.split("/")[-1],
+        "assetUrl": f"http://localhost{ga.storage_path}",
+        "platformName": platform_name,
+        "formatName": format_name or _custom_format_name(ga.dimensions),
+        "dimensions": ga.dimensions,
+        "isNsfw": ga.is_nsfw,
+    }
+
+
+def _results_etag(job: GenerationJob, limit: int, cursor: Optional[str]) -> str:
+    raw = f"{job.id}:{job.updated_at.isoformat() if job.updated_at else ''}:{limit}:{cursor or ''}"
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
 @router.get("/generate/{jobId}/results")
 def generation_results(
     jobId: uuid.UUID,
+    response: Response,
+    limit: int = Query(200, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
-) -> Dict[str, List[dict]]:
+):
     job = db.get(GenerationJob, jobId)
     if not job or job.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    assets = db.query(GeneratedAsset).filter(GeneratedAsset.job_id == jobId).all()
+    etag = None
+    if job.status == JobStatus.completed:
+        etag = _results_etag(job, limit, cursor)
+        cache_headers = {"ETag": etag, "Cache-Control": f"private, max-age={RESULTS_MAX_AGE_SECONDS}"}
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+        response.headers.update(cache_headers)
+    else:
+        response.headers["Cache-Control"] = "no-store"
+
+    try:
+        query = apply_keyset(
+            generated_asset_rows(db).filter(GeneratedAsset.job_id == jobId),
+            GeneratedAsset.created_at,
+            GeneratedAsset.id,
+            cursor,
+        )
+        rows, next_cursor = split_page(query.limit(limit + 1).all(), limit, key=lambda row: (row[0].created_at, row[0].id))
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
     results: Dict[str, List[dict]] = {}
-    for ga in assets:
-        fmt: AssetFormat | None = db.get(AssetFormat, ga.asset_format_id) if ga.asset_format_id else None
-        platform_name = None
-        format_name = None
-        if fmt:
-            format_name = fmt.name
-            if fmt.platform_id:
-                platform_name = str(fmt.platform_id)
+    for ga, format_name, platform_name in rows:
         results.setdefault(platform_name or "Generic", []).append(
-            {
-                "id": str(ga.id),
-                "originalAssetId": str(ga.original_asset_id),
-                "filename": ga.storage_path.split("/")[-1],
-                "assetUrl": f"http://localhost{ga.storage_path}",
-                "platformName": platform_name,
-                "formatName": format_name,
-                "dimensions": ga.dimensions,
-                "isNsfw": ga.is_nsfw,
-            }
+            _serialize_generated_asset(ga, format_name, platform_name)
         )
     return results
 
 
+def _get_generated_asset_row(db: Session, asset_id: uuid.UUID, user_id: uuid.UUID):
+    """(asset, format name, platform name) of one of the user's generated assets; 404 for anyone else's."""
+    row = (
+        generated_asset_rows(db)
+        .join(GenerationJob, GenerationJob.id == GeneratedAsset.job_id)
+        .filter(GeneratedAsset.id == asset_id, GenerationJob.user_id == user_id)
+        .first()
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="Generated asset not found")
+    return row
+
+
 @router.get("/generated-assets/{assetId}")
 def get_generated_asset(
     assetId: uuid.UUID,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    asset = db.get(GeneratedAsset, assetId)
-    if not asset:
-        raise HTTPException(status_code=404, detail="Generated asset not found")
-    fmt: AssetFormat | None = db.get(AssetFormat, asset.asset_format_id) if asset.asset_format_id else None
-    return {
-        "id": str(asset.id),
-        "originalAssetId": str(asset.original_asset_id),
-        "filename": asset.storage_path.split("/")[-1],
-        "assetUrl": f"http://localhost{asset.storage_path}",
-        "platformName": str(fmt.platform_id) if fmt and fmt.platform_id else None,
-        "formatName": fmt.name if fmt else None,
-        "dimensions": asset.dimensions,
-        "isNsfw": asset.is_nsfw,
-    }
+    return _serialize_generated_asset(*_get_generated_asset_row(db, assetId, current_user.id))
 
 
 @router.put("/generated-assets/{assetId}")
@@ -121,23 +251,52 @@ def update_generated_asset(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    asset = db.get(GeneratedAsset, assetId)
-    if not asset:
-        raise HTTPException(status_code=404, detail="Generated asset not found")
+    asset, format_name, platform_name = _get_generated_asset_row(db, assetId, current_user.id)
+    validate_edits(payload.edits, get_rule_value(db, "manual-editing"), asset)
     asset.manual_edits = payload.edits
     db.add(asset)
     db.commit()
-    fmt: AssetFormat | None = db.get(AssetFormat, asset.asset_format_id) if asset.asset_format_id else None
-    return {
-        "id": str(asset.id),
-        "originalAssetId": str(asset.original_asset_id),
-        "filename": asset.storage_path.split("/")[-1],
-        "assetUrl": f"http://localhost{asset.storage_path}",
-        "platformName": str(fmt.platform_id) if fmt and fmt.platform_id else None,
-        "formatName": fmt.name if fmt else None,
-        "dimensions": asset.dimensions,
-        "isNsfw": asset.is_nsfw,
-    }
+    return _serialize_generated_asset(asset, format_name, platform_name)
+
+
+@router.get("/generated-assets/{assetId}/render")
+def render_generated_asset(
+    assetId: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """The generated asset with its saved manual edits applied, as PNG."""
+    asset = _get_generated_asset_row(db, assetId, current_user.id)[0]
+    if not os.path.isfile(asset.storage_path):
+        raise HTTPException(status_code=404, detail="Generated asset not found")
+    img = render_edited(asset, get_rule_value(db, "manual-editing"))
+    buf = io.BytesIO()
+    img.save(buf, "PNG", compress_level=1)
+    return Response(content=buf.getvalue(), media_type="image/png", headers={"Cache-Control": "no-store"})
+
+
+@router.post("/generated-assets/{assetId}/preview")
+def preview_generated_asset(
+    assetId: uuid.UUID,
+    payload: EditPayload,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Low-resolution render of ``edits`` for live feedback while editing; nothing is saved."""
+    rule = get_rule_value(db, "manual-editing")
+    asset = _get_generated_asset_row(db, assetId, current_user.id)[0]
+    if not os.path.isfile(asset.storage_path):
+        raise HTTPException(status_code=404, detail="Generated asset not found")
+    validate_edits(payload.edits, rule, asset)
+    img = render_preview(asset, payload.edits, rule)
+    buf = io.BytesIO()
+    if img.mode == "RGBA":
+        img.save(buf, "PNG", compress_level=1)
+        media_type = "image/png"
+    else:
+        img.save(buf, "JPEG", quality=85)
+        media_type = "image/jpeg"
+    return Response(content=buf.getvalue(), media_type=media_type, headers={"Cache-Control": "no-store"})
 
 
 @router.post("/download")
@@ -146,4 +305,10 @@ def download_assets(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    return {"downloadUrl": "http://localhost/data/downloads/fake.zip"}
+    """Stream a ZIP of the requested generated assets, re-encoded as ``format`` at ``quality``."""
+    entries = plan_archive(db, current_user.id, req.assetIds, req.format, req.grouping)
+    return StreamingResponse(
+        archive_stream(entries, req.format, req.quality),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="assets.zip"'},
+    )
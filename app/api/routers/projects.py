@@ -1,46 +1,47 @@
 from __future__ import annotations
 
-import io
 import uuid
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Response, UploadFile, status
 from sqlalchemy.orm import Session
 
+from app.config import get_settings
 from app.dependencies import get_db, get_current_user
 from app.models.project import Project, ProjectStatus
 from app.models.asset import Asset
+from app.services.analysis_service import invalidate_project_analysis
+from app.services.asset_service import delete_asset
+from app.services.blob_service import acquire_blob
+from app.services.project_service import get_projects_with_file_counts
 from app.schemas.project import ProjectResponse, ProjectStatusResponse, AssetPreview, AssetPreviewMetadata
-from app.utils.file_utils import save_upload_file
-from app.utils.image_utils import get_image_dimensions
+from app.utils.file_utils import UploadTooLargeError, commit_blob, discard_staged, stream_upload_file
+from app.utils.image_utils import probe_images
+from app.utils.pagination import NEXT_CURSOR_HEADER, InvalidCursorError, apply_keyset, split_page
 from app.models.user import User
 
 router = APIRouter(tags=["Projects & Assets"])
+settings = get_settings()
 
 
 @router.get("/projects", response_model=List[ProjectResponse])
 def list_projects(
-    limit: int = 10,
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
     offset: int = 0,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    projects = (
-        db.query(Project)
-        .filter(Project.user_id == current_user.id)
-        .order_by(Project.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
-    )
+    try:
+        page, next_cursor = get_projects_with_file_counts(db, current_user.id, limit=limit, offset=offset, cursor=cursor)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
     results: List[ProjectResponse] = []
-    for p in projects:
-        counts = {"psd": 0, "jpg": 0, "png": 0}
-        assets = db.query(Asset).filter(Asset.project_id == p.id).all()
-        for a in assets:
-            ext = a.file_type.lower()
-            if ext in counts:
-                counts[ext] += 1
+    for p, counts in page:
         results.append(
             ProjectResponse(
                 id=p.id,
@@ -60,35 +61,72 @@ async def create_project_and_upload(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    project = Project(user_id=current_user.id, name=projectName, status=ProjectStatus.uploading)
-    db.add(project)
-    db.commit()
-    db.refresh(project)
-
-    for uf in files:
-        content = await uf.read()
-        path = save_upload_file(io.BytesIO(content), uf.filename)
-        dims = {}
-        try:
-            dims = get_image_dimensions(path)
-        except Exception:
-            dims = {}
-
-        asset = Asset(
-            project_id=project.id,
-            original_filename=uf.filename,
-            storage_path=path,
-            file_type=(uf.filename.split(".")[-1].lower() if "." in uf.filename else "png"),
-            file_size_bytes=len(content),
-            dimensions=dims or None,
-            dpi=None,
-            ai_metadata=None,
+    if len(files) > settings.UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many files (max {settings.UPLOAD_MAX_FILES})",
         )
-        db.add(asset)
 
-    project.status = ProjectStatus.ready_for_review
-    db.add(project)
-    db.commit()
+    # Stage every file first so a rejected upload leaves no half-created project behind; the
+    # staged files only enter the blob store once the rows referencing them are committed.
+    stored = []
+    try:
+        for uf in files:
+            try:
+                saved = await stream_upload_file(
+                    uf,
+                    uf.filename,
+                    max_bytes=settings.UPLOAD_MAX_MB * 1024 * 1024,
+                    chunk_size=settings.UPLOAD_CHUNK_KB * 1024,
+                )
+            except UploadTooLargeError as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File '{exc.filename}' exceeds {settings.UPLOAD_MAX_MB} MB",
+                )
+            stored.append((uf, saved))
+
+        project = Project(user_id=current_user.id, name=projectName, status=ProjectStatus.uploading)
+        db.add(project)
+        db.flush()
+
+        # Identical content is probed once, from whichever copy was staged first.
+        staged = {}
+        for _, saved in stored:
+            staged.setdefault(saved["sha256"], saved["tmp_path"])
+        probes = await probe_images([staged[saved["sha256"]] for _, saved in stored])
+
+        for (uf, saved), probe in zip(stored, probes):
+            path = saved["path"]
+            dims = {"width": probe["width"], "height": probe["height"]} if probe else {}
+
+            asset = Asset(
+                project_id=project.id,
+                original_filename=uf.filename,
+                storage_path=path,
+                content_hash=saved["sha256"],
+                file_type=(uf.filename.split(".")[-1].lower() if "." in uf.filename else "png"),
+                file_size_bytes=saved["size"],
+                dimensions=dims or None,
+                dpi=probe.get("dpi"),
+                color_mode=probe.get("mode"),
+                layer_count=probe.get("layers"),
+                ai_metadata=None,
+            )
+            db.add(asset)
+            acquire_blob(db, saved["sha256"], path, saved["size"])
+
+        project.status = ProjectStatus.ready_for_review
+        db.add(project)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        for _, saved in stored:
+            discard_staged(saved["tmp_path"])
+        raise
+
+    for _, saved in stored:
+        commit_blob(saved["tmp_path"], saved["sha256"])
 
     return {"projectId": str(project.id)}
 
@@ -109,6 +147,9 @@ def project_status(
 @router.get("/projects/{projectId}/preview", response_model=List[AssetPreview])
 def project_preview(
     projectId: uuid.UUID,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -116,11 +157,18 @@ def project_preview(
     if not project or project.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    assets = db.query(Asset).filter(Asset.project_id == project.id).all()
+    try:
+        query = apply_keyset(db.query(Asset).filter(Asset.project_id == project.id), Asset.created_at, Asset.id, cursor)
+        assets, next_cursor = split_page(query.limit(limit + 1).all(), limit, key=lambda a: (a.created_at, a.id))
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
     previews: List[AssetPreview] = []
     for a in assets:
         meta = AssetPreviewMetadata(
-            layers=None,
+            layers=a.layer_count,
             width=(a.dimensions or {}).get("width"),
             height=(a.dimensions or {}).get("height"),
             dpi=a.dpi,
@@ -135,3 +183,35 @@ def project_preview(
             )
         )
     return previews
+
+
+@router.delete("/projects/{projectId}/analysis", status_code=status.HTTP_204_NO_CONTENT)
+def invalidate_analysis(
+    projectId: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Forget cached provider analyses so the next job re-analyzes the project's assets."""
+    project = db.get(Project, projectId)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    invalidate_project_analysis(db, project.id)
+    return None
+
+
+@router.delete("/projects/{projectId}/assets/{assetId}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_asset(
+    projectId: uuid.UUID,
+    assetId: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Delete an uploaded asset and its generated outputs; the stored file goes with its last reference."""
+    project = db.get(Project, projectId)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    asset = db.get(Asset, assetId)
+    if not asset or asset.project_id != project.id:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    delete_asset(db, asset)
+    return None
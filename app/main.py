@@ -1,5 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.config import get_settings
 from app.api import routers
@@ -22,6 +26,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Largest body a full upload batch can legitimately produce (+1 MB multipart overhead).
+MAX_REQUEST_BYTES = (settings.UPLOAD_MAX_FILES * settings.UPLOAD_MAX_MB + 1) * 1024 * 1024
+
+
+class RequestSizeLimitMiddleware:
+    """Answer 413 to request bodies over ``max_bytes``.
+
+    A declared Content-Length over the limit is refused before anything is read. Otherwise
+    (chunked bodies included) the bytes are counted as they are received and reading stops
+    at the limit, so the multipart parser never spools more than ``max_bytes`` to disk.
+    The per-file ``UPLOAD_MAX_MB`` is checked by the upload endpoint once the form is parsed.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await _too_large()(scope, receive, send)
+            return
+
+        received = 0
+        started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        async def tracked_send(message: Message) -> None:
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except HTTPException as exc:
+            # Raised while reading outside the routes' exception handling.
+            if exc.status_code != 413 or started:
+                raise
+            await _too_large()(scope, receive, send)
+
+
+def _too_large() -> JSONResponse:
+    return JSONResponse(status_code=413, content={"detail": "Request body too large"})
+
+
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=MAX_REQUEST_BYTES)
+
+
 app.include_router(routers.auth_router, prefix=settings.API_V1_PREFIX)
 app.include_router(routers.projects_router, prefix=settings.API_V1_PREFIX)
 app.include_router(routers.generation_router, prefix=settings.API_V1_PREFIX)
@@ -29,3 +92,4 @@ app.include_router(routers.formats_router, prefix=settings.API_V1_PREFIX)
 app.include_router(routers.admin_formats_router, prefix=settings.API_V1_PREFIX)
 app.include_router(routers.admin_rules_router, prefix=settings.API_V1_PREFIX)
 app.include_router(routers.admin_styles_router, prefix=settings.API_V1_PREFIX)
+app.include_router(routers.admin_queue_router, prefix=settings.API_V1_PREFIX)
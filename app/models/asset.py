@@ -9,13 +9,18 @@ from app.models.base import Base
 
 
 class Asset(Base):
+    __tablename__ = "assets"
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
     original_filename = Column(String(255), nullable=False)
     storage_path = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=True)  # sha256, key into stored_blobs
     file_type = Column(String(10), nullable=False)
     file_size_bytes = Column(BigInteger, nullable=False)
     dimensions = Column(JSONB, nullable=True)  # e.g., {"width": 1920, "height": 1080}
     dpi = Column(Integer, nullable=True)
+    color_mode = Column(String(16), nullable=True)  # PIL mode, e.g. "RGB", "CMYK"
+    layer_count = Column(Integer, nullable=True)  # PSD only
     ai_metadata = Column(JSONB, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -9,6 +9,8 @@ from app.models.base import Base
 
 
 class GeneratedAsset(Base):
+    __tablename__ = "generated_assets"
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     job_id = Column(UUID(as_uuid=True), ForeignKey("generation_jobs.id", ondelete="CASCADE"), nullable=False)  # match SQL schema
     original_asset_id = Column(UUID(as_uuid=True), ForeignKey("assets.id", ondelete="CASCADE"), nullable=False)
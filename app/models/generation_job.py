@@ -3,7 +3,7 @@ from __future__ import annotations
 import uuid
 import enum
 from sqlalchemy import Column, Integer, Enum, DateTime, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 
 from app.models.base import Base
@@ -17,6 +17,8 @@ class JobStatus(enum.Enum):
 
 
 class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -24,3 +26,9 @@ class GenerationJob(Base):
     progress = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    # What to generate ({"assetIds", "targetIds"}), kept so a stalled job can be re-planned and resumed
+    spec = Column(JSONB, nullable=True)
+    # Set on creation and refreshed while the job's work is dispatched, parked or making
+    # progress; the reaper resumes jobs where it goes stale
+    heartbeat_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    resume_count = Column(Integer, nullable=False, default=0)
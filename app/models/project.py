@@ -19,6 +19,8 @@ class ProjectStatus(enum.Enum):
 
 
 class Project(Base):
+    __tablename__ = "projects"
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     name = Column(String(255), nullable=False)
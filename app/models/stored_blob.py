@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from sqlalchemy import Column, String, Text, BigInteger, Integer, DateTime
+from sqlalchemy.sql import func
+
+from app.models.base import Base
+
+
+class StoredBlob(Base):
+    """One physical upload in the content-addressed store, shared by every asset with the same bytes."""
+
+    __tablename__ = "stored_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    storage_path = Column(Text, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -15,6 +15,8 @@ class UserRole(enum.Enum):
 
 
 class User(Base):
+    __tablename__ = "users"
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     username = Column(String(255), unique=True, nullable=False)
     email = Column(String(255), unique=True, nullable=False)
@@ -1,15 +1,39 @@
 from __future__ import annotations
 
 from typing import List, Optional, Dict
-from pydantic import BaseModel, Field, AnyUrl
+from pydantic import BaseModel, Field, AnyUrl, validator
 from uuid import UUID
 
 
+MAX_CUSTOM_SIDE = 10000
+# Per request: custom sizes, and their pixels summed over the distinct sizes (rendered once each).
+MAX_CUSTOM_RESIZES = 20
+MAX_CUSTOM_TOTAL_PIXELS = 200_000_000
+
+
 class GenerationRequest(BaseModel):
     projectId: UUID
     formatIds: List[UUID]
     customResizes: Optional[List[Dict[str, int]]] = None
 
+    @validator("customResizes", each_item=True)
+    def _check_custom_resize(cls, size: Dict[str, int]) -> Dict[str, int]:
+        width, height = size.get("width"), size.get("height")
+        if not width or not height or not (0 < width <= MAX_CUSTOM_SIDE and 0 < height <= MAX_CUSTOM_SIDE):
+            raise ValueError(f"custom resizes need a width and height between 1 and {MAX_CUSTOM_SIDE}")
+        return {"width": width, "height": height}
+
+    @validator("customResizes")
+    def _check_custom_resizes(cls, sizes: Optional[List[Dict[str, int]]]) -> Optional[List[Dict[str, int]]]:
+        if not sizes:
+            return sizes
+        if len(sizes) > MAX_CUSTOM_RESIZES:
+            raise ValueError(f"at most {MAX_CUSTOM_RESIZES} custom resizes per job")
+        pixels = sum(width * height for width, height in {(s["width"], s["height"]) for s in sizes})
+        if pixels > MAX_CUSTOM_TOTAL_PIXELS:
+            raise ValueError(f"custom resizes may total at most {MAX_CUSTOM_TOTAL_PIXELS:,} pixels per job")
+        return sizes
+
 
 class GeneratedAsset(BaseModel):
     id: UUID
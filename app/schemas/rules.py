@@ -28,6 +28,12 @@ class AdaptationRule(BaseModel):
 class AIBehaviorRule(BaseModel):
     adaptationStrategy: Literal["crop", "extend-canvas", "add-background"]
     imageQuality: Literal["low", "medium", "high"]
+    # Strategies rendered by the workers themselves; the others go to the AI provider.
+    localStrategies: List[Literal["crop", "extend-canvas", "add-background"]] = [
+        "crop",
+        "extend-canvas",
+        "add-background",
+    ]
 
 
 class UploadModerationRule(BaseModel):
@@ -1,18 +1,25 @@
+from functools import lru_cache
+
 from app.config import get_settings
 from app.services.ai_provider.base import AIProviderBase
 from app.services.ai_provider.openai_provider import OpenAIProvider
 from app.services.ai_provider.gemini_provider import GeminiProvider
+from app.services.ai_provider.http_provider import HTTPProvider
 from app.services.ai_provider.mock_provider import MockProvider
 
 settings = get_settings()
 
 
+@lru_cache
 def get_ai_provider() -> AIProviderBase:
+    """Process-wide provider, so its connection pool and concurrency limit are shared by every task."""
     provider = settings.AI_PROVIDER.lower()
     if provider == "openai":
         return OpenAIProvider()
     elif provider == "gemini":
         return GeminiProvider()
+    elif provider == "http":
+        return HTTPProvider(api_key=settings.AI_PROVIDER_API_KEY)
     elif provider == "mock":
         return MockProvider()
     else:
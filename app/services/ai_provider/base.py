@@ -1,8 +1,24 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, TypeVar
+
+from app.config import get_settings
+from app.services.ai_provider.governor import get_governor
+
+settings = get_settings()
+
+T = TypeVar("T")
 
 
 class AIProviderBase(ABC):
+    # Identify the model behind the results; bump ``version`` when outputs change so cached analyses are redone.
+    name: str = "base"
+    version: str = "1"
+    # Calls this provider may have in flight at once in one worker process.
+    max_concurrency: int = settings.AI_PROVIDER_MAX_CONCURRENCY
+    # Inputs sent per native batch request (ignored by providers without one).
+    max_batch_size: int = settings.AI_PROVIDER_BATCH_SIZE
+
     @abstractmethod
     def analyze_image(self, file_path: str) -> Dict[str, Any]:
         pass
@@ -10,3 +26,60 @@ class AIProviderBase(ABC):
     @abstractmethod
     def generate_asset(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         pass
+
+    # --- batch calls ---
+    # Fall back to one call per input; providers whose API takes several inputs per request
+    # override these so a batch costs one round-trip.
+
+    def analyze_images(self, file_paths: Sequence[str]) -> List[Dict[str, Any]]:
+        return [self.analyze_image(p) for p in file_paths]
+
+    def generate_assets(self, inputs: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self.generate_asset(i) for i in inputs]
+
+    # --- async protocol ---
+    # Defaults run the blocking calls on a thread; network-backed providers override these
+    # (see HTTPProvider) and make the blocking calls the wrappers instead.
+
+    async def analyze_image_async(self, file_path: str) -> Dict[str, Any]:
+        return await self.guarded(lambda: asyncio.to_thread(self.analyze_image, file_path))
+
+    async def generate_asset_async(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.guarded(lambda: asyncio.to_thread(self.generate_asset, input_data))
+
+    async def analyze_images_async(self, file_paths: Sequence[str]) -> List[Dict[str, Any]]:
+        if not self._has_native("analyze_images"):
+            return list(await asyncio.gather(*(self.analyze_image_async(p) for p in file_paths)))
+        return await self._batched(self.analyze_images, list(file_paths))
+
+    async def generate_assets_async(self, inputs: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not self._has_native("generate_assets"):
+            return list(await asyncio.gather(*(self.generate_asset_async(i) for i in inputs)))
+        return await self._batched(self.generate_assets, list(inputs))
+
+    def _has_native(self, method: str) -> bool:
+        return getattr(type(self), method) is not getattr(AIProviderBase, method)
+
+    async def _batched(self, call, items: list) -> List[Dict[str, Any]]:
+        # Chunks of max_batch_size run concurrently, each as one blocking batch call.
+        size = max(1, self.max_batch_size)
+
+        async def run(chunk: list) -> List[Dict[str, Any]]:
+            return await self.guarded(lambda: asyncio.to_thread(call, chunk))
+
+        chunks = await asyncio.gather(*(run(items[i : i + size]) for i in range(0, len(items), size)))
+        return [result for chunk in chunks for result in chunk]
+
+    async def guarded(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Run one provider request under the local semaphore and the shared governor."""
+        async with self.limiter():
+            return await get_governor(self.name).run(call)
+
+    def limiter(self) -> asyncio.Semaphore:
+        """Per-provider semaphore bounding concurrent calls on the running loop."""
+        loop = asyncio.get_running_loop()
+        cached = getattr(self, "_limiter", None)
+        if cached is None or cached[0] is not loop:
+            cached = (loop, asyncio.Semaphore(self.max_concurrency))
+            self._limiter = cached
+        return cached[1]
@@ -3,6 +3,9 @@ from app.services.ai_provider.base import AIProviderBase
 
 
 class GeminiProvider(AIProviderBase):
+    name = "gemini"
+    version = "1"
+
     def analyze_image(self, file_path: str) -> Dict[str, Any]:
         return {"detectedElements": ["product"], "width": 1024, "height": 768}
 
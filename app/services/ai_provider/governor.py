@@ -0,0 +1,235 @@
+"""Shared admission control for provider calls.
+
+Every provider call passes through the governor of its provider, which combines:
+
+* a token bucket (``PROVIDER_RATE_LIMITS``) so the fleet stays under the provider quota,
+* an AIMD concurrency limit for the whole fleet (at most ``PROVIDER_FLEET_MAX_CONCURRENCY``)
+  that halves on 429s / latency spikes and grows by ~1 per window of successful calls;
+  every call in flight holds a lease that expires on its own if the worker dies mid-call,
+* a circuit breaker that, after repeated provider failures, rejects calls for a cooldown and
+  then lets calls through as probes until one succeeds; a failure below its threshold also
+  halves the limit and backs the call off briefly.
+
+All of it lives in the state store, so every worker process sees the same limits. When a
+call would have to wait too long, or the circuit is open, a ``ProviderBackoff`` is raised
+and the caller is expected to park its work (the generation subtask retries later).
+"""
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from app.config import get_settings
+from app.services.state_store import StateStore, get_state_store
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+# Shared state outlives idle periods only briefly.
+STATE_TTL_SECONDS = 300
+# A call's lease outlives the provider timeout by this much before it is presumed dead.
+_LEASE_GRACE_SECONDS = 30.0
+_POLL_SECONDS = 0.05
+# Calls observed before latency spikes start to count.
+_LATENCY_WARMUP = 10
+_DECREASE_WINDOW_SECONDS = 1.0
+# Back-off after a provider failure (5xx, timeout) that did not open the circuit.
+_FAILURE_RETRY_SECONDS = 5.0
+
+
+class ProviderBackoff(Exception):
+    """The provider cannot take this call now; retry after ``retry_after`` seconds."""
+
+    def __init__(self, provider: str, retry_after: float, reason: str):
+        super().__init__(f"{provider}: {reason}, retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderThrottled(ProviderBackoff):
+    pass
+
+
+class CircuitOpen(ProviderBackoff):
+    pass
+
+
+class ProviderUnavailable(ProviderBackoff):
+    pass
+
+
+def _is_throttle(exc: BaseException) -> bool:
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429
+
+
+def _is_failure(exc: BaseException) -> bool:
+    # Errors that say the provider is unhealthy (not that our request was bad).
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+
+def _retry_after(exc: BaseException, default: float) -> float:
+    if isinstance(exc, httpx.HTTPStatusError):
+        try:
+            return float(exc.response.headers.get("Retry-After", default))
+        except ValueError:
+            pass
+    return default
+
+
+class ProviderGovernor:
+    def __init__(
+        self,
+        provider: str,
+        store: Optional[StateStore] = None,
+        rate: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.provider = provider
+        self.store = store or get_state_store()
+        self.rate = rate if rate is not None else settings.PROVIDER_RATE_LIMITS.get(provider)
+        self.max_concurrency = max_concurrency or settings.PROVIDER_FLEET_MAX_CONCURRENCY
+        self.min_concurrency = min(settings.PROVIDER_MIN_CONCURRENCY, self.max_concurrency)
+        self.clock = clock
+        self.key = f"provider:{provider}:governor"
+        self.bucket_key = f"provider:{provider}:bucket"
+        # Sorted set of in-flight call ids, scored by the time their lease runs out.
+        self.leases_key = f"provider:{provider}:leases"
+        self.lease_seconds = settings.AI_PROVIDER_TIMEOUT_SECONDS + _LEASE_GRACE_SECONDS
+        # Latency baseline is per process; spikes are judged against what this worker has seen.
+        self._latency: Optional[float] = None
+        self._samples = 0
+
+    # --- state ---
+
+    def state(self) -> Dict[str, float]:
+        raw = self.store.hgetall(self.key)
+        return {
+            "limit": float(raw.get("limit", self.max_concurrency)),
+            "in_flight": self.store.zcard(self.leases_key),
+            "failures": int(raw.get("failures", 0)),
+            "open_until": float(raw.get("open_until", 0)),
+            "decreased_at": float(raw.get("decreased_at", 0)),
+        }
+
+    def _set(self, **fields: object) -> None:
+        self.store.hset(self.key, fields)
+        self.store.expire(self.key, STATE_TTL_SECONDS)
+
+    # --- admission ---
+
+    async def run(self, call: Callable[[], Awaitable[T]], max_wait: Optional[float] = None) -> T:
+        """Run ``call`` once admitted; raises ``ProviderBackoff`` instead of waiting past ``max_wait``."""
+        max_wait = settings.PROVIDER_MAX_WAIT_SECONDS if max_wait is None else max_wait
+        deadline = self.clock() + max_wait
+        probe = self._check_circuit()
+        await self._take_token(deadline)
+        lease = await self._acquire_slot(deadline)
+        started = time.monotonic()
+        try:
+            result = await call()
+        except BaseException as exc:
+            self._release(lease)
+            self._on_error(exc)
+            raise
+        self._release(lease)
+        self._on_success(time.monotonic() - started, probe)
+        return result
+
+    def _check_circuit(self) -> bool:
+        """Raise while the circuit is open; True when its cooldown is over and this call is a probe."""
+        open_until = self.state()["open_until"]
+        now = self.clock()
+        if open_until > now:
+            raise CircuitOpen(self.provider, open_until - now, "circuit open")
+        return open_until > 0
+
+    async def _take_token(self, deadline: float) -> None:
+        if not self.rate:
+            return
+        while True:
+            now = self.clock()
+            wait = self.store.take_token(self.bucket_key, self.rate, max(1.0, self.rate), now, STATE_TTL_SECONDS)
+            if wait <= 0:
+                return
+            if now + wait > deadline:
+                raise ProviderThrottled(self.provider, wait, "rate limit")
+            await asyncio.sleep(wait)
+
+    async def _acquire_slot(self, deadline: float) -> str:
+        """Take a lease on one of the ``limit`` slots; returns its id for ``_release``."""
+        lease = uuid.uuid4().hex
+        while True:
+            now = self.clock()
+            # Leases of calls whose worker died are past their deadline and free their slot here.
+            self.store.zremrangebyscore(self.leases_key, float("-inf"), now)
+            self.store.zadd(self.leases_key, {lease: now + self.lease_seconds})
+            if self.store.zcard(self.leases_key) <= max(self.min_concurrency, int(self.state()["limit"])):
+                return lease
+            self.store.zrem(self.leases_key, lease)
+            if now + _POLL_SECONDS > deadline:
+                raise ProviderThrottled(self.provider, _POLL_SECONDS * 10, "concurrency limit")
+            await asyncio.sleep(_POLL_SECONDS)
+
+    def _release(self, lease: str) -> None:
+        self.store.zrem(self.leases_key, lease)
+
+    # --- feedback ---
+
+    def _on_success(self, latency: float, probe: bool = False) -> None:
+        state = self.state()
+        spike = (
+            self._samples >= _LATENCY_WARMUP
+            and latency > self._latency * settings.PROVIDER_LATENCY_SPIKE_FACTOR
+        )
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        self._samples += 1
+        if spike:
+            self._decrease(state)
+            limit = state["limit"]
+        else:
+            # Additive increase: about +1 after a full window of successful calls.
+            limit = min(float(self.max_concurrency), state["limit"] + 1.0 / max(1.0, state["limit"]))
+        if probe or not state["open_until"]:
+            # A probe after the cooldown closes the circuit. A call admitted before the circuit
+            # opened proves nothing about the provider now, so it leaves the breaker alone.
+            self._set(limit=limit, failures=0, open_until=0)
+        else:
+            self._set(limit=limit)
+
+    def _on_error(self, exc: BaseException) -> None:
+        state = self.state()
+        if _is_throttle(exc):
+            self._decrease(state)
+            raise ProviderThrottled(self.provider, _retry_after(exc, 1.0), "throttled by provider") from exc
+        if _is_failure(exc):
+            failures = self.store.hincrby(self.key, "failures", 1)
+            if failures >= settings.PROVIDER_BREAKER_THRESHOLD:
+                cooldown = settings.PROVIDER_BREAKER_COOLDOWN_SECONDS
+                self._set(open_until=self.clock() + cooldown)
+                raise CircuitOpen(self.provider, cooldown, "circuit opened") from exc
+            self._decrease(state)
+            retry_after = _retry_after(exc, _FAILURE_RETRY_SECONDS)
+            raise ProviderUnavailable(self.provider, retry_after, "provider failure") from exc
+
+    def _decrease(self, state: Dict[str, float]) -> None:
+        # Multiplicative decrease, at most once per window so a burst of 429s halves the limit once.
+        now = self.clock()
+        if now - state["decreased_at"] < _DECREASE_WINDOW_SECONDS:
+            return
+        state["limit"] = max(float(self.min_concurrency), state["limit"] / 2)
+        self._set(limit=state["limit"], decreased_at=now)
+
+
+_governors: Dict[str, ProviderGovernor] = {}
+
+
+def get_governor(provider: str) -> ProviderGovernor:
+    if provider not in _governors:
+        _governors[provider] = ProviderGovernor(provider)
+    return _governors[provider]
@@ -0,0 +1,104 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from app.config import get_settings
+from app.services.ai_provider.base import AIProviderBase
+from app.services.ai_provider.runtime import run_sync
+
+settings = get_settings()
+
+
+class HTTPProvider(AIProviderBase):
+    """Provider backed by a JSON-over-HTTP service.
+
+    Single calls are ``POST /analyze`` (``{"filePath"}``) and ``POST /generate`` (the input
+    dict); batches are ``POST /analyze/batch`` and ``POST /generate/batch`` with
+    ``{"inputs": [...]}`` answered by ``{"results": [...]}`` in the same order.
+
+    All calls go through one pooled ``httpx.AsyncClient`` with keep-alive, so concurrent
+    requests share a bounded set of connections. Vendor providers can subclass this and
+    override the request/response mapping.
+    """
+
+    name = "http"
+    version = "1"
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                 max_batch_size: Optional[int] = None):
+        self.base_url = (base_url or settings.AI_PROVIDER_BASE_URL or "").rstrip("/")
+        if not self.base_url:
+            raise ValueError("AI_PROVIDER_BASE_URL is required for the http provider")
+        self.api_key = api_key
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if max_batch_size is not None:
+            self.max_batch_size = max_batch_size
+        self.timeout = timeout if timeout is not None else settings.AI_PROVIDER_TIMEOUT_SECONDS
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def client(self) -> httpx.AsyncClient:
+        # Clients are bound to the loop they were created on; one per loop (normally the provider loop).
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else None
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        async def call() -> Dict[str, Any]:
+            resp = await self.client().post(path, json=payload)
+            resp.raise_for_status()
+            return resp.json()
+
+        return await self.guarded(call)
+
+    async def analyze_image_async(self, file_path: str) -> Dict[str, Any]:
+        return await self._post("/analyze", {"filePath": file_path})
+
+    async def generate_asset_async(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._post("/generate", input_data)
+
+    async def _post_batches(self, path: str, inputs: list) -> List[Dict[str, Any]]:
+        if self.max_batch_size <= 1:
+            return list(await asyncio.gather(*(self._post(path, i) for i in inputs)))
+        size = self.max_batch_size
+        responses = await asyncio.gather(
+            *(self._post(f"{path}/batch", {"inputs": inputs[i : i + size]}) for i in range(0, len(inputs), size))
+        )
+        return [result for resp in responses for result in resp["results"]]
+
+    async def analyze_images_async(self, file_paths: Sequence[str]) -> List[Dict[str, Any]]:
+        return await self._post_batches("/analyze", [{"filePath": p} for p in file_paths])
+
+    async def generate_assets_async(self, inputs: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await self._post_batches("/generate", list(inputs))
+
+    def analyze_image(self, file_path: str) -> Dict[str, Any]:
+        return run_sync(self.analyze_image_async(file_path))
+
+    def generate_asset(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        return run_sync(self.generate_asset_async(input_data))
+
+    def analyze_images(self, file_paths: Sequence[str]) -> List[Dict[str, Any]]:
+        return run_sync(self.analyze_images_async(file_paths))
+
+    def generate_assets(self, inputs: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return run_sync(self.generate_assets_async(inputs))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
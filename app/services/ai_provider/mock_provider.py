@@ -1,9 +1,30 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Sequence
 from app.services.ai_provider.base import AIProviderBase
 
 
 class MockProvider(AIProviderBase):
+    name = "mock"
+    version = "1"
+    # Provider requests made by an instance, counting a whole batch as one (lets tests see the batching).
+    requests = 0
+
     def analyze_image(self, file_path: str) -> Dict[str, Any]:
+        self.requests += 1
+        return self._analysis()
+
+    def generate_asset(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        self.requests += 1
+        return self._generated()
+
+    def analyze_images(self, file_paths: Sequence[str]) -> List[Dict[str, Any]]:
+        self.requests += 1
+        return [self._analysis() for _ in file_paths]
+
+    def generate_assets(self, inputs: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.requests += 1
+        return [self._generated() for _ in inputs]
+
+    def _analysis(self) -> Dict[str, Any]:
         return {
             "detectedElements": ["mock-element"],
             "width": 640,
@@ -11,7 +32,7 @@ class MockProvider(AIProviderBase):
             "dpi": 72,
         }
 
-    def generate_asset(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _generated(self) -> Dict[str, Any]:
         return {
             "url": "http://localhost/generated/mock_asset.png",
             "formatName": "Mock-format",
@@ -3,6 +3,9 @@ from app.services.ai_provider.base import AIProviderBase
 
 
 class OpenAIProvider(AIProviderBase):
+    name = "openai"
+    version = "1"
+
     def analyze_image(self, file_path: str) -> Dict[str, Any]:
         # Placeholder for OpenAI Vision/Image API integration
         return {"detectedElements": ["face", "text"], "width": 800, "height": 600}
@@ -0,0 +1,36 @@
+"""One long-lived event loop per worker process for provider I/O.
+
+Celery tasks are synchronous, so provider coroutines are submitted to a loop running on a
+daemon thread. Keeping that loop (and every HTTP client bound to it) alive across tasks is
+what lets connections be reused instead of re-dialled per call.
+"""
+import asyncio
+import os
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+
+
+def provider_loop() -> asyncio.AbstractEventLoop:
+    """The process's provider loop, (re)started lazily, including after a prefork fork."""
+    global _loop, _loop_pid
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid() or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ai-provider-loop", daemon=True).start()
+            _loop, _loop_pid = loop, os.getpid()
+        return _loop
+
+
+def run_sync(awaitable: Awaitable[T]) -> T:
+    """Run ``awaitable`` on the provider loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(_await(awaitable), provider_loop()).result()
+
+
+async def _await(awaitable: Awaitable[T]) -> T:
+    return await awaitable
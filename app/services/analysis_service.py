@@ -0,0 +1,135 @@
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.models.asset import Asset
+from app.services.ai_provider.base import AIProviderBase
+from app.services.ai_provider.runtime import run_sync
+
+# Stored next to the analysis fields in Asset.ai_metadata to record what produced them,
+# and which of the metadata's fields the analysis wrote.
+ANALYSIS_KEY_FIELD = "analysisKey"
+ANALYSIS_FIELDS_FIELD = "analysisFields"
+_MARKERS = (ANALYSIS_KEY_FIELD, ANALYSIS_FIELDS_FIELD)
+
+
+def analysis_cache_key(asset: Asset, provider: AIProviderBase) -> Optional[str]:
+    if not asset.content_hash:
+        return None
+    return f"{asset.content_hash}:{provider.name}:{provider.version}"
+
+
+def _analysis_fields(metadata: Dict[str, Any]) -> Optional[set]:
+    if ANALYSIS_FIELDS_FIELD in metadata:
+        return set(metadata[ANALYSIS_FIELDS_FIELD])
+    # Stored before the field list was recorded: the metadata was nothing but the analysis.
+    return {k for k in metadata if k not in _MARKERS} if ANALYSIS_KEY_FIELD in metadata else None
+
+
+def _strip_key(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """The analysis part of an asset's metadata."""
+    fields = _analysis_fields(metadata) or set()
+    return {k: v for k, v in metadata.items() if k in fields}
+
+
+def _without_analysis(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Everything in an asset's metadata that the analysis did not write."""
+    metadata = metadata or {}
+    fields = _analysis_fields(metadata) or set()
+    return {k: v for k, v in metadata.items() if k not in fields and k not in _MARKERS}
+
+
+def get_or_create_analysis(db: Session, asset: Asset, provider: AIProviderBase) -> Dict[str, Any]:
+    """Return the provider analysis for an asset, calling the provider only on a cache miss.
+
+    Results are keyed by content hash and provider name/version, so an analysis made for any
+    asset with the same bytes is reused.
+    """
+    return get_or_create_analyses(db, [asset], provider)[asset.id]
+
+
+def get_or_create_analyses(
+    db: Session, assets: Sequence[Asset], provider: AIProviderBase
+) -> Dict[uuid.UUID, Dict[str, Any]]:
+    """Batch form of ``get_or_create_analysis``: {asset_id: analysis}.
+
+    Cache hits are resolved with one query; the misses go to the provider as a single batch
+    with one input per distinct content.
+    """
+    results: Dict[uuid.UUID, Dict[str, Any]] = {}
+    misses: List[Asset] = []
+    for asset in assets:
+        key = analysis_cache_key(asset, provider)
+        if key is not None and (asset.ai_metadata or {}).get(ANALYSIS_KEY_FIELD) == key:
+            results[asset.id] = _strip_key(asset.ai_metadata)
+        else:
+            misses.append(asset)
+    if not misses:
+        return results
+
+    by_hash: Dict[str, Dict[str, Any]] = {}
+    hashes = {a.content_hash for a in misses if a.content_hash}
+    if hashes:
+        for row in db.query(Asset.content_hash, Asset.ai_metadata).filter(Asset.content_hash.in_(hashes)):
+            metadata = row.ai_metadata or {}
+            if metadata.get(ANALYSIS_KEY_FIELD) == f"{row.content_hash}:{provider.name}:{provider.version}":
+                by_hash[row.content_hash] = _strip_key(metadata)
+
+    # Assets without a hash cannot share results, so each is its own provider input.
+    pending: Dict[Any, List[Asset]] = {}
+    for asset in misses:
+        if asset.content_hash not in by_hash:
+            pending.setdefault(asset.content_hash or asset.id, []).append(asset)
+    groups = list(pending.values())
+    paths = [group[0].storage_path for group in groups]
+    if len(paths) == 1:
+        fresh = [run_sync(provider.analyze_image_async(paths[0]))]
+    else:
+        fresh = run_sync(provider.analyze_images_async(paths)) if paths else []
+    for group, analysis in zip(groups, fresh):
+        for asset in group:
+            if asset.content_hash:
+                by_hash[asset.content_hash] = analysis
+            else:
+                results[asset.id] = analysis
+
+    stored = False
+    for asset in misses:
+        if asset.content_hash:
+            analysis = by_hash[asset.content_hash]
+            asset.ai_metadata = {
+                **_without_analysis(asset.ai_metadata),
+                **analysis,
+                ANALYSIS_KEY_FIELD: analysis_cache_key(asset, provider),
+                ANALYSIS_FIELDS_FIELD: sorted(analysis),
+            }
+            db.add(asset)
+            results[asset.id] = analysis
+            stored = True
+    if stored:
+        db.commit()
+    return results
+
+
+def invalidate_project_analysis(db: Session, project_id: uuid.UUID) -> int:
+    """Drop cached analyses for a project's assets.
+
+    The project's assets lose their analysis fields; other assets with the same content
+    (possibly other users') keep their metadata and only stop serving as the cache for it,
+    so the next job analyzes the content afresh. Returns the number of project assets cleared.
+    """
+    assets = db.query(Asset).filter(Asset.project_id == project_id).all()
+    cleared = 0
+    for asset in assets:
+        if asset.ai_metadata and _analysis_fields(asset.ai_metadata) is not None:
+            asset.ai_metadata = _without_analysis(asset.ai_metadata) or None
+            cleared += 1
+    hashes = {a.content_hash for a in assets if a.content_hash}
+    if hashes:
+        shared = db.query(Asset).filter(Asset.content_hash.in_(hashes), Asset.project_id != project_id)
+        for asset in shared:
+            if ANALYSIS_KEY_FIELD in (asset.ai_metadata or {}):
+                asset.ai_metadata = {k: v for k, v in asset.ai_metadata.items() if k != ANALYSIS_KEY_FIELD}
+    db.commit()
+    return cleared
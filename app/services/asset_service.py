@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List
 
 from app.models.asset import Asset
+from app.services.blob_service import acquire_blob, release_blob
 
 
 def create_assets(db: Session, project_id: uuid.UUID, files: List[dict]) -> List[Asset]:
@@ -12,6 +13,7 @@ def create_assets(db: Session, project_id: uuid.UUID, files: List[dict]) -> List
             project_id=project_id,
             original_filename=f["filename"],
             storage_path=f["path"],
+            content_hash=f.get("sha256"),
             file_type=f["type"],
             file_size_bytes=f["size"],
             dimensions=f.get("dimensions"),
@@ -19,6 +21,8 @@ def create_assets(db: Session, project_id: uuid.UUID, files: List[dict]) -> List
             ai_metadata=f.get("ai_metadata", {}),
         )
         db.add(asset)
+        if asset.content_hash:
+            acquire_blob(db, asset.content_hash, asset.storage_path, asset.file_size_bytes)
         assets.append(asset)
     db.commit()
     for a in assets:
@@ -28,3 +32,12 @@ def create_assets(db: Session, project_id: uuid.UUID, files: List[dict]) -> List
 
 def get_assets_by_project(db: Session, project_id: uuid.UUID) -> List[Asset]:
     return db.query(Asset).filter(Asset.project_id == project_id).all()
+
+
+def delete_asset(db: Session, asset: Asset) -> None:
+    """Delete the asset (its generated outputs cascade) and its reference to the stored upload."""
+    content_hash = asset.content_hash
+    db.delete(asset)
+    if content_hash:
+        release_blob(db, content_hash)
+    db.commit()
@@ -0,0 +1,45 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.stored_blob import StoredBlob
+from app.utils.file_utils import delete_blob
+
+
+def _locked(db: Session, sha256: str):
+    # The row lock serializes acquire and release of the same content across requests.
+    return db.query(StoredBlob).filter(StoredBlob.sha256 == sha256).with_for_update().first()
+
+
+def acquire_blob(db: Session, sha256: str, storage_path: str, size_bytes: int) -> None:
+    """Add one reference to a stored blob, registering it on first use.
+
+    Does not commit: the reference belongs to the same transaction as the asset row that holds it.
+    """
+    blob = _locked(db, sha256)
+    if blob:
+        blob.ref_count += 1
+        return
+    try:
+        with db.begin_nested():
+            db.add(StoredBlob(sha256=sha256, storage_path=storage_path, size_bytes=size_bytes, ref_count=1))
+    except IntegrityError:
+        # Another request registered the same content concurrently.
+        _locked(db, sha256).ref_count += 1
+
+
+def release_blob(db: Session, sha256: str) -> bool:
+    """Drop one reference; the file is removed once nothing points at it. Returns True if it was removed.
+
+    Does not commit. The file is removed while the row is still locked, so a concurrent
+    upload of the same bytes waits and then registers (and stores) it afresh.
+    """
+    blob = _locked(db, sha256)
+    if not blob:
+        return False
+    blob.ref_count -= 1
+    if blob.ref_count > 0:
+        return False
+    db.delete(blob)
+    db.flush()
+    delete_blob(sha256)
+    return True
@@ -0,0 +1,133 @@
+"""On-disk cache of finished download archives.
+
+Archives are stored under a key derived from their members (including each source file's
+mtime and size), each member's manual edits and the encoding options, so an edit to any
+member or a rewrite of its file makes the old archive unreachable; it is then dropped by the
+size-bounded LRU eviction like any other cold entry. A hit is served
+straight from disk, with no re-encoding.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from functools import lru_cache
+from typing import BinaryIO, Iterator, List, Optional, Sequence
+
+from app.config import get_settings
+from app.utils.logging_utils import get_logger
+
+settings = get_settings()
+logger = get_logger(__name__)
+
+READ_CHUNK_BYTES = 256 * 1024
+
+
+def _source_version(path: str) -> List[int]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [0, 0]
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def download_cache_key(entries: Sequence[Sequence], fmt: str, quality: str) -> str:
+    """Canonical key of an archive: its members (layout, source and its version, edits) and encoding options."""
+    members = sorted(
+        json.dumps([*entry, _source_version(entry[1])], sort_keys=True, default=str) for entry in entries
+    )
+    raw = json.dumps([fmt, quality, members])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DownloadCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.zip")
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """The cached archive, opened for reading (so eviction cannot pull it away mid-send), or None."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            fh = open(path, "rb")
+        except OSError:
+            return None
+        self._touch(path)
+        return fh
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # mtime is the LRU clock; set explicitly, as the filesystem's own "now" is coarse.
+        try:
+            now = time.time_ns()
+            os.utime(path, ns=(now, now))
+        except OSError:
+            pass
+
+    def store(self, key: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Pass ``chunks`` through, keeping a copy that becomes the entry once the stream completes.
+
+        An archive whose stream is abandoned (client gone, error) is never published.
+        """
+        if not self.enabled:
+            yield from chunks
+            return
+        partial = os.path.join(self.root, f"{key}.{uuid.uuid4().hex}.part")
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            out = open(partial, "wb")
+        except OSError as exc:
+            logger.warning(f"download cache unavailable ({exc})")
+            yield from chunks
+            return
+        try:
+            with out:
+                for chunk in chunks:
+                    out.write(chunk)
+                    yield chunk
+            os.replace(partial, self._path(key))
+            self._touch(self._path(key))
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used archives until the cache fits in ``max_bytes``."""
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".zip"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def read_chunks(fh: BinaryIO) -> Iterator[bytes]:
+    with fh:
+        while chunk := fh.read(READ_CHUNK_BYTES):
+            yield chunk
+
+
+@lru_cache
+def get_download_cache() -> DownloadCache:
+    return DownloadCache(settings.DOWNLOAD_CACHE_DIR, settings.DOWNLOAD_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,167 @@
+"""Streaming ZIP archives of generated assets for ``POST /download``.
+
+The archive is written to a non-seekable sink, so every member carries a data descriptor
+and its bytes can leave as soon as they are written: no temporary file, and the first
+chunk goes out once the first member is encoded. Re-encoding runs in a process pool a
+bounded number of members ahead of the writer, which also bounds memory per download.
+"""
+import io
+import os
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.asset import Asset
+from app.models.generated_asset import GeneratedAsset
+from app.models.generation_job import GenerationJob
+from app.services.download_cache import download_cache_key, get_download_cache, read_chunks
+from app.services.edit_service import allowed_edits
+from app.services.generation_service import generated_asset_rows
+from app.services.rule_service import get_rule_value
+from app.utils.image_utils import encode_for_download
+from app.utils.logging_utils import get_logger
+
+settings = get_settings()
+logger = get_logger(__name__)
+
+EXTENSIONS = {"jpeg": "jpg", "png": "png"}
+# Size of the pieces a member is written (and yielded) in.
+CHUNK_BYTES = 256 * 1024
+
+# (path inside the archive, source file on disk, the manual edits to apply)
+ArchiveEntry = Tuple[str, str, dict]
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _encode_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.DOWNLOAD_ENCODE_WORKERS)
+    return _pool
+
+
+def _stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0] or "asset"
+
+
+def plan_archive(db: Session, user_id: uuid.UUID, asset_ids: Sequence[uuid.UUID], fmt: str, grouping: str) -> List[ArchiveEntry]:
+    """Archive layout for the user's generated assets among ``asset_ids``, in request order.
+
+    ``individual`` puts every file at the root, ``batch`` gives each original asset a folder
+    and ``category`` a folder per platform ("Generic" for plain resizes). Unknown ids, other
+    users' assets and outputs that are not local files are skipped.
+    """
+    rows = (
+        generated_asset_rows(db)
+        .join(GenerationJob, GenerationJob.id == GeneratedAsset.job_id)
+        .filter(GeneratedAsset.id.in_(list(asset_ids)), GenerationJob.user_id == user_id)
+        .all()
+    )
+    rule = get_rule_value(db, "manual-editing")
+    by_id = {ga.id: (ga, platform_name) for ga, _, platform_name in rows}
+    originals: Dict[uuid.UUID, str] = {}
+    if grouping == "batch" and rows:
+        original_ids = {ga.original_asset_id for ga, _, _ in rows}
+        originals = dict(db.query(Asset.id, Asset.original_filename).filter(Asset.id.in_(original_ids)).all())
+
+    entries: List[ArchiveEntry] = []
+    used = set()
+    for asset_id in dict.fromkeys(asset_ids):
+        if asset_id not in by_id:
+            continue
+        ga, platform_name = by_id[asset_id]
+        if not os.path.isfile(ga.storage_path):
+            continue
+        folder = ""
+        if grouping == "batch":
+            folder = _stem(originals.get(ga.original_asset_id, str(ga.original_asset_id))) + "/"
+        elif grouping == "category":
+            folder = (platform_name or "Generic").replace("/", "-") + "/"
+        name, n = f"{folder}{_stem(ga.storage_path)}", 1
+        arcname = f"{name}.{EXTENSIONS[fmt]}"
+        while arcname in used:
+            n += 1
+            arcname = f"{name} ({n}).{EXTENSIONS[fmt]}"
+        used.add(arcname)
+        entries.append((arcname, ga.storage_path, allowed_edits(ga.manual_edits or {}, rule)))
+    return entries
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable buffer the ZIP writer appends to and the generator drains."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_archive(entries: Sequence[ArchiveEntry], fmt: str, quality: str) -> Iterator[bytes]:
+    """Yield the ZIP archive of ``entries``, edited and re-encoded as ``fmt`` at ``quality``.
+
+    Members are stored uncompressed (JPEG and PNG already are) in ``entries`` order; one
+    whose source cannot be decoded is left out rather than failing the whole download.
+    """
+    pool = _encode_pool()
+    ahead = max(1, settings.DOWNLOAD_ENCODE_AHEAD)
+    todo = iter(entries)
+    pending: Deque[Tuple[str, Future]] = deque()
+
+    def top_up() -> None:
+        while len(pending) < ahead:
+            entry = next(todo, None)
+            if entry is None:
+                return
+            arcname, path, edits = entry
+            pending.append((arcname, pool.submit(encode_for_download, path, fmt, quality, edits)))
+
+    sink = _ChunkSink()
+    try:
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+            top_up()
+            while pending:
+                arcname, future = pending.popleft()
+                top_up()
+                try:
+                    data = future.result()
+                except Exception as exc:
+                    logger.warning(f"download: skipping {arcname} ({exc})")
+                    continue
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                with archive.open(info, mode="w") as member:
+                    for start in range(0, len(data), CHUNK_BYTES):
+                        member.write(data[start:start + CHUNK_BYTES])
+                        if sink.buffer:
+                            yield sink.drain()
+                del data
+        yield sink.drain()  # last data descriptor and the central directory
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def archive_stream(entries: Sequence[ArchiveEntry], fmt: str, quality: str) -> Iterator[bytes]:
+    """The archive's bytes: from the download cache when it has them, else built and cached on the way out."""
+    cache = get_download_cache()
+    key = download_cache_key(entries, fmt, quality)
+    cached = cache.open(key)
+    if cached is not None:
+        return read_chunks(cached)
+    return cache.store(key, stream_archive(entries, fmt, quality))
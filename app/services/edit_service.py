@@ -0,0 +1,178 @@
+"""Manual edits of generated assets, under the admin's manual-editing rule.
+
+Saved edits are checked against the rule's toggles; rendering additionally drops any
+operation the rule disables today, so switching a toggle off also applies to edits saved
+before. Renders go through an ``EditPipeline`` so a tweak only re-runs the steps from the
+changed one onwards.
+
+Previews while editing run on a downscaled proxy (``EDIT_PREVIEW_LONG_EDGE``) with the edits
+scaled to match; the proxy is decoded once per generated asset and stays in the preview
+pipeline's bounded cache as the base of every chain. Full resolution is only rendered for
+saved edits (``render_edited``) and downloads.
+"""
+import math
+import os
+from typing import Any, Dict, Tuple
+
+from fastapi import HTTPException, status
+from PIL import Image, ImageColor
+
+from app.config import get_settings
+from app.models.generated_asset import GeneratedAsset
+from app.utils.edit_pipeline import DEFAULT_TEXT_SIZE, EditPipeline, edit_steps, scale_steps
+from app.utils.image_utils import load_image, load_proxy
+
+settings = get_settings()
+
+# ManualEditingRule toggle that governs each operation.
+OPERATION_TOGGLES = {
+    "crop": "croppingEnabled",
+    "saturation": "saturationEnabled",
+    "logo": "addTextOrLogoEnabled",
+    "text": "addTextOrLogoEnabled",
+}
+
+MAX_SATURATION = 5.0
+MAX_TEXT_LENGTH = 500
+
+_pipeline = EditPipeline(settings.EDIT_CACHE_MAX_MB * 1024 * 1024)
+_preview_pipeline = EditPipeline(settings.EDIT_PREVIEW_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _enabled(op: str, rule: Dict[str, Any]) -> bool:
+    return bool(rule.get("editingEnabled", True)) and bool(rule.get(OPERATION_TOGGLES[op], True))
+
+
+def allowed_edits(edits: Dict[str, Any], rule: Dict[str, Any]) -> Dict[str, Any]:
+    """The operations of ``edits`` the rule currently allows, in pipeline order."""
+    return {op: params for op, params in edit_steps(edits) if _enabled(op, rule)}
+
+
+def validate_edits(edits: Dict[str, Any], rule: Dict[str, Any], asset: GeneratedAsset) -> None:
+    """Check ``edits`` against the rule's toggles and each operation's params against the asset.
+
+    Coordinates are in the asset's pixels: crops must lie within it and logos and text are
+    capped at its size, so a request cannot make a render allocate an arbitrarily large image.
+    """
+    if not rule.get("editingEnabled", True):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Manual editing is disabled")
+    width, height = _image_size(asset)
+    for op, params in edit_steps(edits):
+        if not _enabled(op, rule):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Editing '{op}' is disabled")
+        _VALIDATORS[op](params, rule, width, height)
+
+
+def _bad(detail: str) -> None:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def _image_size(asset: GeneratedAsset) -> Tuple[int, int]:
+    if os.path.isfile(asset.storage_path):
+        with Image.open(asset.storage_path) as img:
+            return img.size
+    dims = asset.dimensions or {}
+    if not dims.get("width") or not dims.get("height"):
+        _bad("Generated asset cannot be edited")
+    return int(dims["width"]), int(dims["height"])
+
+
+def _fields(op: str, params: Any) -> Dict[str, Any]:
+    if not isinstance(params, dict):
+        _bad(f"'{op}' must be an object")
+    return params
+
+
+def _number(op: str, params: Dict[str, Any], field: str, default: float, low: float, high: float) -> float:
+    value = params.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        _bad(f"'{op}.{field}' must be a number")
+    if not low <= value <= high:
+        _bad(f"'{op}.{field}' must be between {low:g} and {high:g}")
+    return value
+
+
+def _validate_crop(params: Any, rule: Dict[str, Any], width: int, height: int) -> None:
+    params = _fields("crop", params)
+    x = _number("crop", params, "x", 0, 0, width - 1)
+    y = _number("crop", params, "y", 0, 0, height - 1)
+    _number("crop", params, "width", width - x, 1, width - x)
+    _number("crop", params, "height", height - y, 1, height - y)
+
+
+def _validate_saturation(params: Any, rule: Dict[str, Any], width: int, height: int) -> None:
+    if isinstance(params, bool) or not isinstance(params, (int, float)) or not 0 <= params <= MAX_SATURATION:
+        _bad(f"'saturation' must be a number between 0 and {MAX_SATURATION:g}")
+
+
+def _validate_logo(params: Any, rule: Dict[str, Any], width: int, height: int) -> None:
+    params = _fields("logo", params)
+    path = params.get("path")
+    uploads = os.path.realpath(settings.STORAGE_UPLOADS)
+    if not isinstance(path, str) or not os.path.realpath(path).startswith(uploads + os.sep) or not os.path.isfile(path):
+        _bad("Logo must be an uploaded file")
+    sources = rule.get("allowedLogoSources") or {}
+    ext = os.path.splitext(path)[1].lstrip(".").lower().replace("jpg", "jpeg")
+    if sources.get("types") and ext not in sources["types"]:
+        _bad("Logo type not allowed")
+    if sources.get("maxSizeMb") and os.path.getsize(path) > sources["maxSizeMb"] * 1024 * 1024:
+        _bad("Logo file too large")
+    try:
+        with Image.open(path) as logo:
+            logo_width, logo_height = logo.size
+    except (OSError, ValueError):
+        _bad("Logo is not a readable image")
+    _number("logo", params, "x", 0, 0, width - 1)
+    _number("logo", params, "y", 0, 0, height - 1)
+    scaled = _number("logo", params, "width", min(logo_width, width), 1, width)
+    if logo_height * scaled / logo_width > height:
+        _bad("Logo is taller than the image")
+
+
+def _validate_text(params: Any, rule: Dict[str, Any], width: int, height: int) -> None:
+    params = _fields("text", params)
+    content = params.get("content", "")
+    if not isinstance(content, str) or len(content) > MAX_TEXT_LENGTH:
+        _bad(f"'text.content' must be a string of at most {MAX_TEXT_LENGTH} characters")
+    _number("text", params, "x", 0, 0, width - 1)
+    _number("text", params, "y", 0, 0, height - 1)
+    _number("text", params, "size", min(DEFAULT_TEXT_SIZE, height), 1, height)
+    color = params.get("color", "#ffffff")
+    try:
+        ImageColor.getrgb(color)
+    except (TypeError, ValueError, AttributeError):
+        _bad("'text.color' is not a color")
+
+
+_VALIDATORS = {
+    "crop": _validate_crop,
+    "saturation": _validate_saturation,
+    "logo": _validate_logo,
+    "text": _validate_text,
+}
+
+
+def render_edited(asset: GeneratedAsset, rule: Dict[str, Any]) -> Image.Image:
+    """The generated asset with its allowed manual edits applied, reusing cached step prefixes."""
+    path = asset.storage_path
+    source_key = (path, os.stat(path).st_mtime_ns)
+    steps = list(allowed_edits(asset.manual_edits or {}, rule).items())
+    return _render(_pipeline, source_key, lambda: load_image(path), steps)
+
+
+def render_preview(asset: GeneratedAsset, edits: Dict[str, Any], rule: Dict[str, Any]) -> Image.Image:
+    """``edits`` (not necessarily saved) applied to the asset's proxy, for interactive feedback."""
+    path = asset.storage_path
+    source_key = (path, os.stat(path).st_mtime_ns)
+    with Image.open(path) as img:
+        factor = min(1.0, settings.EDIT_PREVIEW_LONG_EDGE / max(img.size))
+    steps = scale_steps(list(allowed_edits(edits, rule).items()), factor)
+    return _render(_preview_pipeline, source_key, lambda: load_proxy(path, settings.EDIT_PREVIEW_LONG_EDGE), steps)
+
+
+def _render(pipeline: EditPipeline, source_key, load, steps) -> Image.Image:
+    try:
+        return pipeline.render(source_key, load, steps)
+    except (ValueError, TypeError, AttributeError, KeyError, OSError) as exc:
+        # Edits saved before validation was this strict (or a logo removed since) cannot be rendered.
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Edits cannot be applied: {exc}")
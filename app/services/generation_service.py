@@ -1,10 +1,25 @@
+import time
 import uuid
+from sqlalchemy import func, insert
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from app.config import get_settings
+from app.models.asset import Asset
+from app.models.asset_format import AssetFormat
 from app.models.generation_job import GenerationJob, JobStatus
 from app.models.generated_asset import GeneratedAsset
+from app.models.project import Project
+from app.models.repurposing_platform import RepurposingPlatform
 from app.schemas.generation import GenerationRequest
+from app.services.job_events import JobEventBroker, get_job_event_broker
+from app.services.state_store import StateStore, get_state_store
+
+settings = get_settings()
+
+JOB_PROGRESS_TTL_SECONDS = 24 * 60 * 60
+# A job in one of these states is never moved out of it.
+TERMINAL_STATUSES = (JobStatus.completed, JobStatus.failed)
 
 
 def create_generation_job(db: Session, project_id: uuid.UUID, user_id: uuid.UUID) -> GenerationJob:
@@ -27,6 +42,167 @@ def update_job_status(db: Session, job_id: uuid.UUID, status: JobStatus, progres
     return job
 
 
+CUSTOM_TARGET_PREFIX = "custom:"
+
+
+def custom_target_id(width: int, height: int) -> str:
+    return f"{CUSTOM_TARGET_PREFIX}{width}x{height}"
+
+
+def parse_custom_target(target_id: str) -> Optional[Tuple[int, int]]:
+    """(width, height) of a ``custom:WxH`` target id; None for a format id."""
+    if not target_id.startswith(CUSTOM_TARGET_PREFIX):
+        return None
+    width, height = target_id[len(CUSTOM_TARGET_PREFIX):].split("x")
+    return int(width), int(height)
+
+
+def job_target_ids(format_ids: List[str], custom_resizes: Optional[List[Dict[str, int]]]) -> List[str]:
+    """A job's targets: its format ids, then one ``custom:WxH`` id per distinct custom size."""
+    custom = dict.fromkeys(custom_target_id(c["width"], c["height"]) for c in custom_resizes or [])
+    return list(format_ids) + list(custom)
+
+
+def completed_targets(
+    db: Session, job_id: uuid.UUID, target_ids: List[str], asset_id: Optional[uuid.UUID] = None
+) -> Dict[str, set]:
+    """Checkpoints of a job: ``{asset_id: {target ids with a stored output}}`` from its generated_assets rows.
+
+    A row without a format is a custom resize only when the job has that ``custom:WxH`` target;
+    otherwise its format was deleted since (``ON DELETE SET NULL``) and it checkpoints nothing.
+    """
+    query = db.query(GeneratedAsset.original_asset_id, GeneratedAsset.asset_format_id, GeneratedAsset.dimensions).filter(
+        GeneratedAsset.job_id == job_id
+    )
+    if asset_id is not None:
+        query = query.filter(GeneratedAsset.original_asset_id == asset_id)
+    targets = set(target_ids)
+    done: Dict[str, set] = {}
+    for original_id, format_id, dimensions in query:
+        target = str(format_id) if format_id else custom_target_id(dimensions["width"], dimensions["height"])
+        if target in targets:
+            done.setdefault(str(original_id), set()).add(target)
+    return done
+
+
+def job_spec(asset_ids: List[str], target_ids: List[str]) -> Dict[str, List[str]]:
+    return {"assetIds": list(asset_ids), "targetIds": list(target_ids)}
+
+
+def touch_heartbeat(db: Session, *job_ids: uuid.UUID) -> None:
+    """Record that the jobs' work is making progress (see ``reap_stale_jobs``)."""
+    db.query(GenerationJob).filter(GenerationJob.id.in_(job_ids)).update(
+        {GenerationJob.heartbeat_at: func.now()}, synchronize_session=False
+    )
+    db.commit()
+
+
+def project_assets(db: Session, project_id: uuid.UUID, user_id: uuid.UUID):
+    """Query of the assets of ``project_id``; none unless the project belongs to ``user_id``."""
+    return (
+        db.query(Asset)
+        .join(Project, Project.id == Asset.project_id)
+        .filter(Asset.project_id == project_id, Project.user_id == user_id)
+    )
+
+
+def estimate_job_outputs(
+    db: Session, project_id: uuid.UUID, user_id: uuid.UUID, asset_ids: List[str], format_ids: List[str]
+) -> int:
+    """Outputs a job will produce: its assets (all of the user's project's when none are given) x targets."""
+    if asset_ids:
+        return len(asset_ids) * len(format_ids)
+    if not format_ids:
+        return 0
+    count = project_assets(db, project_id, user_id).with_entities(func.count(Asset.id)).scalar() or 0
+    return count * len(format_ids)
+
+
+def job_progress_key(job_id: uuid.UUID) -> str:
+    return f"job-progress:{job_id}"
+
+
+def read_job_progress(job_id: uuid.UUID, store: Optional[StateStore] = None) -> Dict[str, str]:
+    """Fast-path job state (status, progress, user_id, ...); empty when the store has nothing for the job."""
+    try:
+        return (store or get_state_store()).hgetall(job_progress_key(job_id))
+    except Exception:
+        return {}
+
+
+class JobProgressTracker:
+    """Tracks job progress in the state store and writes it through to Postgres sparingly.
+
+    Every update lands in the store and is published to the job's event channel when the
+    status or progress changes; ``generation_jobs`` is only written when the status changes
+    or ``flush_seconds`` have passed since the last write by any worker. Once the job is
+    completed or failed, later updates (say, from a sibling unit of a failed job) are ignored.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        job_id: uuid.UUID,
+        store: Optional[StateStore] = None,
+        flush_seconds: Optional[float] = None,
+        broker: Optional[JobEventBroker] = None,
+    ):
+        self.db = db
+        self.job_id = job_id
+        self.store = store or get_state_store()
+        self.broker = broker
+        self.key = job_progress_key(job_id)
+        self.flush_seconds = settings.JOB_PROGRESS_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+
+    def register(self, job: GenerationJob) -> None:
+        """Seed the store from a freshly committed job so status reads never need Postgres."""
+        self.store.hset(
+            self.key,
+            {"user_id": job.user_id, "status": job.status.value, "progress": job.progress or 0, "flushed_at": time.time()},
+        )
+        self.store.expire(self.key, JOB_PROGRESS_TTL_SECONDS)
+
+    def start(self, total_outputs: int, done: int = 0) -> None:
+        self.store.hset(self.key, {"total": total_outputs, "done": done})
+        self.store.expire(self.key, JOB_PROGRESS_TTL_SECONDS)
+
+    def set_status(self, status: JobStatus, progress: int) -> None:
+        previous = self.store.hgetall(self.key)
+        if previous.get("status") in {s.value for s in TERMINAL_STATUSES}:
+            return
+        self.store.hset(self.key, {"status": status.value, "progress": progress})
+        self.store.expire(self.key, JOB_PROGRESS_TTL_SECONDS)
+
+        status_changed = previous.get("status") != status.value
+        if status_changed or previous.get("progress") != str(progress):
+            self._publish({"status": status.value, "progress": progress})
+
+        now = time.time()
+        due = now - float(previous.get("flushed_at", 0)) >= self.flush_seconds
+        if status_changed or due:
+            self.store.hset(self.key, {"flushed_at": now})
+            self.db.query(GenerationJob).filter(
+                GenerationJob.id == self.job_id, GenerationJob.status.notin_(TERMINAL_STATUSES)
+            ).update(
+                {GenerationJob.status: status, GenerationJob.progress: progress}, synchronize_session=False
+            )
+            self.db.commit()
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        # Best effort: subscribers that miss an event still see the next one (or poll /status).
+        try:
+            (self.broker or get_job_event_broker()).publish(self.job_id, event)
+        except Exception:
+            pass
+
+    def advance(self, outputs: int, total_outputs: int) -> int:
+        """Count finished outputs (from any subtask) and report the resulting progress."""
+        done = self.store.hincrby(self.key, "done", outputs)
+        progress = min(99, 10 + int(89 * done / max(1, total_outputs)))
+        self.set_status(JobStatus.processing, progress)
+        return progress
+
+
 def store_generated_asset(
     db: Session,
     job_id: uuid.UUID,
@@ -54,5 +230,85 @@ def store_generated_asset(
     return gen_asset
 
 
+class GeneratedAssetWriter:
+    """Buffers generated-asset rows and writes each batch as one multi-row INSERT.
+
+    Use as a context manager: whatever is buffered is flushed on exit, including when the
+    block raises, so finished outputs survive a failing task. ``on_flush`` receives the
+    number of rows written by each flush.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        batch_size: Optional[int] = None,
+        on_flush: Optional[Callable[[int], Any]] = None,
+    ):
+        self.db = db
+        self.batch_size = batch_size or settings.GENERATED_ASSET_BATCH_SIZE
+        self.on_flush = on_flush
+        self._rows: List[Dict[str, Any]] = []
+
+    def add(
+        self,
+        job_id: uuid.UUID,
+        original_asset_id: uuid.UUID,
+        asset_format_id: Optional[uuid.UUID],
+        storage_path: str,
+        file_type: str,
+        dimensions: dict,
+        is_nsfw: bool = False,
+        manual_edits: Optional[dict] = None,
+    ) -> uuid.UUID:
+        row_id = uuid.uuid4()
+        self._rows.append(
+            {
+                "id": row_id,
+                "job_id": job_id,
+                "original_asset_id": original_asset_id,
+                "asset_format_id": asset_format_id,
+                "storage_path": storage_path,
+                "file_type": file_type,
+                "dimensions": dimensions,
+                "is_nsfw": is_nsfw,
+                "manual_edits": manual_edits,
+            }
+        )
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+        return row_id
+
+    def flush(self) -> int:
+        if not self._rows:
+            return 0
+        rows, self._rows = self._rows, []
+        self.db.execute(insert(GeneratedAsset).values(rows))
+        self.db.commit()
+        if self.on_flush:
+            self.on_flush(len(rows))
+        return len(rows)
+
+    def __enter__(self) -> "GeneratedAssetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+            return
+        try:
+            self.flush()
+        except Exception:
+            self.db.rollback()  # keep the original error
+
+
 def get_generated_assets_by_job(db: Session, job_id: uuid.UUID) -> List[GeneratedAsset]:
     return db.query(GeneratedAsset).filter(GeneratedAsset.job_id == job_id).all()
+
+
+def generated_asset_rows(db: Session):
+    """``(GeneratedAsset, format name, platform name)`` rows, joined in one query; filter and order to taste."""
+    return (
+        db.query(GeneratedAsset, AssetFormat.name, RepurposingPlatform.name)
+        .outerjoin(AssetFormat, AssetFormat.id == GeneratedAsset.asset_format_id)
+        .outerjoin(RepurposingPlatform, RepurposingPlatform.id == AssetFormat.platform_id)
+    )
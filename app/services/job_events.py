@@ -0,0 +1,126 @@
+"""Pub/sub of generation job status changes, for pushing progress to clients.
+
+Workers publish through ``JobProgressTracker``; the API subscribes per job and streams the
+events out (``GET /generate/{jobId}/events``). Redis pub/sub in deployments; an in-process
+broker for single-node setups and tests (selected like the state store).
+"""
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.config import get_settings
+
+settings = get_settings()
+
+JobEvent = Dict[str, Any]
+
+
+def job_channel(job_id: Any) -> str:
+    return f"job-events:{job_id}"
+
+
+class Subscription(ABC):
+    @abstractmethod
+    async def next_event(self, timeout: float) -> Optional[JobEvent]:
+        """The next event, or None when ``timeout`` passes without one."""
+
+    @abstractmethod
+    async def close(self) -> None:
+        pass
+
+
+class JobEventBroker(ABC):
+    @abstractmethod
+    def publish(self, job_id: Any, event: JobEvent) -> None:
+        pass
+
+    @abstractmethod
+    async def subscribe(self, job_id: Any) -> Subscription:
+        pass
+
+
+class _QueueSubscription(Subscription):
+    def __init__(self, broker: "InMemoryJobEventBroker", channel: str):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[JobEvent]" = asyncio.Queue()
+
+    async def next_event(self, timeout: float) -> Optional[JobEvent]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        self.broker._unsubscribe(self)
+
+
+class InMemoryJobEventBroker(JobEventBroker):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[_QueueSubscription]] = {}
+
+    def publish(self, job_id: Any, event: JobEvent) -> None:
+        # Publishers may run on any thread (worker code, threadpool endpoints).
+        with self._lock:
+            subscribers: Tuple[_QueueSubscription, ...] = tuple(self._subscribers.get(job_channel(job_id), ()))
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub.queue.put_nowait, dict(event))
+            except RuntimeError:
+                pass  # subscriber's loop is gone
+
+    async def subscribe(self, job_id: Any) -> Subscription:
+        sub = _QueueSubscription(self, job_channel(job_id))
+        with self._lock:
+            self._subscribers.setdefault(sub.channel, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub: _QueueSubscription) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.channel]
+
+
+class _RedisSubscription(Subscription):
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def next_event(self, timeout: float) -> Optional[JobEvent]:
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return json.loads(message["data"]) if message else None
+
+    async def close(self) -> None:
+        await self.pubsub.unsubscribe()
+        await self.pubsub.close()
+
+
+class RedisJobEventBroker(JobEventBroker):
+    def __init__(self, url: str):
+        import redis
+        import redis.asyncio as aioredis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.async_client = aioredis.Redis.from_url(url, decode_responses=True)
+
+    def publish(self, job_id: Any, event: JobEvent) -> None:
+        self.client.publish(job_channel(job_id), json.dumps(event))
+
+    async def subscribe(self, job_id: Any) -> Subscription:
+        pubsub = self.async_client.pubsub()
+        await pubsub.subscribe(job_channel(job_id))
+        return _RedisSubscription(pubsub)
+
+
+@lru_cache
+def get_job_event_broker() -> JobEventBroker:
+    if settings.STATE_STORE_BACKEND == "redis":
+        return RedisJobEventBroker(settings.REDIS_URL)
+    return InMemoryJobEventBroker()
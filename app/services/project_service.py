@@ -1,10 +1,14 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from uuid import UUID
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from app.models.project import Project, ProjectStatus
 from app.models.asset import Asset
 from app.schemas.project import ProjectStatusResponse
+from app.utils.pagination import apply_keyset, split_page
+
+FILE_COUNT_TYPES = ("psd", "jpg", "png")
 
 
 def create_project(db: Session, user_id: UUID, name: str, assets: List[Asset]) -> Project:
@@ -30,6 +34,29 @@ def get_projects(db: Session, user_id: UUID, limit: int = 10, offset: int = 0) -
     )
 
 
+def get_projects_with_file_counts(
+    db: Session, user_id: UUID, limit: int = 10, offset: int = 0, cursor: Optional[str] = None
+) -> Tuple[List[Tuple[Project, Dict[str, int]]], Optional[str]]:
+    """Page of a user's projects plus per-type asset counts, in a single grouped query.
+
+    With a ``cursor`` the page is found by keyset on ``(created_at, id)`` and ``offset`` is ignored.
+    Returns the page and the cursor for the next one.
+    """
+    file_type = func.lower(Asset.file_type)
+    count_columns = [func.count(Asset.id).filter(file_type == ext).label(ext) for ext in FILE_COUNT_TYPES]
+    query = (
+        db.query(Project, *count_columns)
+        .outerjoin(Asset, Asset.project_id == Project.id)
+        .filter(Project.user_id == user_id)
+        .group_by(Project.id)
+    )
+    query = apply_keyset(query, Project.created_at, Project.id, cursor, descending=True)
+    if not cursor and offset:
+        query = query.offset(offset)
+    rows, next_cursor = split_page(query.limit(limit + 1).all(), limit, key=lambda row: (row[0].created_at, row[0].id))
+    return [(row[0], dict(zip(FILE_COUNT_TYPES, row[1:]))) for row in rows], next_cursor
+
+
 def get_project_status(db: Session, project_id: UUID) -> Optional[ProjectStatusResponse]:
     project = db.get(Project, project_id)
     if not project:
@@ -3,11 +3,49 @@ from typing import Optional
 
 from app.models.app_settings import AppSettings
 
+DEFAULT_ADAPTATION = {
+    "focalPointLogic": "face-centric",
+    "layoutGuidance": {
+        "safeZone": {"top": 0.05, "bottom": 0.05, "left": 0.05, "right": 0.05},
+        "logoSize": 0.1,
+    },
+}
+DEFAULT_AI_BEHAVIOR = {
+    "adaptationStrategy": "crop",
+    "imageQuality": "medium",
+    "localStrategies": ["crop", "extend-canvas", "add-background"],
+}
+DEFAULT_UPLOAD_MODERATION = {
+    "allowedImageTypes": ["jpeg", "png", "psd"],
+    "maxFileSizeMb": 20,
+    "nsfwAlertsActive": False,
+}
+DEFAULT_MANUAL_EDITING = {
+    "editingEnabled": True,
+    "croppingEnabled": True,
+    "saturationEnabled": True,
+    "addTextOrLogoEnabled": True,
+    "allowedLogoSources": {"types": ["jpeg", "png", "psd", "ai"], "maxSizeMb": 5},
+}
+
+RULE_DEFAULTS = {
+    "adaptation": DEFAULT_ADAPTATION,
+    "ai-behavior": DEFAULT_AI_BEHAVIOR,
+    "upload-moderation": DEFAULT_UPLOAD_MODERATION,
+    "manual-editing": DEFAULT_MANUAL_EDITING,
+}
+
 
 def get_rule(db: Session, rule_key: str) -> Optional[AppSettings]:
     return db.query(AppSettings).filter(AppSettings.rule_key == rule_key).first()
 
 
+def get_rule_value(db: Session, rule_key: str) -> dict:
+    """Stored value of an admin rule, or its default when it has never been set."""
+    rule = get_rule(db, rule_key)
+    return rule.rule_value if rule else RULE_DEFAULTS[rule_key]
+
+
 def set_rule(db: Session, rule_key: str, rule_value: dict, description: Optional[str] = None) -> AppSettings:
     rule = db.query(AppSettings).filter(AppSettings.rule_key == rule_key).first()
     if rule:
@@ -0,0 +1,216 @@
+"""Fair-share dispatch of generation work across users.
+
+Planned work units wait in per-user sub-queues in the state store instead of going straight
+to Celery. ``dispatch`` hands them to the workers in weighted round-robin order across the
+users with queued work, and never lets one user have more than their share of units in
+flight. A bulk submission therefore only lengthens its own user's queue.
+
+Each dispatched unit holds a lease on one of its user's slots, also recorded against its
+job, renewed by the worker while it runs (or is parked); a lease not renewed within
+``FAIR_SHARE_LEASE_SECONDS`` belonged to a worker that vanished and its slot is given back.
+Only a unit whose lease is still held counts towards finishing its job, so a unit that
+reports twice (a redelivered task) or after its job was resumed is ignored. A job's counters
+live until its last unit has finished, failed or been dropped.
+"""
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import get_settings
+from app.services.state_store import StateStore, get_state_store
+
+settings = get_settings()
+
+USERS_KEY = "fair-share:users"
+# Users that had units in flight; kept for ``queue_depths`` (USERS_KEY only has queued work).
+ACTIVE_KEY = "fair-share:active"
+ROUND_ROBIN_KEY = "fair-share:rr"
+
+WorkUnit = Dict[str, Any]
+
+
+def _queue_key(user_id: str) -> str:
+    return f"fair-share:queue:{user_id}"
+
+
+def _leases_key(user_id: str) -> str:
+    # Sorted set of the user's lease ids, scored by the time each runs out.
+    return f"fair-share:leases:{user_id}"
+
+
+def _job_key(job_id: str) -> str:
+    return f"fair-share:job:{job_id}"
+
+
+def _job_leases_key(job_id: str) -> str:
+    # The leases of the job's dispatched, unfinished units.
+    return f"fair-share:job-leases:{job_id}"
+
+
+class FairShareScheduler:
+    def __init__(self, store: Optional[StateStore] = None, clock: Callable[[], float] = time.time):
+        self.store = store or get_state_store()
+        self.clock = clock
+
+    def weight(self, user_id: str) -> int:
+        return max(1, int(settings.FAIR_SHARE_WEIGHTS.get(user_id, 1)))
+
+    def max_in_flight(self, user_id: str) -> int:
+        return settings.FAIR_SHARE_MAX_IN_FLIGHT_PER_USER * self.weight(user_id)
+
+    # --- producers ---
+
+    def enqueue_job(self, user_id: str, job_id: str, units: List[WorkUnit]) -> None:
+        """Queue a job's units behind the user's earlier work.
+
+        Only for a job with no outstanding units (see ``outstanding_units``): a resumed job
+        starts over with only its unfinished units.
+        """
+        self.store.delete(_job_key(job_id))
+        self.store.delete(_job_leases_key(job_id))
+        if not units:
+            return
+        self.store.hset(_job_key(job_id), {"remaining": len(units), "queued": len(units), "user_id": user_id})
+        self.store.rpush(_queue_key(user_id), *(json.dumps({**u, "user_id": user_id, "job_id": job_id}) for u in units))
+        self.store.sadd(USERS_KEY, user_id)
+
+    # --- dispatcher ---
+
+    def dispatch(self, send: Callable[[WorkUnit], None]) -> int:
+        """Send queued units until every user is empty or at their cap; returns how many were sent.
+
+        Safe to call from any number of processes at once: slots are reserved before a unit
+        is popped, so the per-user cap holds without a global lock.
+        """
+        sent = 0
+        while True:
+            users = sorted(self.store.smembers(USERS_KEY))
+            if not users:
+                return sent
+            start = self.store.hincrby(ROUND_ROBIN_KEY, "cursor", 1) % len(users)
+            progressed = False
+            for user_id in users[start:] + users[:start]:
+                for _ in range(self.weight(user_id)):
+                    unit = self._take(user_id)
+                    if unit is None:
+                        break
+                    send(unit)
+                    sent += 1
+                    progressed = True
+            if not progressed:
+                return sent
+
+    def _take(self, user_id: str) -> Optional[WorkUnit]:
+        while True:
+            lease = self._reserve(user_id)
+            if lease is None:
+                return None
+            raw = self.store.lpop(_queue_key(user_id))
+            if raw is None:
+                self._release(user_id, lease)
+                self.store.srem(USERS_KEY, user_id)
+                if self.store.llen(_queue_key(user_id)):
+                    self.store.sadd(USERS_KEY, user_id)  # lost a race with a concurrent enqueue
+                return None
+            unit = {**json.loads(raw), "lease": lease}
+            job = _job_key(unit["job_id"])
+            self.store.hincrby(job, "queued", -1)
+            if self.store.hgetall(job).get("failed"):
+                self._release(user_id, lease)  # the job already failed; drop its remaining units
+                self._finish(unit["job_id"])
+                continue
+            self.store.zadd(_job_leases_key(unit["job_id"]), {lease: self.clock() + settings.FAIR_SHARE_LEASE_SECONDS})
+            self.store.sadd(ACTIVE_KEY, user_id)
+            return unit
+
+    def _reserve(self, user_id: str) -> Optional[str]:
+        """A lease on one of the user's slots, or None when they are all taken."""
+        key = _leases_key(user_id)
+        now = self.clock()
+        self.store.zremrangebyscore(key, float("-inf"), now)
+        lease = uuid.uuid4().hex
+        self.store.zadd(key, {lease: now + settings.FAIR_SHARE_LEASE_SECONDS})
+        if self.store.zcard(key) <= self.max_in_flight(user_id):
+            return lease
+        self.store.zrem(key, lease)
+        return None
+
+    def _release(self, user_id: str, lease: Optional[str]) -> None:
+        if lease:
+            self.store.zrem(_leases_key(user_id), lease)
+
+    def _finish(self, job_id: str) -> bool:
+        """Count one of the job's units as done; True when none are left (its counters are then dropped)."""
+        job = _job_key(job_id)
+        if self.store.hincrby(job, "remaining", -1) > 0:
+            return False
+        self.store.delete(job)
+        self.store.delete(_job_leases_key(job_id))
+        return True
+
+    def _settle(self, unit: WorkUnit) -> bool:
+        """Give back the unit's slot; True when it still held its lease on the job."""
+        lease = unit.get("lease")
+        if not lease:
+            return True
+        self._release(unit["user_id"], lease)
+        return self.store.zrem(_job_leases_key(unit["job_id"]), lease) > 0
+
+    # --- completion ---
+
+    def renew(self, unit: WorkUnit) -> None:
+        """Extend the unit's lease (if it still holds one); workers call this when they start or park it."""
+        if unit.get("lease"):
+            deadline = self.clock() + settings.FAIR_SHARE_LEASE_SECONDS
+            self.store.zadd(_leases_key(unit["user_id"]), {unit["lease"]: deadline}, xx=True)
+            self.store.zadd(_job_leases_key(unit["job_id"]), {unit["lease"]: deadline}, xx=True)
+
+    def complete(self, unit: WorkUnit) -> Optional[bool]:
+        """Free the unit's slot; True when it was the job's last outstanding unit, None when it
+        no longer held its lease (it was given up for lost and does not count)."""
+        if not self._settle(unit):
+            return None
+        failed = bool(self.store.hgetall(_job_key(unit["job_id"])).get("failed"))
+        return self._finish(unit["job_id"]) and not failed
+
+    def fail(self, unit: WorkUnit) -> None:
+        """Free the unit's slot and stop dispatching the rest of its job."""
+        if not self._settle(unit):
+            return
+        self.store.hset(_job_key(unit["job_id"]), {"failed": 1})
+        self._finish(unit["job_id"])
+
+    def outstanding_units(self, job_id: str) -> int:
+        """Units of the job waiting for a slot or running under a live lease: while there are any,
+        the job is queued or in progress, not stalled."""
+        leases = _job_leases_key(job_id)
+        self.store.zremrangebyscore(leases, float("-inf"), self.clock())
+        queued = max(0, int(self.store.hgetall(_job_key(job_id)).get("queued", 0)))
+        return queued + self.store.zcard(leases)
+
+    # --- operators ---
+
+    def queue_depths(self) -> List[Dict[str, Any]]:
+        """Queued and in-flight units of every user with work in either state."""
+        depths = []
+        queued_users = self.store.smembers(USERS_KEY)
+        for user_id in sorted(queued_users | self.store.smembers(ACTIVE_KEY)):
+            self.store.zremrangebyscore(_leases_key(user_id), float("-inf"), self.clock())
+            in_flight = self.store.zcard(_leases_key(user_id))
+            if not in_flight:
+                self.store.srem(ACTIVE_KEY, user_id)
+                if self.store.zcard(_leases_key(user_id)):
+                    self.store.sadd(ACTIVE_KEY, user_id)  # lost a race with a concurrent dispatch
+                if user_id not in queued_users:
+                    continue
+            depths.append(
+                {
+                    "userId": user_id,
+                    "queued": self.store.llen(_queue_key(user_id)),
+                    "inFlight": in_flight,
+                    "maxInFlight": self.max_in_flight(user_id),
+                    "weight": self.weight(user_id),
+                }
+            )
+        return depths
@@ -0,0 +1,274 @@
+"""Small key/value store for fast-changing shared state (job progress and the like).
+
+Redis in deployments; an in-process stand-in for tests and single-node setups.
+Values are strings, as Redis returns them with ``decode_responses=True``.
+"""
+import threading
+import time
+from collections import deque
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Deque, Dict, Mapping, Optional, Set, Tuple
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class StateStore(ABC):
+    @abstractmethod
+    def hgetall(self, key: str) -> Dict[str, str]:
+        pass
+
+    @abstractmethod
+    def hset(self, key: str, mapping: Mapping[str, object]) -> None:
+        pass
+
+    @abstractmethod
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        pass
+
+    @abstractmethod
+    def expire(self, key: str, seconds: int) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def rpush(self, key: str, *values: str) -> int:
+        pass
+
+    @abstractmethod
+    def lpop(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def llen(self, key: str) -> int:
+        pass
+
+    @abstractmethod
+    def sadd(self, key: str, *members: str) -> None:
+        pass
+
+    @abstractmethod
+    def srem(self, key: str, *members: str) -> None:
+        pass
+
+    @abstractmethod
+    def smembers(self, key: str) -> Set[str]:
+        pass
+
+    @abstractmethod
+    def zadd(self, key: str, mapping: Mapping[str, float], xx: bool = False) -> None:
+        """Set members' scores; with ``xx`` only members already in the set are updated."""
+
+    @abstractmethod
+    def zrem(self, key: str, *members: str) -> int:
+        pass
+
+    @abstractmethod
+    def zremrangebyscore(self, key: str, min_score: float, max_score: float) -> int:
+        pass
+
+    @abstractmethod
+    def zcard(self, key: str) -> int:
+        pass
+
+    @abstractmethod
+    def take_token(self, key: str, rate: float, capacity: float, now: float, ttl: int) -> float:
+        """Atomically take one token from a bucket refilled at ``rate``/s up to ``capacity``.
+
+        Returns 0 when a token was taken, otherwise the seconds until one will be available
+        (nothing is taken in that case).
+        """
+
+
+# Same arithmetic as InMemoryStateStore.take_token, run server-side so concurrent workers cannot race.
+_TAKE_TOKEN_LUA = """
+local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or capacity)
+local ts = tonumber(redis.call('HGET', KEYS[1], 'ts') or now)
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return tostring(wait)
+"""
+
+
+class RedisStateStore(StateStore):
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._take_token = self.client.register_script(_TAKE_TOKEN_LUA)
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        return self.client.hgetall(key)
+
+    def hset(self, key: str, mapping: Mapping[str, object]) -> None:
+        self.client.hset(key, mapping={k: str(v) for k, v in mapping.items()})
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        return int(self.client.hincrby(key, field, amount))
+
+    def expire(self, key: str, seconds: int) -> None:
+        self.client.expire(key, seconds)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+    def rpush(self, key: str, *values: str) -> int:
+        return int(self.client.rpush(key, *values))
+
+    def lpop(self, key: str) -> Optional[str]:
+        return self.client.lpop(key)
+
+    def llen(self, key: str) -> int:
+        return int(self.client.llen(key))
+
+    def sadd(self, key: str, *members: str) -> None:
+        self.client.sadd(key, *members)
+
+    def srem(self, key: str, *members: str) -> None:
+        self.client.srem(key, *members)
+
+    def smembers(self, key: str) -> Set[str]:
+        return set(self.client.smembers(key))
+
+    def zadd(self, key: str, mapping: Mapping[str, float], xx: bool = False) -> None:
+        self.client.zadd(key, dict(mapping), xx=xx)
+
+    def zrem(self, key: str, *members: str) -> int:
+        return int(self.client.zrem(key, *members))
+
+    def zremrangebyscore(self, key: str, min_score: float, max_score: float) -> int:
+        return int(self.client.zremrangebyscore(key, min_score, max_score))
+
+    def zcard(self, key: str) -> int:
+        return int(self.client.zcard(key))
+
+    def take_token(self, key: str, rate: float, capacity: float, now: float, ttl: int) -> float:
+        return float(self._take_token(keys=[key], args=[rate, capacity, now, ttl]))
+
+
+class InMemoryStateStore(StateStore):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._data: Dict[str, Tuple[Dict[str, str], Optional[float]]] = {}
+        # Lists and (sorted) sets do not expire (same as Redis unless ``expire`` is called on them, which we never do).
+        self._lists: Dict[str, Deque[str]] = {}
+        self._sets: Dict[str, Set[str]] = {}
+        self._zsets: Dict[str, Dict[str, float]] = {}
+
+    def _hash(self, key: str) -> Dict[str, str]:
+        # Caller holds the lock. Drops the entry once its TTL has passed.
+        value, expires_at = self._data.get(key, ({}, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            value, expires_at = {}, None
+        self._data[key] = (value, expires_at)
+        return value
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._hash(key))
+
+    def hset(self, key: str, mapping: Mapping[str, object]) -> None:
+        with self._lock:
+            self._hash(key).update({k: str(v) for k, v in mapping.items()})
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        with self._lock:
+            value = self._hash(key)
+            value[field] = str(int(value.get(field, 0)) + amount)
+            return int(value[field])
+
+    def expire(self, key: str, seconds: int) -> None:
+        with self._lock:
+            self._data[key] = (self._hash(key), time.monotonic() + seconds)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._lists.pop(key, None)
+            self._sets.pop(key, None)
+            self._zsets.pop(key, None)
+
+    def rpush(self, key: str, *values: str) -> int:
+        with self._lock:
+            items = self._lists.setdefault(key, deque())
+            items.extend(values)
+            return len(items)
+
+    def lpop(self, key: str) -> Optional[str]:
+        with self._lock:
+            items = self._lists.get(key)
+            if not items:
+                return None
+            value = items.popleft()
+            if not items:
+                del self._lists[key]
+            return value
+
+    def llen(self, key: str) -> int:
+        with self._lock:
+            return len(self._lists.get(key, ()))
+
+    def sadd(self, key: str, *members: str) -> None:
+        with self._lock:
+            self._sets.setdefault(key, set()).update(members)
+
+    def srem(self, key: str, *members: str) -> None:
+        with self._lock:
+            self._sets.get(key, set()).difference_update(members)
+
+    def smembers(self, key: str) -> Set[str]:
+        with self._lock:
+            return set(self._sets.get(key, ()))
+
+    def zadd(self, key: str, mapping: Mapping[str, float], xx: bool = False) -> None:
+        with self._lock:
+            zset = self._zsets.setdefault(key, {})
+            zset.update({m: float(score) for m, score in mapping.items() if not xx or m in zset})
+
+    def zrem(self, key: str, *members: str) -> int:
+        with self._lock:
+            zset = self._zsets.get(key, {})
+            return sum(zset.pop(member, None) is not None for member in members)
+
+    def zremrangebyscore(self, key: str, min_score: float, max_score: float) -> int:
+        with self._lock:
+            zset = self._zsets.get(key, {})
+            removed = [m for m, score in zset.items() if min_score <= score <= max_score]
+            for member in removed:
+                del zset[member]
+            return len(removed)
+
+    def zcard(self, key: str) -> int:
+        with self._lock:
+            return len(self._zsets.get(key, ()))
+
+    def take_token(self, key: str, rate: float, capacity: float, now: float, ttl: int) -> float:
+        with self._lock:
+            bucket = self._hash(key)
+            tokens = float(bucket.get("tokens", capacity))
+            last = float(bucket.get("ts", now))
+            tokens = min(capacity, tokens + max(0.0, now - last) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            bucket.update({"tokens": str(tokens), "ts": str(now)})
+            self._data[key] = (bucket, time.monotonic() + ttl)
+            return wait
+
+
+@lru_cache
+def get_state_store() -> StateStore:
+    if settings.STATE_STORE_BACKEND == "redis":
+        return RedisStateStore(settings.REDIS_URL)
+    return InMemoryStateStore()
@@ -0,0 +1,121 @@
+"""Local (NumPy) implementations of the non-crop adaptation strategies.
+
+Both strategies keep the whole source visible: it is scaled to fit inside the target and the
+leftover area is filled, either by extending the image outwards (``extend-canvas``) or by
+placing it on a generated backdrop (``add-background``).
+"""
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from app.utils.image_utils import ImagePyramid
+
+LOCAL_STRATEGIES = ("crop", "extend-canvas", "add-background")
+
+# Borders whose colors vary less than this (0-255 scale, per-channel std) get a flat fill.
+UNIFORM_BORDER_STD = 12.0
+
+
+def fit_inside(source_size: Tuple[int, int], width: int, height: int) -> Tuple[int, int, int, int]:
+    """(content_width, content_height, left, top) of the source scaled to fit and centered in the target."""
+    scale = min(width / source_size[0], height / source_size[1])
+    cw = min(width, max(1, round(source_size[0] * scale)))
+    ch = min(height, max(1, round(source_size[1] * scale)))
+    return cw, ch, (width - cw) // 2, (height - ch) // 2
+
+
+def _pad_widths(cw: int, ch: int, left: int, top: int, width: int, height: int):
+    return ((top, height - ch - top), (left, width - cw - left), (0, 0))
+
+
+def _border_pixels(arr: np.ndarray) -> np.ndarray:
+    return np.concatenate([arr[0], arr[-1], arr[:, 0], arr[:, -1]]).reshape(-1, arr.shape[2])
+
+
+def dominant_color(arr: np.ndarray) -> np.ndarray:
+    """Most common color of an (N, C) pixel array, quantized to 16 levels per channel."""
+    bins = (arr[:, :3] // 16).astype(np.int64)
+    codes = (bins[:, 0] << 8) | (bins[:, 1] << 4) | bins[:, 2]
+    top = np.bincount(codes, minlength=4096).argmax()
+    members = arr[codes == top]
+    return members.mean(axis=0).round().astype(np.uint8)
+
+
+def extend_canvas(content: Image.Image, width: int, height: int) -> Image.Image:
+    """Grow ``content`` to the target by mirroring its edges outwards.
+
+    Next to the source the padding is a mirror image, so texture continues across the seam;
+    further out it blends into blurred edge-replicated pixels, so a wide pad never repeats
+    the subject itself.
+    """
+    cw, ch, left, top = fit_inside(content.size, width, height)
+    if (cw, ch) == (width, height):
+        return content.resize((width, height), Image.LANCZOS)
+    arr = np.asarray(content.resize((cw, ch), Image.LANCZOS))
+    pad = _pad_widths(cw, ch, left, top, width, height)
+    mirrored = np.pad(arr, pad, mode="symmetric")
+
+    side = max(width - cw - left, height - ch - top)  # widest single pad
+    radius = max(2.0, side / 8)
+    stretched = Image.fromarray(np.pad(arr, pad, mode="edge")).filter(ImageFilter.GaussianBlur(radius))
+    stretched = np.asarray(stretched, dtype=np.float32)
+
+    # Distance (in pixels) from each output pixel to the content rectangle.
+    ys, xs = np.ogrid[0:height, 0:width]
+    dx = np.maximum(np.maximum(left - xs, xs - (left + cw - 1)), 0)
+    dy = np.maximum(np.maximum(top - ys, ys - (top + ch - 1)), 0)
+    band = max(1, side // 2)
+    alpha = np.clip(np.hypot(dx, dy) / band, 0.0, 1.0)[..., None]
+
+    out = mirrored.astype(np.float32) * (1.0 - alpha) + stretched * alpha
+    return Image.fromarray(out.round().astype(np.uint8))
+
+
+def add_background(content: Image.Image, width: int, height: int, fill: str = "auto") -> Image.Image:
+    """Center ``content`` on a backdrop of the target size.
+
+    ``fill`` is ``"color"`` (the dominant border color), ``"blur"`` (a darkened, heavily
+    blurred cover-scaled copy of the source) or ``"auto"``, which picks the flat color when
+    the source's borders are close to uniform and the blur otherwise.
+    """
+    cw, ch, left, top = fit_inside(content.size, width, height)
+    fitted = content.resize((cw, ch), Image.LANCZOS)
+    if (cw, ch) == (width, height):
+        return fitted
+
+    border = _border_pixels(np.asarray(fitted))
+    if fill == "auto":
+        fill = "color" if border[:, :3].std(axis=0).max() <= UNIFORM_BORDER_STD else "blur"
+
+    if fill == "color":
+        background = Image.new(content.mode, (width, height), tuple(int(v) for v in dominant_color(border)))
+    else:
+        scale = max(width / cw, height / ch)
+        cover = fitted.resize((max(width, round(cw * scale)), max(height, round(ch * scale))), Image.BILINEAR)
+        cl, ct = (cover.width - width) // 2, (cover.height - height) // 2
+        cover = cover.crop((cl, ct, cl + width, ct + height)).filter(ImageFilter.GaussianBlur(max(width, height) / 30))
+        arr = np.asarray(cover, dtype=np.float32)
+        arr[..., :3] *= 0.8
+        background = Image.fromarray(arr.round().astype(np.uint8))
+
+    if content.mode == "RGBA":
+        background.alpha_composite(fitted, (left, top))
+    else:
+        background.paste(fitted, (left, top))
+    return background
+
+
+def render_adapted(pyramid: ImagePyramid, target: Dict[str, Any]) -> Image.Image:
+    """Render one target from the pyramid according to its ``"strategy"`` (``crop`` by default)."""
+    strategy = target.get("strategy", "crop")
+    width, height = target["width"], target["height"]
+    if strategy == "crop":
+        return pyramid.render(width, height, target.get("box"))
+    # Resample once to roughly the fitted size; the fill helpers only touch a target-sized image.
+    cw, ch, _, _ = fit_inside(pyramid.source_size, width, height)
+    content = pyramid.render(cw, ch)
+    adapt: Callable[[Image.Image, int, int], Image.Image] = (
+        extend_canvas if strategy == "extend-canvas" else add_background
+    )
+    return adapt(content, width, height)
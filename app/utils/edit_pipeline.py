@@ -0,0 +1,164 @@
+"""Manual edits of a generated asset as an ordered chain of operations.
+
+``manual_edits`` is a dict with any of::
+
+    {"crop": {"x", "y", "width", "height"},            # pixels of the generated asset
+     "saturation": 1.2,                                # 1.0 leaves colors unchanged
+     "logo": {"path", "x", "y", "width"},              # logo scaled to ``width``, pasted at x/y
+     "text": {"content", "x", "y", "size", "color"}}
+
+Operations always run in ``EDIT_OPERATIONS`` order, whatever the dict order. ``EditPipeline``
+keeps the image after every prefix of the chain, so re-rendering after a change to one step
+starts from the cached result of the steps before it: a new text color only redraws the text.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+
+EDIT_OPERATIONS = ("crop", "saturation", "logo", "text")
+
+DEFAULT_TEXT_SIZE = 32
+# Params given in source pixels, per operation; rescaled when rendering on a proxy.
+_PIXEL_FIELDS = {"crop": ("x", "y", "width", "height"), "logo": ("x", "y", "width"), "text": ("x", "y", "size")}
+
+EditStep = Tuple[str, Any]
+
+
+def edit_steps(edits: Optional[Dict[str, Any]]) -> List[EditStep]:
+    """The edits as ``(operation, params)`` steps in pipeline order; unknown keys are ignored."""
+    edits = edits or {}
+    return [(op, edits[op]) for op in EDIT_OPERATIONS if edits.get(op) is not None]
+
+
+def scale_steps(steps: Sequence[EditStep], factor: float) -> List[EditStep]:
+    """Steps for an image ``factor`` times the size of the one they were made on."""
+    if factor == 1.0:
+        return list(steps)
+    scaled = []
+    for op, params in steps:
+        if op in _PIXEL_FIELDS and isinstance(params, dict):
+            params = dict(params)
+            if op == "text":
+                params.setdefault("size", DEFAULT_TEXT_SIZE)
+            for field in _PIXEL_FIELDS[op]:
+                if field in params:
+                    params[field] = max(1 if field in ("width", "height", "size") else 0, round(float(params[field]) * factor))
+        scaled.append((op, params))
+    return scaled
+
+
+def _crop(img: Image.Image, params: Dict[str, Any]) -> Image.Image:
+    left = max(0, int(params.get("x", 0)))
+    top = max(0, int(params.get("y", 0)))
+    right = min(img.width, left + int(params.get("width", img.width)))
+    bottom = min(img.height, top + int(params.get("height", img.height)))
+    if right <= left or bottom <= top:
+        raise ValueError("Crop is outside the image")
+    return img.crop((left, top, right, bottom))
+
+
+def _saturation(img: Image.Image, factor: Any) -> Image.Image:
+    factor = float(factor)
+    if factor == 1.0:
+        return img
+    if img.mode == "RGBA":
+        rgb = ImageEnhance.Color(img.convert("RGB")).enhance(factor)
+        rgb.putalpha(img.getchannel("A"))
+        return rgb
+    return ImageEnhance.Color(img).enhance(factor)
+
+
+def _logo(img: Image.Image, params: Dict[str, Any]) -> Image.Image:
+    with Image.open(params["path"]) as logo:
+        logo = logo.convert("RGBA")
+    width = max(1, int(params.get("width", logo.width)))
+    logo = logo.resize((width, max(1, round(logo.height * width / logo.width))), Image.LANCZOS)
+    out = img.convert("RGBA") if img.mode != "RGBA" else img.copy()
+    out.alpha_composite(logo, (int(params.get("x", 0)), int(params.get("y", 0))))
+    return out if img.mode == "RGBA" else out.convert(img.mode)
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has a single bitmap size
+        return ImageFont.load_default()
+
+
+def _text(img: Image.Image, params: Dict[str, Any]) -> Image.Image:
+    out = img.copy()
+    ImageDraw.Draw(out).text(
+        (int(params.get("x", 0)), int(params.get("y", 0))),
+        str(params.get("content", "")),
+        fill=params.get("color", "#ffffff"),
+        font=_font(int(params.get("size", DEFAULT_TEXT_SIZE))),
+    )
+    return out
+
+
+_APPLY: Dict[str, Callable[[Image.Image, Any], Image.Image]] = {
+    "crop": _crop,
+    "saturation": _saturation,
+    "logo": _logo,
+    "text": _text,
+}
+
+
+def apply_step(img: Image.Image, step: EditStep) -> Image.Image:
+    """Apply one step; never modifies ``img`` in place (cached images are shared)."""
+    op, params = step
+    return _APPLY[op](img, params)
+
+
+def apply_edits(img: Image.Image, steps: Sequence[EditStep]) -> Image.Image:
+    for step in steps:
+        img = apply_step(img, step)
+    return img
+
+
+def _nbytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class EditPipeline:
+    """Renders edit chains, caching the image after each step prefix (LRU, bounded in bytes)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple, Image.Image]" = OrderedDict()
+        self._bytes = 0
+
+    def render(self, source_key: Hashable, load: Callable[[], Image.Image], steps: Sequence[EditStep]) -> Image.Image:
+        """The source (from ``load``, only called on a cold cache) with ``steps`` applied."""
+        keys = [(source_key, json.dumps(list(steps[:i]), sort_keys=True, default=str)) for i in range(len(steps) + 1)]
+        start, img = 0, None
+        with self._lock:
+            for i in range(len(keys) - 1, -1, -1):
+                if keys[i] in self._cache:
+                    self._cache.move_to_end(keys[i])
+                    start, img = i, self._cache[keys[i]]
+                    break
+        if img is None:
+            img = load()
+            self._put(keys[0], img)
+        for i in range(start, len(steps)):
+            img = apply_step(img, steps[i])
+            self._put(keys[i + 1], img)
+        return img
+
+    def _put(self, key: Tuple, img: Image.Image) -> None:
+        size = _nbytes(img)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._cache:
+                self._bytes -= _nbytes(self._cache.pop(key))
+            self._cache[key] = img
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= _nbytes(evicted)
@@ -1,7 +1,12 @@
+import hashlib
 import os
 import shutil
+import uuid
+from typing import Any, Dict, Tuple
 from uuid import UUID
 
+from starlette.concurrency import run_in_threadpool
+
 UPLOAD_DIR = "/data/uploads"
 GENERATED_DIR = "/data/generated"
 
@@ -9,6 +14,15 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(GENERATED_DIR, exist_ok=True)
 
 
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured per-file size limit."""
+
+    def __init__(self, filename: str, max_bytes: int):
+        super().__init__(f"{filename} exceeds {max_bytes} bytes")
+        self.filename = filename
+        self.max_bytes = max_bytes
+
+
 def save_upload_file(file_obj, filename: str) -> str:
     file_path = os.path.join(UPLOAD_DIR, filename)
     with open(file_path, "wb") as buffer:
@@ -16,5 +30,74 @@ def save_upload_file(file_obj, filename: str) -> str:
     return file_path
 
 
+def blob_path(sha256: str) -> str:
+    """Sharded location of a content-addressed upload: ``<uploads>/blobs/ab/cd/abcd...``."""
+    return os.path.join(UPLOAD_DIR, "blobs", sha256[:2], sha256[2:4], sha256)
+
+
+def commit_blob(tmp_path: str, sha256: str) -> Tuple[str, bool]:
+    """Move a fully written temp file into the blob store.
+
+    Returns ``(path, created)``; when identical bytes are already stored the temp
+    file is discarded and ``created`` is False.
+    """
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        return path, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    return path, True
+
+
+def delete_blob(sha256: str) -> None:
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def discard_staged(tmp_path: str) -> None:
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+async def stream_upload_file(upload, filename: str, max_bytes: int, chunk_size: int = 1024 * 1024) -> Dict[str, Any]:
+    """Stage an UploadFile for the blob store chunk by chunk, hashing as the bytes go by.
+
+    At most one chunk is held in memory. The data lands in a temporary ``.part``
+    file (``tmp_path``); ``path`` is where it will live once the caller has saved the
+    rows that reference it and passes it to ``commit_blob``, or ``discard_staged``
+    if that fails. Until then nothing is visible in the store.
+
+    The form has already been parsed (and spooled) by then, so ``max_bytes`` only keeps an
+    oversized file out of the store; the request as a whole is capped while it is received
+    (see ``RequestSizeLimitMiddleware``).
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLargeError(filename, max_bytes)
+
+    tmp_dir = os.path.join(UPLOAD_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(filename, max_bytes)
+                digest.update(chunk)
+                await run_in_threadpool(buffer.write, chunk)
+    except BaseException:
+        discard_staged(tmp_path)
+        raise
+    sha256 = digest.hexdigest()
+    return {"tmp_path": tmp_path, "path": blob_path(sha256), "size": size, "sha256": sha256}
+
+
 def get_generated_file_path(asset_id: UUID, format_id: UUID) -> str:
     return os.path.join(GENERATED_DIR, f"{asset_id}_{format_id}.png")
@@ -1,13 +1,211 @@
-from typing import Dict
+import asyncio
+import io
+import math
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
 from PIL import Image
 
+from app.config import get_settings
+from app.utils.edit_pipeline import apply_edits, edit_steps
+
+settings = get_settings()
+
+# Bounded pool for header probing so a large batch cannot starve the event loop's default executor.
+_probe_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_PROBE_WORKERS, thread_name_prefix="image-probe")
+# Encoders release the GIL, so the outputs of one render pass are written in parallel.
+_encode_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_ENCODE_WORKERS, thread_name_prefix="image-encode")
+
 
 def get_image_dimensions(file_path: str) -> Dict[str, int]:
     with Image.open(file_path) as img:
         return {"width": img.width, "height": img.height}
 
 
-def resize_image(file_path: str, target_path: str, width: int, height: int) -> None:
+def _psd_layer_count(img: Image.Image) -> Optional[int]:
+    # The layer info block starts with a signed 16-bit layer count; read just that
+    # instead of letting PIL parse every layer record and its channel data.
+    position = getattr(img, "_layers_position", None)
+    if position is None:
+        return 0
+    img.fp.seek(position)
+    (count,) = struct.unpack(">h", img.fp.read(2))
+    return abs(count)
+
+
+def probe_image(file_path: str) -> Dict[str, Any]:
+    """Read width, height, DPI, color mode and PSD layer count from the file header only."""
+    with Image.open(file_path) as img:
+        dpi = img.info.get("dpi")
+        return {
+            "width": img.width,
+            "height": img.height,
+            "dpi": int(round(dpi[0])) if dpi else None,
+            "mode": img.mode,
+            "layers": _psd_layer_count(img) if img.format == "PSD" else None,
+        }
+
+
+def _probe_or_empty(file_path: str) -> Dict[str, Any]:
+    try:
+        return probe_image(file_path)
+    except Exception:
+        return {}
+
+
+async def probe_images(file_paths: List[str]) -> List[Dict[str, Any]]:
+    """Probe a batch concurrently in the probe pool; unreadable files yield ``{}``.
+
+    Identical paths (deduplicated uploads) are only opened once.
+    """
+    loop = asyncio.get_running_loop()
+    unique = list(dict.fromkeys(file_paths))
+    results = await asyncio.gather(*(loop.run_in_executor(_probe_executor, _probe_or_empty, p) for p in unique))
+    by_path = dict(zip(unique, results))
+    return [by_path[p] for p in file_paths]
+
+
+Box = Tuple[float, float, float, float]
+
+
+def _target_scale(target: Dict[str, Any], box: Box) -> float:
+    # How much of the source resolution a target needs (< 1 means downscaling).
+    return max(target["width"] / max(1.0, box[2] - box[0]), target["height"] / max(1.0, box[3] - box[1]))
+
+
+def _normalize_mode(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGB", "RGBA"):
+        return img
+    has_alpha = img.mode in ("LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    return img.convert("RGBA" if has_alpha else "RGB")
+
+
+def load_image(file_path: str) -> Image.Image:
+    """Fully decode ``file_path`` as RGB or RGBA."""
+    with Image.open(file_path) as img:
+        img = _normalize_mode(img)
+        img.load()
+    return img
+
+
+class ImagePyramid:
+    """A decoded source plus lazily built half-resolution levels.
+
+    Each target is resampled from the smallest level that still has enough pixels, so the
+    expensive filter always works on less than 2x the output size.
+    """
+
+    def __init__(self, base: Image.Image, source_size: Tuple[int, int]):
+        self.levels = [base]
+        self.source_size = source_size
+        # Maps boxes given in original-source pixels onto the (possibly draft-reduced) base.
+        self.base_factor = base.width / source_size[0]
+
+    def level(self, index: int) -> Image.Image:
+        while len(self.levels) <= index:
+            prev = self.levels[-1]
+            if min(prev.size) < 2:
+                return prev
+            self.levels.append(prev.reduce(2))
+        return self.levels[index]
+
+    def smallest_level_at_least(self, long_edge: int) -> Image.Image:
+        """Cheapest level that still has ``long_edge`` pixels on its longer side (for proxies)."""
+        index = 0
+        while max(self.level(index + 1).size) >= long_edge and self.level(index + 1) is not self.level(index):
+            index += 1
+        return self.level(index)
+
+    def render(self, width: int, height: int, box: Optional[Box] = None) -> Image.Image:
+        base = self.levels[0]
+        if box is None:
+            box = (0, 0, base.width / self.base_factor, base.height / self.base_factor)
+        scale = _target_scale({"width": width, "height": height}, box) / self.base_factor
+        index = max(0, int(math.floor(math.log2(1 / scale)))) if scale < 1 else 0
+        img = self.level(index)
+        factor = self.base_factor * img.width / base.width
+        level_box = tuple(v * factor for v in box)
+        return img.resize((width, height), Image.LANCZOS, box=level_box)
+
+
+def open_pyramid(source_path: str, targets: Sequence[Dict[str, Any]]) -> ImagePyramid:
+    """Decode ``source_path`` once, at the lowest resolution that still serves every target.
+
+    JPEG sources use ``draft`` so the decoder itself downscales by up to 8x via DCT scaling.
+    """
+    with Image.open(source_path) as img:
+        source_size = img.size
+        full = (0, 0, source_size[0], source_size[1])
+        needed = max((_target_scale(t, t.get("box") or full) for t in targets), default=1.0)
+        if needed < 1 and img.format == "JPEG":
+            img.draft("RGB", (math.ceil(source_size[0] * needed), math.ceil(source_size[1] * needed)))
+        base = _normalize_mode(img)
+        base.load()
+    return ImagePyramid(base, source_size)
+
+
+def load_proxy(file_path: str, long_edge: int) -> Image.Image:
+    """Decode ``file_path`` downscaled to at most ``long_edge`` pixels on its long side (never upscaled)."""
     with Image.open(file_path) as img:
-        resized = img.resize((width, height))
-        resized.save(target_path)
+        width, height = img.size
+    scale = min(1.0, long_edge / max(width, height))
+    target = {"width": max(1, round(width * scale)), "height": max(1, round(height * scale))}
+    return open_pyramid(file_path, [target]).render(target["width"], target["height"])
+
+
+def _save(img: Image.Image, path: str) -> str:
+    if img.mode == "RGBA" and os.path.splitext(path)[1].lower() in (".jpg", ".jpeg"):
+        img = img.convert("RGB")
+    img.save(path)
+    return path
+
+
+def render_targets(source_path: str, targets: Sequence[Dict[str, Any]]) -> List[str]:
+    """Render many sizes of one source with a single decode.
+
+    Each target is ``{"width", "height", "path"}`` plus an optional ``"box"`` (left, top,
+    right, bottom in source pixels) to crop before scaling; without a box the whole image
+    is scaled to the target size. Outputs are encoded in parallel; returns their paths.
+    """
+    if not targets:
+        return []
+    return write_targets(open_pyramid(source_path, targets), targets)
+
+
+def write_targets(
+    pyramid: ImagePyramid,
+    targets: Sequence[Dict[str, Any]],
+    render: Optional[Callable[[ImagePyramid, Dict[str, Any]], Image.Image]] = None,
+) -> List[str]:
+    """Render and save targets (same shape as for ``render_targets``) from an already decoded pyramid.
+
+    ``render`` replaces the default box-crop-and-scale for callers that lay targets out differently.
+    """
+    render = render or (lambda p, t: p.render(t["width"], t["height"], t.get("box")))
+    rendered = [(render(pyramid, t), t["path"]) for t in targets]
+    return list(_encode_executor.map(lambda item: _save(*item), rendered))
+
+
+# JPEG quality factor per download quality; PNG stays lossless and only trades encode time for size.
+JPEG_QUALITY = {"high": 92, "medium": 80, "low": 65}
+PNG_COMPRESS_LEVEL = {"high": 6, "medium": 6, "low": 9}
+
+
+def encode_for_download(file_path: str, fmt: str, quality: str, edits: Optional[Dict[str, Any]] = None) -> bytes:
+    """Re-encode one image, with its manual ``edits`` applied, as ``"jpeg"`` or ``"png"`` in memory.
+
+    Runs in the download process pool.
+    """
+    img = apply_edits(load_image(file_path), edit_steps(edits))
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        img.convert("RGB").save(buf, "JPEG", quality=JPEG_QUALITY[quality], optimize=True)
+    else:
+        img.save(buf, "PNG", compress_level=PNG_COMPRESS_LEVEL[quality])
+    return buf.getvalue()
+
+
+def resize_image(file_path: str, target_path: str, width: int, height: int) -> None:
+    render_targets(file_path, [{"width": width, "height": height, "path": target_path}])
@@ -0,0 +1,52 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+# Response header carrying the opaque cursor for the next page; absent on the last page.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, row_id: uuid.UUID) -> str:
+    raw = json.dumps([created_at.isoformat(), str(row_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except Exception as exc:
+        raise InvalidCursorError("Invalid cursor") from exc
+
+
+def apply_keyset(query: Query, created_col, id_col, cursor: Optional[str], descending: bool = False) -> Query:
+    """Order by ``(created_at, id)`` and, given a cursor, seek past it instead of using OFFSET."""
+    if descending:
+        query = query.order_by(created_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(created_col.asc(), id_col.asc())
+    if cursor:
+        key = decode_cursor(cursor)
+        if descending:
+            query = query.filter(tuple_(created_col, id_col) < key)
+        else:
+            query = query.filter(tuple_(created_col, id_col) > key)
+    return query
+
+
+def split_page(rows: Sequence[Any], limit: int, key: Callable[[Any], Tuple[datetime, uuid.UUID]]) -> Tuple[List[Any], Optional[str]]:
+    """Trim a ``limit + 1`` fetch to one page and build the cursor for the next one (None on the last page)."""
+    page = list(rows[:limit])
+    if len(rows) <= limit or not page:
+        return page, None
+    return page, encode_cursor(*key(page[-1]))
@@ -0,0 +1,138 @@
+"""Local focal-point detection and crop planning (NumPy, no provider round-trip).
+
+Everything runs on a small proxy of the source; crop rectangles for every target aspect
+ratio are then computed together as array operations.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+Box = Tuple[float, float, float, float]
+
+PROXY_LONG_EDGE = 256
+
+# Per AdaptationRule.focalPointLogic: weights of (skin tones, color contrast, edges, center prior).
+FOCAL_WEIGHTS: Dict[str, Tuple[float, float, float, float]] = {
+    "face-centric": (0.75, 0.15, 0.1, 0.1),
+    "product-centric": (0.0, 0.5, 0.4, 0.1),
+    "face-centric & product-centric": (0.35, 0.3, 0.25, 0.1),
+    "human-centered": (0.6, 0.15, 0.1, 0.3),
+}
+DEFAULT_FOCAL_LOGIC = "face-centric"
+
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    values = values - values.min()
+    peak = values.max()
+    return values / peak if peak > 0 else values
+
+
+def make_proxy(img: Image.Image, long_edge: int = PROXY_LONG_EDGE) -> Image.Image:
+    scale = long_edge / max(img.size)
+    if scale >= 1:
+        return img.convert("RGB")
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.convert("RGB").resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+
+def saliency_map(proxy: Image.Image, logic: str = DEFAULT_FOCAL_LOGIC) -> np.ndarray:
+    """Per-pixel interest in [0, 1]-ish, weighted for the given focal-point logic."""
+    rgb = np.asarray(proxy.filter(ImageFilter.GaussianBlur(1.5)), dtype=np.float32) / 255.0
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    luma = 0.299 * r + 0.587 * g + 0.114 * b
+
+    # Skin tones sit in a compact Cb/Cr box regardless of brightness.
+    cb = 0.5 - 0.168736 * r - 0.331264 * g + 0.5 * b
+    cr = 0.5 + 0.5 * r - 0.418688 * g - 0.081312 * b
+    skin = (cb >= 77 / 255) & (cb <= 127 / 255) & (cr >= 133 / 255) & (cr <= 173 / 255)
+    # Morphological opening drops the thin skin-colored fringes that blur leaves around red/orange edges.
+    skin_img = Image.fromarray(skin.astype(np.uint8) * 255).filter(ImageFilter.MinFilter(5)).filter(ImageFilter.MaxFilter(5))
+    skin = np.asarray(skin_img, dtype=np.float32) / 255.0
+
+    # Frequency-tuned saliency: distance of each (blurred) pixel from the mean image color.
+    contrast = np.linalg.norm(rgb - rgb.reshape(-1, 3).mean(axis=0), axis=2)
+
+    grad_y, grad_x = np.gradient(luma)
+    edges = np.hypot(grad_x, grad_y)
+
+    h, w = luma.shape
+    ys, xs = np.mgrid[0:h, 0:w]
+    center = 1.0 - np.hypot(xs / max(1, w - 1) - 0.5, ys / max(1, h - 1) - 0.5) / np.sqrt(0.5)
+
+    w_skin, w_contrast, w_edges, w_center = FOCAL_WEIGHTS.get(logic, FOCAL_WEIGHTS[DEFAULT_FOCAL_LOGIC])
+    features = w_skin * _normalize(skin) + w_contrast * _normalize(contrast) + w_edges * _normalize(edges)
+    # The center prior only breaks ties between similar features; it never creates interest on its own.
+    return features * ((1.0 - w_center) + w_center * center)
+
+
+def _weighted_span(weights: np.ndarray, low: float, high: float) -> Tuple[float, float]:
+    cdf = np.cumsum(weights) / weights.sum()
+    n = len(weights)
+    return float(np.searchsorted(cdf, low)) / n, float(np.searchsorted(cdf, high) + 1) / n
+
+
+def focal_region(saliency: np.ndarray, percentile: float = 90.0) -> Tuple[Tuple[float, float], Box]:
+    """Focal point and subject box, both normalized to [0, 1], from the most salient pixels."""
+    threshold = max(np.percentile(saliency, percentile), 0.5 * saliency.max())
+    weights = np.where(saliency >= threshold, saliency, 0.0)
+    total = weights.sum()
+    if total <= 0:
+        return (0.5, 0.5), (0.25, 0.25, 0.75, 0.75)
+    cols, rows = weights.sum(axis=0), weights.sum(axis=1)
+    h, w = saliency.shape
+    fx = float((cols * (np.arange(w) + 0.5)).sum() / total) / w
+    fy = float((rows * (np.arange(h) + 0.5)).sum() / total) / h
+    x0, x1 = _weighted_span(cols, 0.1, 0.9)
+    y0, y1 = _weighted_span(rows, 0.1, 0.9)
+    return (fx, fy), (x0, y0, x1, y1)
+
+
+def _place(focal: float, lo_edge: float, hi_edge: float, size: np.ndarray, extent: float,
+           margin_lo: float, margin_hi: float) -> np.ndarray:
+    # Put the focal point in the middle of the safe area, then slide so the subject stays inside
+    # it where the crop is big enough, and finally keep the crop inside the image.
+    start = focal * extent - size * (margin_lo + (1 - margin_lo - margin_hi) / 2)
+    lowest = hi_edge * extent - size * (1 - margin_hi)
+    highest = lo_edge * extent - size * margin_lo
+    start = np.where(lowest <= highest, np.clip(start, lowest, highest), start)
+    return np.clip(start, 0, extent - size)
+
+
+def plan_crops(
+    source_size: Tuple[int, int],
+    target_sizes: Sequence[Tuple[int, int]],
+    focal: Tuple[float, float],
+    subject: Box,
+    safe_zone: Optional[Dict[str, float]] = None,
+) -> List[Box]:
+    """Largest crop of each target's aspect ratio, positioned around the focal point.
+
+    ``safe_zone`` margins (fractions of the crop: top/bottom/left/right) are kept clear of
+    the subject whenever the crop is large enough to allow it.
+    """
+    if not target_sizes:
+        return []
+    safe_zone = safe_zone or {}
+    width, height = float(source_size[0]), float(source_size[1])
+    sizes = np.asarray(target_sizes, dtype=np.float64)
+    aspect = sizes[:, 0] / sizes[:, 1]
+    crop_w = np.minimum(width, height * aspect)
+    crop_h = crop_w / aspect
+
+    x = _place(focal[0], subject[0], subject[2], crop_w, width, safe_zone.get("left", 0.0), safe_zone.get("right", 0.0))
+    y = _place(focal[1], subject[1], subject[3], crop_h, height, safe_zone.get("top", 0.0), safe_zone.get("bottom", 0.0))
+    boxes = np.stack([x, y, x + crop_w, y + crop_h], axis=1)
+    return [tuple(float(v) for v in box) for box in boxes]
+
+
+def plan_smart_crops(
+    img: Image.Image,
+    source_size: Tuple[int, int],
+    target_sizes: Sequence[Tuple[int, int]],
+    logic: str = DEFAULT_FOCAL_LOGIC,
+    safe_zone: Optional[Dict[str, float]] = None,
+) -> List[Box]:
+    """Crop boxes (in ``source_size`` pixels) for every target, from any decoded version of the source."""
+    focal, subject = focal_region(saliency_map(make_proxy(img), logic))
+    return plan_crops(source_size, target_sizes, focal, subject, safe_zone)
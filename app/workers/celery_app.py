@@ -19,3 +19,23 @@ celery_app.conf.task_queues = {
     settings.CELERY_QUEUE_PRIORITY: {"exchange": "ai_creat", "routing_key": "priority"},
     settings.CELERY_QUEUE_DLQ: {"exchange": "ai_creat", "routing_key": "dlq"},
 }
+
+celery_app.conf.beat_schedule = {
+    "fair-share-dispatch": {
+        "task": "workers.tasks_generation.dispatch_pending",
+        "schedule": settings.FAIR_SHARE_DISPATCH_INTERVAL_SECONDS,
+        "options": {"queue": settings.CELERY_QUEUE_PRIORITY},
+    },
+    "reap-stale-jobs": {
+        "task": "workers.tasks_generation.reap_stale_jobs",
+        "schedule": settings.GENERATION_REAPER_INTERVAL_SECONDS,
+        "options": {"queue": settings.CELERY_QUEUE_PRIORITY},
+    },
+}
+
+
+def queue_for_job(total_outputs: int) -> str:
+    """Small (interactive) jobs go to the priority queue so they never wait behind batch work."""
+    if total_outputs <= settings.PRIORITY_MAX_OUTPUTS:
+        return settings.CELERY_QUEUE_PRIORITY
+    return settings.CELERY_QUEUE_PRIMARY
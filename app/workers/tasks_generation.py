@@ -1,67 +1,471 @@
 from celery import shared_task
+from celery.exceptions import Retry
 import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+from app.config import get_settings
 from app.dependencies import SessionLocal
-from app.services.ai_provider import get_ai_provider
-from app.services.generation_service import store_generated_asset, update_job_status
-from app.models.generation_job import JobStatus
+from app.services.ai_provider import AIProviderBase, get_ai_provider
+from app.services.ai_provider.governor import ProviderBackoff
+from app.services.ai_provider.runtime import run_sync
+from app.services.analysis_service import get_or_create_analyses, get_or_create_analysis
+from app.services.generation_service import (
+    GeneratedAssetWriter,
+    JobProgressTracker,
+    completed_targets,
+    estimate_job_outputs,
+    job_spec,
+    parse_custom_target,
+    project_assets,
+    touch_heartbeat,
+    update_job_status,
+)
+from app.services.rule_service import get_rule_value
+from app.services.scheduler import FairShareScheduler
+from app.models.asset import Asset
+from app.models.generation_job import GenerationJob, JobStatus
 from app.models.asset_format import AssetFormat
+from app.utils.adaptation import LOCAL_STRATEGIES, render_adapted
+from app.utils.file_utils import get_generated_file_path
+from app.utils.image_utils import open_pyramid, write_targets
+from app.utils.smart_crop import DEFAULT_FOCAL_LOGIC, PROXY_LONG_EDGE, plan_smart_crops
+from app.utils.logging_utils import get_logger
+from app.workers.celery_app import queue_for_job
 
+settings = get_settings()
+logger = get_logger(__name__)
 
-@shared_task(name="workers.tasks_generation.process_generation_job")
+
+def plan_subtasks(
+    asset_ids: List[str],
+    format_ids: List[str],
+    formats_per_task: int,
+    size_of: Optional[Callable[[str], Hashable]] = None,
+) -> List[Tuple[str, List[str]]]:
+    """Split a job into (asset_id, format_ids) work units; ``formats_per_task <= 0`` keeps one unit per asset.
+
+    Targets with the same ``size_of`` key are never split across units (a unit may then run
+    over ``formats_per_task``), so each distinct size is rendered once per asset.
+    """
+    if not format_ids:
+        return []
+    groups: Dict[Hashable, List[str]] = {}
+    for fid in format_ids:
+        groups.setdefault(size_of(fid) if size_of else fid, []).append(fid)
+    chunks: List[List[str]] = [[]]
+    for group in groups.values():
+        if chunks[-1] and 0 < formats_per_task < len(chunks[-1]) + len(group):
+            chunks.append([])
+        chunks[-1].extend(group)
+    return [(asset_id, chunk) for asset_id in asset_ids for chunk in chunks]
+
+
+def _target_sizes(db: Session, target_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+    """(width, height) of each known target: format records and ``custom:WxH`` sizes."""
+    sizes = {tid: size for tid in target_ids if (size := parse_custom_target(tid))}
+    format_ids = [uuid.UUID(tid) for tid in target_ids if tid not in sizes]
+    if format_ids:
+        rows = db.query(AssetFormat.id, AssetFormat.width, AssetFormat.height).filter(AssetFormat.id.in_(format_ids))
+        sizes.update({str(row.id): (row.width, row.height) for row in rows})
+    return sizes
+
+
+@shared_task(name="workers.tasks_generation.process_generation_job", acks_late=True, reject_on_worker_lost=True)
 def process_generation_job(job_id: str, project_id: str, asset_ids: list[str], format_ids: list[str]) -> None:
+    """Plan the job into per-asset work units and hand them to the fair-share scheduler.
+
+    ``format_ids`` are the job's targets: format ids and ``custom:WxH`` ids of custom resizes.
+    Targets that already have a generated asset row are checkpoints and are not planned
+    again, so running this for a job that stalled midway resumes it (see ``reap_stale_jobs``).
+    The last unit to finish completes the job (see ``generate_asset_formats``).
+
+    Only a pending job is planned: the run claims it, so a duplicate or stale planning
+    message (redelivered, or sent again by the reaper) does nothing.
+    """
     db: Session = SessionLocal()
     try:
-        provider = get_ai_provider()
-        update_job_status(db, uuid.UUID(job_id), JobStatus.processing, progress=10)
-
-        # Preload formats to get target dimensions and ensure they exist
-        format_uuid_list = [uuid.UUID(fid) for fid in format_ids]
-        formats = (
-            db.query(AssetFormat)
-            .filter(AssetFormat.id.in_(format_uuid_list))
-            .all()
+        claimed = db.query(GenerationJob).filter(
+            GenerationJob.id == uuid.UUID(job_id), GenerationJob.status == JobStatus.pending
+        ).update({GenerationJob.status: JobStatus.processing}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            logger.info(f"job {job_id}: no longer pending, skipping planning")
+            return
+        tracker = JobProgressTracker(db, uuid.UUID(job_id))
+        owner_id = db.get(GenerationJob, uuid.UUID(job_id)).user_id
+
+        if not asset_ids:
+            rows = project_assets(db, uuid.UUID(project_id), owner_id).with_entities(Asset.id).all()
+            asset_ids = [str(row.id) for row in rows]
+        # Pin the resolved asset list, so a resume plans exactly the same outputs.
+        db.query(GenerationJob).filter(GenerationJob.id == uuid.UUID(job_id)).update(
+            {GenerationJob.spec: job_spec(asset_ids, format_ids)}, synchronize_session=False
+        )
+        touch_heartbeat(db, uuid.UUID(job_id))
+
+        done = completed_targets(db, uuid.UUID(job_id), format_ids)
+        sizes = _target_sizes(db, format_ids)
+        units = [
+            (asset_id, remaining)
+            for asset_id, fids in plan_subtasks(asset_ids, format_ids, settings.GENERATION_FORMATS_PER_TASK, size_of=sizes.get)
+            if (remaining := [fid for fid in fids if fid not in done.get(asset_id, ())])
+        ]
+
+        # Analyse every asset of the job in one batched provider round-trip; subtasks then hit the cache.
+        pending_assets = list(dict.fromkeys(asset_id for asset_id, _ in units))
+        if pending_assets:
+            assets = (
+                db.query(Asset)
+                .filter(Asset.id.in_([uuid.UUID(a) for a in pending_assets]), Asset.content_hash.isnot(None))
+                .all()
+            )
+            try:
+                get_or_create_analyses(db, assets, get_ai_provider())
+            except ProviderBackoff as exc:
+                db.rollback()
+                logger.info(f"job {job_id}: analysis prefetch deferred to subtasks ({exc})")
+
+        total_outputs = len(asset_ids) * len(format_ids)
+        targets = set(format_ids)
+        tracker.start(total_outputs, done=sum(len(done.get(a, set()) & targets) for a in asset_ids))
+        if not units:
+            tracker.set_status(JobStatus.completed, progress=100)
+            return
+        tracker.set_status(JobStatus.processing, progress=10)
+
+        # The whole job stays on the queue its size selects (same rule as /generate).
+        queue = queue_for_job(total_outputs)
+        FairShareScheduler().enqueue_job(
+            str(owner_id),
+            job_id,
+            [
+                {"project_id": project_id, "asset_id": asset_id, "format_ids": fids,
+                 "total_outputs": total_outputs, "queue": queue}
+                for asset_id, fids in units
+            ],
         )
-        format_map = {str(f.id): f for f in formats}
-
-        progress = 10
-        total_steps = max(1, len(asset_ids) * max(1, len(format_ids)))
-        step_inc = max(1, int(90 / total_steps))
-
-        for asset_id in asset_ids:
-            analysis = provider.analyze_image(f"/data/uploads/{asset_id}.png")
-            for fid in format_ids:
-                fmt = format_map.get(fid)
-                if not fmt:
-                    continue  # skip unknown format ids silently
-
-                gen = provider.generate_asset(
-                    {
-                        "analysis": analysis,
-                        "target": {"width": fmt.width, "height": fmt.height},
-                        "formatId": fid,
-                        "projectId": project_id,
-                        "assetId": asset_id,
-                    }
-                )
-
-                store_generated_asset(
-                    db,
-                    job_id=uuid.UUID(job_id),
-                    original_asset_id=uuid.UUID(asset_id),
-                    asset_format_id=uuid.UUID(fid),
-                    storage_path=gen.get("url", f"/data/generated/{asset_id}_{fid}.png"),
-                    file_type="png",
-                    dimensions={"width": fmt.width, "height": fmt.height},
-                    is_nsfw=gen.get("isNsfw", False),
-                )
-
-                progress = min(100, progress + step_inc)
-                update_job_status(db, uuid.UUID(job_id), JobStatus.processing, progress=progress)
-
-        update_job_status(db, uuid.UUID(job_id), JobStatus.completed, progress=100)
+        dispatch_pending()
+    except Exception:
+        _mark_failed(db, job_id)
+    finally:
+        db.close()
+
+
+@shared_task(
+    bind=True,
+    name="workers.tasks_generation.generate_asset_formats",
+    max_retries=settings.GENERATION_MAX_PARKS,
+    # A preempted worker's unit goes back to the broker; its stored outputs are skipped on redelivery.
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def generate_asset_formats(
+    self,
+    job_id: str,
+    project_id: str,
+    asset_id: str,
+    format_ids: list[str],
+    total_outputs: int,
+    user_id: str,
+    lease: Optional[str] = None,
+) -> int:
+    """Generate one asset into a slice of the job's formats; returns how many outputs were stored.
+
+    When the provider governor pushes back (rate limit, open circuit, provider failure) the
+    subtask is parked and retried later, keeping its fair-share lease; outputs of other
+    subtasks are unaffected. Only after ``GENERATION_MAX_PARKS`` retries does the error fail
+    the job. The lease and the job's heartbeat are renewed when the unit starts, after every
+    local render and provider round, and when it parks. Finishing (or failing) frees the slot
+    and dispatches the next queued unit.
+    """
+    unit = {"job_id": job_id, "user_id": user_id, "lease": lease}
+    scheduler = FairShareScheduler()
+    db: Session = SessionLocal()
+
+    def keepalive() -> None:
+        scheduler.renew(unit)
+        touch_heartbeat(db, uuid.UUID(job_id))
+
+    try:
+        try:
+            keepalive()
+            stored = _generate_asset_formats(db, job_id, project_id, asset_id, format_ids, total_outputs, keepalive)
+        except ProviderBackoff as exc:
+            db.rollback()
+            logger.info(f"job {job_id}: parking asset {asset_id} for {exc.retry_after:.1f}s ({exc})")
+            keepalive()
+            raise self.retry(exc=exc, countdown=exc.retry_after)
+    except Retry:
+        raise
     except Exception:
-        update_job_status(db, uuid.UUID(job_id), JobStatus.failed, progress=0)
+        _mark_failed(db, job_id)
+        scheduler.fail(unit)
+        dispatch_pending()
+        raise
+    else:
+        last = scheduler.complete(unit)
+        if last is None:
+            # Its lease had run out: the unit was given up for lost, and a resume of the job redoes
+            # whatever it did not store.
+            logger.warning(f"job {job_id}: asset {asset_id} finished after its lease was dropped")
+        elif last:
+            JobProgressTracker(db, uuid.UUID(job_id)).set_status(JobStatus.completed, progress=100)
     finally:
         db.close()
+    dispatch_pending()
+    return stored
+
+
+@shared_task(name="workers.tasks_generation.dispatch_pending")
+def dispatch_pending() -> int:
+    """Send queued work units to the workers in fair-share order (also run periodically by beat)."""
+    dispatched = set()
+
+    def send(unit: dict) -> None:
+        generate_asset_formats.apply_async(
+            args=[unit["job_id"], unit["project_id"], unit["asset_id"], unit["format_ids"],
+                  unit["total_outputs"], unit["user_id"], unit["lease"]],
+            queue=unit["queue"],
+        )
+        dispatched.add(uuid.UUID(unit["job_id"]))
+
+    sent = FairShareScheduler().dispatch(send)
+    if dispatched:
+        # A unit leaving the queue is a sign of life of its job, until the worker reports in.
+        db: Session = SessionLocal()
+        try:
+            touch_heartbeat(db, *dispatched)
+        finally:
+            db.close()
+    return sent
+
+
+@shared_task(name="workers.tasks_generation.reap_stale_jobs")
+def reap_stale_jobs() -> int:
+    """Resume unfinished jobs whose heartbeat went stale (run periodically by beat); returns how many.
+
+    A job with outstanding units (waiting in the fair-share queue, or running under a live
+    lease) is left alone. Resuming re-plans the job from its stored spec, skipping
+    checkpointed outputs; a job resumed ``GENERATION_MAX_RESUMES`` times is failed instead.
+    A pending job whose planning message was never picked up is sent again, which does not
+    count as a resume.
+    """
+    db: Session = SessionLocal()
+    scheduler = FairShareScheduler()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.GENERATION_HEARTBEAT_TIMEOUT_SECONDS)
+    resumed = 0
+    try:
+        stale = (
+            db.query(GenerationJob)
+            .filter(
+                GenerationJob.status.in_([JobStatus.pending, JobStatus.processing]),
+                GenerationJob.heartbeat_at < cutoff,
+            )
+            .all()
+        )
+        for job in stale:
+            job_id = str(job.id)
+            if scheduler.outstanding_units(job_id):
+                continue
+            resuming = job.status == JobStatus.processing
+            if not job.spec or (resuming and job.resume_count >= settings.GENERATION_MAX_RESUMES):
+                logger.warning(f"job {job_id}: stalled and cannot be resumed, failing it")
+                _mark_failed(db, job_id)
+                continue
+            if resuming:
+                job.resume_count += 1
+                logger.info(f"job {job_id}: heartbeat stale, resuming (attempt {job.resume_count})")
+            else:
+                logger.info(f"job {job_id}: never planned, sending it again")
+            job.status = JobStatus.pending  # for the planning run to claim
+            job.heartbeat_at = func.now()  # not reaped again before the resumed run can report in
+            db.commit()
+            asset_ids, target_ids = job.spec["assetIds"], job.spec["targetIds"]
+            process_generation_job.apply_async(
+                args=[job_id, str(job.project_id), asset_ids, target_ids],
+                queue=queue_for_job(estimate_job_outputs(db, job.project_id, job.user_id, asset_ids, target_ids)),
+            )
+            resumed += 1
+    finally:
+        db.close()
+    return resumed
+
+
+def _generate_asset_formats(
+    db: Session,
+    job_id: str,
+    project_id: str,
+    asset_id: str,
+    format_ids: list[str],
+    total_outputs: int,
+    keepalive: Callable[[], None] = lambda: None,
+) -> int:
+    provider = get_ai_provider()
+    asset = db.get(Asset, uuid.UUID(asset_id))
+    if not asset:
+        return 0
+    # Resume: targets stored by an earlier (interrupted) run of this unit are done.
+    done = completed_targets(db, uuid.UUID(job_id), format_ids, asset.id).get(asset_id, set())
+    format_ids = [fid for fid in format_ids if fid not in done]
+    if not format_ids:
+        return 0
+
+    formats = (
+        db.query(AssetFormat)
+        .filter(AssetFormat.id.in_([uuid.UUID(fid) for fid in format_ids if not parse_custom_target(fid)]))
+        .all()
+    )
+    format_map = {str(f.id): f for f in formats}
+    # (target id, format record or None for a custom resize, width, height); unknown format ids are skipped.
+    targets = []
+    for fid in format_ids:
+        custom = parse_custom_target(fid)
+        if custom:
+            targets.append((fid, None, *custom))
+        elif fid in format_map:
+            targets.append((fid, format_map[fid], format_map[fid].width, format_map[fid].height))
+
+    analysis = get_or_create_analysis(db, asset, provider)
+    adaptation = get_rule_value(db, "adaptation")
+    behavior = get_rule_value(db, "ai-behavior")
+    strategy = behavior.get("adaptationStrategy", "crop")
+    # Targets of equal size are one render (local or remote) fanned out to all of their records.
+    by_size: Dict[Tuple[int, int, str], List[str]] = {}
+    for fid, _, width, height in targets:
+        by_size.setdefault((width, height, strategy), []).append(fid)
+    rendered = {}
+    if strategy in behavior.get("localStrategies", LOCAL_STRATEGIES):
+        rendered = _render_locally(asset, by_size, adaptation, strategy, keepalive)
+    remote = {key: fids for key, fids in by_size.items() if fids[0] not in rendered}
+    payloads = [
+        {
+            "analysis": analysis,
+            "target": {"width": width, "height": height},
+            "formatId": fids[0],
+            "formatIds": fids,
+            "projectId": project_id,
+            "assetId": asset_id,
+            "sourcePath": asset.storage_path,
+        }
+        for (width, height, _), fids in remote.items()
+    ]
+    results = _generate_remote(provider, payloads, keepalive)
+    generated = {fid: gen for fids, gen in zip(remote.values(), results) for fid in fids}
+
+    tracker = JobProgressTracker(db, uuid.UUID(job_id))
+    stored = 0
+
+    def on_flush(count: int) -> None:
+        # Progress is aggregated across subtasks in the state store as each batch of rows lands;
+        # every landed batch is also a checkpoint and a sign of life.
+        tracker.advance(count, total_outputs)
+        touch_heartbeat(db, uuid.UUID(job_id))
+
+    with GeneratedAssetWriter(db, on_flush=on_flush) as writer:
+        for fid, fmt, width, height in targets:
+            local_path = rendered.get(fid)
+            gen = generated.get(fid, {})  # a local render is the result; no provider round-trip
+            writer.add(
+                job_id=uuid.UUID(job_id),
+                original_asset_id=uuid.UUID(asset_id),
+                asset_format_id=fmt.id if fmt else None,
+                storage_path=gen.get("url", local_path or _target_path(asset.id, fid)),
+                file_type="png",
+                dimensions={"width": width, "height": height},
+                is_nsfw=gen.get("isNsfw", False),
+            )
+            stored += 1
+
+    return stored
+
+
+def _generate_remote(
+    provider: AIProviderBase, payloads: List[dict], keepalive: Callable[[], None] = lambda: None
+) -> List[dict]:
+    """Send the provider work of a subtask: batched where the provider supports it, otherwise
+    as concurrent single calls bounded by the provider's semaphore.
+
+    Payloads go out in rounds of as many as can run at once, with ``keepalive`` after each,
+    so a unit with a lot of remote work keeps its lease.
+    """
+    per_round = max(1, provider.max_batch_size) * max(1, provider.max_concurrency)
+    results: List[dict] = []
+    for start in range(0, len(payloads), per_round):
+        results.extend(run_sync(provider.generate_assets_async(payloads[start:start + per_round])))
+        keepalive()
+    return results
+
+
+def _target_path(asset_id: uuid.UUID, target_id: str) -> str:
+    custom = parse_custom_target(target_id)
+    return get_generated_file_path(asset_id, f"custom_{custom[0]}x{custom[1]}" if custom else target_id)
+
+
+def _render_locally(
+    asset: Asset,
+    by_size: Dict[Tuple[int, int, str], List[str]],
+    adaptation: dict,
+    strategy: str,
+    keepalive: Callable[[], None] = lambda: None,
+) -> Dict[str, str]:
+    """Decode the asset once, adapt it to every distinct size and write the results; returns {target_id: path}.
+
+    ``by_size`` maps each ``(width, height, strategy)`` to the targets sharing it; they all
+    get the path of the one render.
+
+    Crops follow the admin adaptation rule (focal-point logic and safe-zone margins); the
+    ``extend-canvas`` and ``add-background`` strategies fill around the whole source instead.
+    Strategies without a local implementation, and sources that cannot be read, return {}
+    and are left to the provider; so are those the ai-behavior rule's ``localStrategies``
+    leaves out, which callers check before calling this. ``keepalive`` is called after each render.
+    """
+    if strategy not in LOCAL_STRATEGIES:
+        return {}
+    targets = [
+        {
+            "width": width,
+            "height": height,
+            "path": _target_path(asset.id, fids[0]),
+            "formatIds": fids,
+            "strategy": strategy,
+        }
+        for (width, height, _), fids in by_size.items()
+    ]
+    if not targets:
+        return {}
+    try:
+        pyramid = open_pyramid(asset.storage_path, targets)
+        if strategy == "crop":
+            boxes = plan_smart_crops(
+                pyramid.smallest_level_at_least(PROXY_LONG_EDGE),
+                pyramid.source_size,
+                [(t["width"], t["height"]) for t in targets],
+                logic=adaptation.get("focalPointLogic", DEFAULT_FOCAL_LOGIC),
+                safe_zone=(adaptation.get("layoutGuidance") or {}).get("safeZone"),
+            )
+            for target, box in zip(targets, boxes):
+                target["box"] = box
+
+        def render(pyramid, target):
+            img = render_adapted(pyramid, target)
+            keepalive()
+            return img
+
+        write_targets(pyramid, targets, render=render)
+    except Exception as exc:
+        logger.warning(f"local render failed for asset {asset.id}: {exc}")
+        return {}
+    return {fid: t["path"] for t in targets for fid in t["formatIds"]}
+
+
+def _mark_failed(db: Session, job_id: str) -> None:
+    # Postgres first so the failure sticks even when the state store is what broke.
+    db.rollback()
+    update_job_status(db, uuid.UUID(job_id), JobStatus.failed, progress=0)
+    try:
+        JobProgressTracker(db, uuid.UUID(job_id)).set_status(JobStatus.failed, progress=0)
+    except Exception:
+        pass
@@ -16,6 +16,7 @@ import app.models.repurposing_platform  # noqa: F401
 import app.models.asset_format  # noqa: F401
 import app.models.text_style_set  # noqa: F401
 import app.models.app_settings  # noqa: F401
+import app.models.stored_blob  # noqa: F401
 
 config = context.config
 
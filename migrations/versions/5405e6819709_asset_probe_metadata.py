@@ -0,0 +1,25 @@
+"""asset probe metadata
+
+Revision ID: 5405e6819709
+Revises: c8b25c30dee3
+Create Date: 2026-10-18 10:03:17.552910+00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5405e6819709"
+down_revision = "c8b25c30dee3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("assets", sa.Column("color_mode", sa.String(16)))
+    op.add_column("assets", sa.Column("layer_count", sa.Integer()))
+
+
+def downgrade() -> None:
+    op.drop_column("assets", "layer_count")
+    op.drop_column("assets", "color_mode")
@@ -0,0 +1,37 @@
+"""keyset pagination indexes
+
+Revision ID: 946981651e94
+Revises: 5405e6819709
+Create Date: 2026-10-18 10:41:05.307716+00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "946981651e94"
+down_revision = "5405e6819709"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # (parent, created_at, id) composites serve both the parent filter and the keyset order,
+    # so the single-column parent indexes become redundant.
+    op.create_index("idx_projects_user_created_id", "projects", ["user_id", "created_at", "id"])
+    op.create_index("idx_assets_project_created_id", "assets", ["project_id", "created_at", "id"])
+    op.create_index("idx_generated_assets_job_created_id", "generated_assets", ["job_id", "created_at", "id"])
+
+    op.drop_index("idx_projects_user_id", table_name="projects")
+    op.drop_index("idx_assets_project_id", table_name="assets")
+    op.drop_index("idx_generated_assets_job_id", table_name="generated_assets")
+
+
+def downgrade() -> None:
+    op.create_index("idx_generated_assets_job_id", "generated_assets", ["job_id"])
+    op.create_index("idx_assets_project_id", "assets", ["project_id"])
+    op.create_index("idx_projects_user_id", "projects", ["user_id"])
+
+    op.drop_index("idx_generated_assets_job_created_id", table_name="generated_assets")
+    op.drop_index("idx_assets_project_created_id", table_name="assets")
+    op.drop_index("idx_projects_user_created_id", table_name="projects")
@@ -0,0 +1,36 @@
+"""content addressed uploads
+
+Revision ID: c8b25c30dee3
+Revises: 6286f5cd5c5b
+Create Date: 2026-10-18 09:12:40.118204+00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c8b25c30dee3"
+down_revision = "6286f5cd5c5b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stored_blobs",
+        sa.Column("sha256", sa.String(64), primary_key=True),
+        sa.Column("storage_path", sa.Text(), nullable=False),
+        sa.Column("size_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+    op.add_column("assets", sa.Column("content_hash", sa.String(64)))
+    op.create_index("idx_assets_content_hash", "assets", ["content_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_assets_content_hash", table_name="assets")
+    op.drop_column("assets", "content_hash")
+
+    op.drop_table("stored_blobs")
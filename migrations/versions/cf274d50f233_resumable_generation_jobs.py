@@ -0,0 +1,40 @@
+"""resumable generation jobs
+
+Revision ID: cf274d50f233
+Revises: 946981651e94
+Create Date: 2026-10-18 16:20:44.518203+00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "cf274d50f233"
+down_revision = "946981651e94"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("generation_jobs", sa.Column("spec", postgresql.JSONB(), nullable=True))
+    op.add_column(
+        "generation_jobs",
+        sa.Column("heartbeat_at", sa.TIMESTAMP(timezone=True), nullable=True, server_default=sa.func.now()),
+    )
+    # Existing jobs count from their creation; afterwards every job has a heartbeat from the start.
+    op.execute("UPDATE generation_jobs SET heartbeat_at = created_at")
+    op.alter_column("generation_jobs", "heartbeat_at", nullable=False)
+    op.add_column("generation_jobs", sa.Column("resume_count", sa.Integer(), nullable=False, server_default="0"))
+    # The reaper scans unfinished jobs by heartbeat.
+    op.create_index("idx_generation_jobs_status_heartbeat", "generation_jobs", ["status", "heartbeat_at"])
+    # Checkpoints are read per (job, asset).
+    op.create_index("idx_generated_assets_job_original", "generated_assets", ["job_id", "original_asset_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_generated_assets_job_original", table_name="generated_assets")
+    op.drop_index("idx_generation_jobs_status_heartbeat", table_name="generation_jobs")
+    op.drop_column("generation_jobs", "resume_count")
+    op.drop_column("generation_jobs", "heartbeat_at")
+    op.drop_column("generation_jobs", "spec")
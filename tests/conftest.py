@@ -1,12 +1,21 @@
 import os
+from types import SimpleNamespace
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+# Job progress etc. live in an in-process store during tests instead of Redis.
+os.environ.setdefault("STATE_STORE_BACKEND", "memory")
+
 from app.main import app
-from app.dependencies import get_db
+from app.dependencies import get_current_user, get_db
+from app.models.asset import Asset
 from app.models.base import Base
+from app.models.generation_job import GenerationJob, JobStatus
+from app.models.project import Project
+from app.models.user import User
 
 
 @pytest.fixture(scope="session")
@@ -39,3 +48,44 @@ def client(db_session):
     app.dependency_overrides[get_db] = override_get_db
     yield TestClient(app)
     app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="function")
+def seed_project(db_session):
+    """Factory for a user (unique per ``tag``, the DB is shared) owning one project.
+
+    ``source`` adds an asset stored at that path, ``job_status`` a generation job; both
+    are flushed, so ids are set, but not committed.
+    """
+    def seed(tag, source=None, job_status=None):
+        user = User(username=tag, email=f"{tag}@example.com", hashed_password="x", preferences={})
+        db_session.add(user)
+        db_session.flush()
+        project = Project(user_id=user.id, name=tag.title())
+        db_session.add(project)
+        db_session.flush()
+        asset = job = None
+        if source is not None:
+            asset = Asset(project_id=project.id, original_filename=os.path.basename(source) or "a.png",
+                          storage_path=source, file_type="png", file_size_bytes=1)
+            db_session.add(asset)
+        if job_status is not None:
+            job = GenerationJob(project_id=project.id, user_id=user.id, status=job_status,
+                                progress=100 if job_status is JobStatus.completed else 0)
+            db_session.add(job)
+        db_session.flush()
+        return SimpleNamespace(user=user, project=project, asset=asset, job=job)
+
+    return seed
+
+
+@pytest.fixture(scope="function")
+def login(db_session):
+    """Commit pending rows and authenticate API requests as ``user``."""
+    def login_as(user):
+        db_session.commit()
+        db_session.refresh(user)
+        db_session.expunge(user)  # the override outlives each request's session
+        app.dependency_overrides[get_current_user] = lambda: user
+
+    return login_as
@@ -0,0 +1,62 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.utils.adaptation import add_background, extend_canvas, fit_inside, render_adapted
+from app.utils.image_utils import open_pyramid
+
+
+def _square(color=(30, 120, 200)):
+    img = Image.new("RGB", (400, 400), color)
+    ImageDraw.Draw(img).rectangle((150, 150, 250, 250), fill=(250, 250, 250))
+    return img
+
+
+def test_fit_inside_centers_the_source():
+    assert fit_inside((400, 400), 1200, 600) == (600, 600, 300, 0)
+    assert fit_inside((1600, 900), 1080, 1920) == (1080, 608, 0, 656)
+
+
+def test_extend_canvas_keeps_the_source_and_continues_its_edges():
+    out = extend_canvas(_square(), 1200, 600)
+
+    assert out.size == (1200, 600)
+    arr = np.asarray(out, dtype=np.int16)
+    # The centered source is untouched (modulo resampling) and the padding continues the edge color.
+    assert np.abs(arr[300, 600] - (250, 250, 250)).max() <= 2
+    assert np.abs(arr[300, 20] - (30, 120, 200)).max() <= 8
+    assert np.abs(arr[300, 1180] - (30, 120, 200)).max() <= 8
+
+
+def test_add_background_uses_flat_color_for_uniform_borders():
+    out = add_background(_square((10, 200, 90)), 600, 1200)
+
+    arr = np.asarray(out, dtype=np.int16)
+    assert out.size == (600, 1200)
+    assert np.abs(arr[10, 300] - (10, 200, 90)).max() <= 8
+    assert np.abs(arr[600, 300] - (250, 250, 250)).max() <= 2
+
+
+def test_add_background_blurs_busy_borders():
+    img = Image.new("RGB", (400, 400))
+    draw = ImageDraw.Draw(img)
+    for x in range(0, 400, 20):
+        draw.rectangle((x, 0, x + 9, 399), fill=(255, 255, 255))
+
+    arr = np.asarray(add_background(img, 1200, 400, fill="auto"), dtype=np.float32)
+
+    # Stripes are blurred away in the fill rather than repeated or flattened to one color.
+    assert arr[:, :300].std() < arr[:, 400:800].std() / 4
+    assert 20 < arr[:, :300].mean() < 200
+
+
+def test_render_adapted_from_pyramid(tmp_path):
+    src = tmp_path / "src.png"
+    _square().save(src)
+    targets = [
+        {"width": 300, "height": 100, "strategy": "extend-canvas"},
+        {"width": 100, "height": 300, "strategy": "add-background"},
+        {"width": 200, "height": 200},
+    ]
+    pyramid = open_pyramid(str(src), targets)
+
+    assert [render_adapted(pyramid, t).size for t in targets] == [(300, 100), (100, 300), (200, 200)]
@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.ai_provider import AIProviderBase, get_ai_provider
+from app.services.ai_provider.http_provider import HTTPProvider
+from app.services.ai_provider.mock_provider import MockProvider
+from app.workers.tasks_generation import _generate_remote
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+            server.ports.add(self.client_address[1])
+            server.requests += 1
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+        if self.path.endswith("/batch"):
+            path = self.path[: -len("/batch")]
+            result = {"results": [{"url": f"http://stand-in{path}/{i.get('formatId', '')}"} for i in body["inputs"]]}
+        else:
+            result = {"url": f"http://stand-in{self.path}/{body.get('formatId', '')}"}
+        payload = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    server.lock, server.in_flight, server.peak, server.requests, server.ports = threading.Lock(), 0, 0, 0, set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_provider_keeps_calls_in_flight_within_the_limit(stand_in):
+    provider = HTTPProvider(base_url=f"http://127.0.0.1:{stand_in.server_port}", max_concurrency=8, max_batch_size=1)
+    payloads = [{"formatId": str(i)} for i in range(40)]
+
+    results = _generate_remote(provider, payloads)
+
+    assert [r["url"] for r in results] == [f"http://stand-in/generate/{i}" for i in range(40)]
+    assert 1 < stand_in.peak <= 8
+    # Connections are pooled and reused rather than opened per call.
+    assert len(stand_in.ports) <= 8
+
+    _generate_remote(provider, payloads[:8])
+    assert len(stand_in.ports) <= 8
+
+
+def test_sync_calls_share_the_pool(stand_in):
+    provider = HTTPProvider(base_url=f"http://127.0.0.1:{stand_in.server_port}")
+    for _ in range(3):
+        assert provider.analyze_image("/tmp/a.png")["url"] == "http://stand-in/analyze/"
+    assert len(stand_in.ports) == 1
+
+
+def test_http_provider_batches_requests(stand_in):
+    provider = HTTPProvider(base_url=f"http://127.0.0.1:{stand_in.server_port}", max_batch_size=16)
+
+    results = _generate_remote(provider, [{"formatId": str(i)} for i in range(40)])
+
+    assert [r["url"] for r in results] == [f"http://stand-in/generate/{i}" for i in range(40)]
+    assert stand_in.requests == 3
+
+
+def test_blocking_providers_get_the_async_protocol():
+    assert _generate_remote(OneAtATimeProvider(), [{}, {}])[0]["formatName"] == "Mock-format"
+    assert get_ai_provider() is get_ai_provider()
+
+
+class OneAtATimeProvider(MockProvider):
+    analyze_images = AIProviderBase.analyze_images
+    generate_assets = AIProviderBase.generate_assets
+
+
+def test_batch_calls_fall_back_to_single_calls():
+    provider = OneAtATimeProvider()
+    assert len(provider.generate_assets([{}, {}, {}])) == 3
+    assert provider.requests == 3
+
+
+def test_mock_provider_batches_natively():
+    provider = MockProvider()
+    provider.max_batch_size = 16
+
+    assert len(_generate_remote(provider, [{} for _ in range(20)])) == 20
+    assert provider.requests == 2
@@ -0,0 +1,134 @@
+import io
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.dependencies import get_current_user
+from app.main import app
+from app.models.asset import Asset
+from app.models.asset_format import AssetFormat, FormatType
+from app.models.generated_asset import GeneratedAsset
+from app.models.generation_job import GenerationJob, JobStatus
+from app.models.project import Project
+from app.models.repurposing_platform import RepurposingPlatform
+from app.models.user import User
+from app.config import get_settings
+from app.services import download_service
+from app.services.download_cache import DownloadCache, download_cache_key, get_download_cache
+from app.services.download_service import stream_archive
+
+settings = get_settings()
+
+
+@pytest.fixture(autouse=True)
+def download_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_CACHE_DIR", str(tmp_path / "downloads"))
+    get_download_cache.cache_clear()
+    yield tmp_path / "downloads"
+    get_download_cache.cache_clear()
+
+
+def _seed(db_session, tmp_path, tag):
+    user = User(username=f"downloader-{tag}", email=f"downloader-{tag}@example.com", hashed_password="x", preferences={})
+    other = User(username=f"bystander-{tag}", email=f"bystander-{tag}@example.com", hashed_password="x", preferences={})
+    db_session.add_all([user, other])
+    db_session.flush()
+    project = Project(user_id=user.id, name="Downloads")
+    platform = RepurposingPlatform(name=f"Stories {tag}")
+    db_session.add_all([project, platform])
+    db_session.flush()
+    story = AssetFormat(name="Story", type=FormatType.repurposing, platform_id=platform.id, width=90, height=160)
+    asset = Asset(project_id=project.id, original_filename="hero.png", storage_path="/a", file_type="png", file_size_bytes=1)
+    job = GenerationJob(project_id=project.id, user_id=user.id, status=JobStatus.completed, progress=100)
+    foreign_job = GenerationJob(project_id=project.id, user_id=other.id, status=JobStatus.completed, progress=100)
+    db_session.add_all([story, asset, job, foreign_job])
+    db_session.flush()
+
+    generated = []
+    for name, fmt, owner in [("story", story, job), ("square", None, job), ("theirs", None, foreign_job)]:
+        path = tmp_path / f"{name}.png"
+        Image.new("RGBA", (90, 160), (200, 40, 40, 255)).save(path)
+        ga = GeneratedAsset(job_id=owner.id, original_asset_id=asset.id, asset_format_id=fmt.id if fmt else None,
+                            storage_path=str(path), file_type="png", dimensions={"width": 90, "height": 160})
+        db_session.add(ga)
+        generated.append(ga)
+    db_session.commit()
+    ids = [str(ga.id) for ga in generated]
+    db_session.refresh(user)
+    db_session.expunge(user)
+    app.dependency_overrides[get_current_user] = lambda: user
+    return ids
+
+
+def test_download_streams_a_zip_grouped_by_category(client: TestClient, db_session, tmp_path):
+    ids = _seed(db_session, tmp_path, "category")
+
+    resp = client.post("/api/v1/download", json={"assetIds": ids, "format": "jpeg", "quality": "medium", "grouping": "category"})
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(resp.content))
+    # The other user's asset is left out; members are re-encoded as JPEG.
+    assert archive.namelist() == ["Stories category/story.jpg", "Generic/square.jpg"]
+    assert Image.open(io.BytesIO(archive.read("Generic/square.jpg"))).format == "JPEG"
+
+
+def test_download_batch_grouping_uses_the_original_asset(client: TestClient, db_session, tmp_path):
+    ids = _seed(db_session, tmp_path, "batch")
+
+    resp = client.post("/api/v1/download", json={"assetIds": ids[:2], "format": "png", "quality": "high", "grouping": "batch"})
+
+    assert zipfile.ZipFile(io.BytesIO(resp.content)).namelist() == ["hero/story.png", "hero/square.png"]
+
+
+def test_stream_archive_skips_unreadable_members(tmp_path):
+    good = tmp_path / "good.png"
+    Image.new("RGB", (20, 20), (0, 0, 255)).save(good)
+    bad = tmp_path / "bad.png"
+    bad.write_bytes(b"not an image")
+
+    chunks = list(stream_archive([("bad.png", str(bad), {}), ("good.png", str(good), {})], "png", "low"))
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.namelist() == ["good.png"]
+    assert archive.testzip() is None
+
+
+def test_repeat_downloads_come_from_the_cache_until_an_edit(client: TestClient, db_session, tmp_path, monkeypatch):
+    ids = _seed(db_session, tmp_path, "cached")
+    body = {"assetIds": ids[:2], "format": "jpeg", "quality": "high", "grouping": "individual"}
+    builds = []
+    build = download_service.stream_archive
+    monkeypatch.setattr(download_service, "stream_archive", lambda *a: builds.append(1) or build(*a))
+
+    first = client.post("/api/v1/download", json=body)
+    again = client.post("/api/v1/download", json={**body, "assetIds": ids[1::-1]})  # same set, other order
+    assert again.content == first.content
+    assert len(builds) == 1
+
+    client.put(f"/api/v1/generated-assets/{ids[0]}", json={"edits": {"saturation": 1.2}})
+    client.post("/api/v1/download", json=body)
+    assert len(builds) == 2
+
+
+def test_download_cache_key_follows_the_source_files(tmp_path):
+    path = tmp_path / "out.png"
+    Image.new("RGB", (10, 10), (255, 0, 0)).save(path)
+    entries = [("out.jpg", str(path), {})]
+    before = download_cache_key(entries, "jpeg", "high")
+
+    Image.new("RGB", (12, 10), (0, 0, 255)).save(path)  # regenerated in place
+
+    assert download_cache_key(entries, "jpeg", "high") != before
+
+
+def test_download_cache_evicts_least_recently_used(tmp_path):
+    cache = DownloadCache(str(tmp_path), max_bytes=250)
+    for key in ("a", "b"):
+        list(cache.store(key, iter([b"x" * 100])))
+    cache.open("a").close()  # touch: "b" is now the coldest
+    list(cache.store("c", iter([b"x" * 100])))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.zip", "c.zip"]
@@ -0,0 +1,118 @@
+import io
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.models.generated_asset import GeneratedAsset
+from app.models.generation_job import JobStatus
+from app.services import edit_service
+from app.services.edit_service import allowed_edits
+from app.services.rule_service import DEFAULT_MANUAL_EDITING, set_rule
+from app.utils import edit_pipeline
+from app.utils.edit_pipeline import EditPipeline, edit_steps
+from app.utils.image_utils import load_proxy
+
+
+def test_changing_the_last_step_only_reruns_that_step(monkeypatch):
+    calls = []
+    for op, fn in list(edit_pipeline._APPLY.items()):
+        monkeypatch.setitem(edit_pipeline._APPLY, op, lambda img, p, op=op, fn=fn: calls.append(op) or fn(img, p))
+    pipeline = EditPipeline(max_bytes=64 * 1024 * 1024)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return Image.new("RGB", (400, 300), (120, 60, 30))
+
+    edits = {"text": {"content": "Sale", "color": "#ffffff"}, "crop": {"x": 10, "y": 10, "width": 200, "height": 100},
+             "saturation": 1.4}
+    first = pipeline.render("src", load, edit_steps(edits))
+    calls.clear()
+    second = pipeline.render("src", load, edit_steps({**edits, "text": {"content": "Sale", "color": "#ff0000"}}))
+
+    assert first.size == second.size == (200, 100)
+    assert calls == ["text"]
+    assert len(loads) == 1
+
+
+def test_allowed_edits_follow_the_rule_toggles():
+    edits = {"crop": {"x": 0, "y": 0, "width": 5, "height": 5}, "saturation": 0.5, "text": {"content": "x"}}
+
+    assert list(allowed_edits(edits, {**DEFAULT_MANUAL_EDITING, "croppingEnabled": False})) == ["saturation", "text"]
+    assert allowed_edits(edits, {**DEFAULT_MANUAL_EDITING, "editingEnabled": False}) == {}
+
+
+def test_saved_edits_are_checked_and_rendered(client: TestClient, db_session, seed_project, login, tmp_path):
+    seed = seed_project("editor", source="/a", job_status=JobStatus.completed)
+    path = tmp_path / "out.png"
+    Image.new("RGB", (300, 200), (200, 40, 40)).save(path)
+    ga = GeneratedAsset(job_id=seed.job.id, original_asset_id=seed.asset.id, storage_path=str(path), file_type="png",
+                        dimensions={"width": 300, "height": 200})
+    db_session.add(ga)
+    db_session.flush()
+    ga_id = str(ga.id)
+    login(seed.user)
+
+    crop = {"crop": {"x": 0, "y": 0, "width": 120, "height": 80}, "saturation": 0.0}
+    set_rule(db_session, "manual-editing", {**DEFAULT_MANUAL_EDITING, "croppingEnabled": False})
+    try:
+        assert client.put(f"/api/v1/generated-assets/{ga_id}", json={"edits": crop}).status_code == 403
+    finally:
+        set_rule(db_session, "manual-editing", DEFAULT_MANUAL_EDITING)
+
+    assert client.put(f"/api/v1/generated-assets/{ga_id}", json={"edits": crop}).status_code == 200
+    resp = client.get(f"/api/v1/generated-assets/{ga_id}/render")
+
+    assert resp.status_code == 200
+    img = Image.open(io.BytesIO(resp.content)).convert("RGB")
+    assert img.size == (120, 80)
+    r, g, b = img.getpixel((10, 10))
+    assert abs(r - g) < 3 and abs(g - b) < 3  # desaturated to gray
+
+
+def test_previews_render_on_a_cached_proxy(client: TestClient, db_session, seed_project, login, tmp_path, monkeypatch):
+    seed = seed_project("previewer", source="/a", job_status=JobStatus.completed)
+    path = tmp_path / "big.png"
+    Image.new("RGB", (3000, 2000), (40, 90, 200)).save(path)
+    ga = GeneratedAsset(job_id=seed.job.id, original_asset_id=seed.asset.id, storage_path=str(path), file_type="png",
+                        dimensions={"width": 3000, "height": 2000})
+    db_session.add(ga)
+    db_session.flush()
+    ga_id = str(ga.id)
+    login(seed.user)
+    proxies = []
+    monkeypatch.setattr(edit_service, "load_proxy", lambda *a: proxies.append(a) or load_proxy(*a))
+
+    sizes = []
+    for color in ("#ffffff", "#ff0000"):
+        edits = {"crop": {"x": 0, "y": 0, "width": 1500, "height": 1000}, "text": {"content": "Hi", "color": color}}
+        resp = client.post(f"/api/v1/generated-assets/{ga_id}/preview", json={"edits": edits})
+        assert resp.status_code == 200
+        sizes.append(Image.open(io.BytesIO(resp.content)).size)
+
+    # Crop coordinates are given at full resolution and scaled onto the 1024px proxy.
+    assert sizes == [(512, 341), (512, 341)]
+    assert len(proxies) == 1
+
+
+def test_edits_are_validated_and_scoped_to_the_owner(client: TestClient, db_session, seed_project, login, tmp_path):
+    seed = seed_project("strict-editor", source="/a", job_status=JobStatus.completed)
+    path = tmp_path / "out.png"
+    Image.new("RGB", (300, 200), (200, 40, 40)).save(path)
+    ga = GeneratedAsset(job_id=seed.job.id, original_asset_id=seed.asset.id, storage_path=str(path), file_type="png",
+                        dimensions={"width": 300, "height": 200})
+    db_session.add(ga)
+    db_session.flush()
+    ga_id = str(ga.id)
+    login(seed.user)
+
+    for edits in ({"crop": 5}, {"text": "x"}, {"saturation": "high"}, {"crop": {"x": 250, "width": 100}},
+                  {"text": {"content": "Hi", "size": 10_000}}, {"text": {"content": "Hi", "color": "nope"}}):
+        assert client.put(f"/api/v1/generated-assets/{ga_id}", json={"edits": edits}).status_code == 400, edits
+        assert client.post(f"/api/v1/generated-assets/{ga_id}/preview", json={"edits": edits}).status_code == 400
+
+    login(seed_project("snooper").user)
+    assert client.get(f"/api/v1/generated-assets/{ga_id}").status_code == 404
+    assert client.put(f"/api/v1/generated-assets/{ga_id}", json={"edits": {"saturation": 0.5}}).status_code == 404
+    assert client.get(f"/api/v1/generated-assets/{ga_id}/render").status_code == 404
+    assert client.post(f"/api/v1/generated-assets/{ga_id}/preview", json={"edits": {}}).status_code == 404
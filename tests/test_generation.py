@@ -1,5 +1,44 @@
 import io
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
 from fastapi.testclient import TestClient
+from PIL import Image
+from pydantic import ValidationError
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.config import get_settings
+from app.models.asset import Asset
+from app.models.asset_format import AssetFormat, FormatType
+from app.models.generated_asset import GeneratedAsset
+from app.models.generation_job import GenerationJob, JobStatus
+from app.models.repurposing_platform import RepurposingPlatform
+from app.schemas.generation import GenerationRequest
+from app.services.ai_provider.mock_provider import MockProvider
+from app.services.analysis_service import get_or_create_analyses, get_or_create_analysis, invalidate_project_analysis
+from app.services.generation_service import (
+    GeneratedAssetWriter,
+    JobProgressTracker,
+    completed_targets,
+    job_progress_key,
+    read_job_progress,
+)
+from app.services.job_events import get_job_event_broker, job_channel
+from app.services.rule_service import DEFAULT_AI_BEHAVIOR, set_rule
+from app.services.state_store import InMemoryStateStore
+from app.utils import file_utils
+from app.services.scheduler import FairShareScheduler
+from app.workers import tasks_generation
+from app.workers.tasks_generation import _generate_asset_formats, plan_subtasks, reap_stale_jobs
+
+settings = get_settings()
 
 
 def test_generate_flow(client: TestClient):
@@ -21,3 +60,455 @@ def test_generate_flow(client: TestClient):
     status_resp = client.get(f"/api/v1/generate/{job_id}/status")
     assert status_resp.status_code == 200
     assert "status" in status_resp.json()
+
+
+def test_plan_subtasks_splits_formats_per_asset():
+    units = plan_subtasks(["a1", "a2"], ["f1", "f2", "f3"], formats_per_task=2)
+    assert units == [("a1", ["f1", "f2"]), ("a1", ["f3"]), ("a2", ["f1", "f2"]), ("a2", ["f3"])]
+
+    assert plan_subtasks(["a1"], ["f1", "f2"], formats_per_task=0) == [("a1", ["f1", "f2"])]
+    assert plan_subtasks(["a1"], [], formats_per_task=2) == []
+
+
+def test_plan_subtasks_keeps_equal_sizes_together():
+    sizes = {"f1": (1080, 1080), "f2": (1920, 1080), "f3": (1080, 1080), "custom:1080x1080": (1080, 1080)}
+
+    units = plan_subtasks(["a1"], list(sizes), formats_per_task=2, size_of=sizes.get)
+
+    assert units == [("a1", ["f1", "f3", "custom:1080x1080"]), ("a1", ["f2"])]
+
+
+def test_custom_resizes_are_capped_per_job():
+    project_id = uuid.uuid4()
+    square = {"width": 1000, "height": 1000}
+
+    # Repeats of one size are rendered once, so they only count once towards the pixel budget.
+    assert len(GenerationRequest(projectId=project_id, formatIds=[], customResizes=[square] * 20).customResizes) == 20
+    with pytest.raises(ValidationError):
+        GenerationRequest(projectId=project_id, formatIds=[], customResizes=[square] * 21)
+    with pytest.raises(ValidationError):
+        GenerationRequest(projectId=project_id, formatIds=[],
+                          customResizes=[{"width": 10000, "height": 10000 - i} for i in range(3)])
+
+
+class CountingProvider(MockProvider):
+    def __init__(self):
+        self.calls = 0
+
+    def analyze_image(self, file_path):
+        self.calls += 1
+        return super().analyze_image(file_path)
+
+
+def test_analysis_is_cached_by_content_hash(db_session, seed_project):
+    project = seed_project("analyst").project
+    elsewhere = seed_project("analyst-neighbour").project
+    first, second, theirs = (
+        Asset(project_id=owner.id, original_filename=name, storage_path="/blob", content_hash="ab" * 32,
+              file_type="png", file_size_bytes=1, ai_metadata={"note": name})
+        for owner, name in ((project, "logo.png"), (project, "logo-copy.png"), (elsewhere, "their-logo.png"))
+    )
+    db_session.add_all([first, second, theirs])
+    db_session.commit()
+    provider = CountingProvider()
+
+    assert get_or_create_analysis(db_session, first, provider)["detectedElements"] == ["mock-element"]
+    get_or_create_analysis(db_session, first, provider)
+    get_or_create_analysis(db_session, second, provider)
+    get_or_create_analysis(db_session, theirs, provider)
+    assert provider.calls == 1
+    assert first.ai_metadata["note"] == "logo.png"
+
+    assert invalidate_project_analysis(db_session, project.id) == 2
+    db_session.expire_all()
+    # Only the analysis is dropped from the project; the other project keeps its metadata.
+    assert first.ai_metadata == {"note": "logo.png"}
+    assert theirs.ai_metadata["detectedElements"] == ["mock-element"]
+    get_or_create_analysis(db_session, second, provider)
+    assert provider.calls == 2
+
+
+def test_analyses_are_batched_per_distinct_content(db_session, seed_project):
+    project = seed_project("batcher").project
+    assets = [
+        Asset(project_id=project.id, original_filename=name, storage_path=f"/{name}", content_hash=digest,
+              file_type="png", file_size_bytes=1)
+        for name, digest in (("a.png", "cd" * 32), ("a-copy.png", "cd" * 32), ("b.png", "ef" * 32), ("c.png", None))
+    ]
+    db_session.add_all(assets)
+    db_session.commit()
+    provider = MockProvider()
+
+    results = get_or_create_analyses(db_session, assets, provider)
+
+    assert set(results) == {a.id for a in assets}
+    assert provider.requests == 1  # three distinct inputs, one batch
+    get_or_create_analyses(db_session, assets[:3], provider)
+    assert provider.requests == 1
+
+
+def test_progress_tracker_throttles_database_writes(db_session, seed_project):
+    job = seed_project("tracker", job_status=JobStatus.pending).job
+    db_session.commit()
+
+    store = InMemoryStateStore()
+    tracker = JobProgressTracker(db_session, job.id, store=store, flush_seconds=3600)
+    tracker.register(job)
+    updates = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE generation_jobs"):
+            updates.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        tracker.set_status(JobStatus.processing, progress=10)
+        for _ in range(100):
+            tracker.advance(1, total_outputs=100)
+        tracker.set_status(JobStatus.completed, progress=100)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # One write per status change; the 100 progress steps only touched the store.
+    assert len(updates) == 2
+    state = read_job_progress(job.id, store=store)
+    assert state["status"] == "completed" and state["done"] == "100"
+
+
+def test_a_failed_job_stays_failed_when_sibling_units_finish(db_session, seed_project):
+    job = seed_project("sibling", job_status=JobStatus.pending).job
+    db_session.commit()
+    store = InMemoryStateStore()
+    events = []
+    broker = SimpleNamespace(publish=lambda job_id, event: events.append(event["status"]))
+    tracker = JobProgressTracker(db_session, job.id, store=store, flush_seconds=0, broker=broker)
+    tracker.register(job)
+    tracker.set_status(JobStatus.processing, progress=10)
+
+    tracker.set_status(JobStatus.failed, progress=0)  # one unit failed the job
+    tracker.advance(1, total_outputs=4)  # ... and a sibling finished afterwards
+
+    assert read_job_progress(job.id, store=store)["status"] == "failed"
+    db_session.expire_all()
+    assert db_session.get(GenerationJob, job.id).status == JobStatus.failed
+    assert events == ["processing", "failed"]
+
+    # Even with the store out of step, Postgres keeps the terminal status.
+    store.hset(job_progress_key(job.id), {"status": "processing"})
+    tracker.advance(1, total_outputs=4)
+    db_session.expire_all()
+    assert db_session.get(GenerationJob, job.id).status == JobStatus.failed
+
+
+def test_generated_asset_writer_batches_inserts(db_session, seed_project):
+    seed = seed_project("writer", source="/a", job_status=JobStatus.processing)
+    asset, job = seed.asset, seed.job
+    db_session.commit()
+
+    inserts = []
+    flushed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO generated_assets"):
+            inserts.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with pytest.raises(RuntimeError):
+            with GeneratedAssetWriter(db_session, batch_size=4, on_flush=flushed.append) as writer:
+                for i in range(10):
+                    writer.add(job.id, asset.id, None, f"/g/{i}.png", "png", {"width": i, "height": i})
+                raise RuntimeError("provider went away")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # Two full batches plus the remainder flushed on failure.
+    assert flushed == [4, 4, 2]
+    assert len(inserts) == 3
+    assert db_session.query(GeneratedAsset).filter(GeneratedAsset.job_id == job.id).count() == 10
+
+
+def test_generate_routes_small_jobs_to_the_priority_queue(client: TestClient, db_session, seed_project, login,
+                                                         monkeypatch):
+    seed = seed_project("router")
+    for i in range(3):
+        db_session.add(Asset(project_id=seed.project.id, original_filename=f"{i}.png", storage_path="/x",
+                             file_type="png", file_size_bytes=1))
+    project_id = str(seed.project.id)
+    login(seed.user)
+    queued = []
+    monkeypatch.setattr(
+        "app.api.routers.generation.process_generation_job",
+        SimpleNamespace(apply_async=lambda args, queue: queued.append(queue)),
+    )
+    monkeypatch.setattr(settings, "PRIORITY_MAX_OUTPUTS", 6)
+
+    for format_count in (2, 3):
+        resp = client.post(
+            "/api/v1/generate",
+            json={"projectId": project_id, "formatIds": [str(uuid.uuid4()) for _ in range(format_count)]},
+        )
+        assert resp.status_code == 202
+
+    # 3 assets x 2 formats fits the threshold; 3 x 3 goes to the primary (batch) queue.
+    assert queued == [settings.CELERY_QUEUE_PRIORITY, settings.CELERY_QUEUE_PRIMARY]
+
+
+def test_generation_is_limited_to_the_users_own_projects(client: TestClient, db_session, seed_project, login,
+                                                         monkeypatch):
+    victim = seed_project("victim", source="/private.png")
+    queued = []
+    monkeypatch.setattr(
+        "app.api.routers.generation.process_generation_job",
+        SimpleNamespace(apply_async=lambda args, queue: queued.append(args)),
+    )
+    login(seed_project("intruder").user)
+
+    resp = client.post("/api/v1/generate", json={"projectId": str(victim.project.id), "formatIds": [],
+                                                "customResizes": [{"width": 100, "height": 100}]})
+
+    assert resp.status_code == 404
+    assert queued == []
+    assert db_session.query(GenerationJob).filter(GenerationJob.project_id == victim.project.id).count() == 0
+
+
+def test_job_events_stream_pushes_progress_until_done(client: TestClient, db_session, seed_project, login):
+    seed = seed_project("listener", job_status=JobStatus.pending)
+    job = seed.job
+    db_session.commit()
+    JobProgressTracker(db_session, job.id).register(job)
+    job_id = job.id
+    login(seed.user)
+
+    broker = get_job_event_broker()
+
+    def worker():
+        # Publish only once the stream below has subscribed to the job's channel.
+        deadline = time.monotonic() + 5
+        while job_channel(job_id) not in broker._subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        tracker = JobProgressTracker(db_session, job_id, flush_seconds=3600)
+        tracker.set_status(JobStatus.processing, progress=10)
+        tracker.set_status(JobStatus.processing, progress=10)  # unchanged: not published again
+        tracker.set_status(JobStatus.processing, progress=55)
+        tracker.set_status(JobStatus.completed, progress=100)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    with client.stream("GET", f"/api/v1/generate/{job_id}/events") as resp:
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = [json.loads(line[len("data: "):]) for line in resp.iter_lines() if line.startswith("data: ")]
+    thread.join()
+
+    assert events == [
+        {"status": "pending", "progress": 0},
+        {"status": "processing", "progress": 10},
+        {"status": "processing", "progress": 55},
+        {"status": "completed", "progress": 100},
+    ]
+
+
+def test_results_load_platform_names_in_one_query_and_cache_when_completed(client: TestClient, db_session,
+                                                                           seed_project, login):
+    seed = seed_project("results", source="/a", job_status=JobStatus.completed)
+    asset, job = seed.asset, seed.job
+    platform = RepurposingPlatform(name="Instagram")
+    db_session.add(platform)
+    db_session.flush()
+    story = AssetFormat(name="Story", type=FormatType.repurposing, platform_id=platform.id, width=1080, height=1920)
+    square = AssetFormat(name="Square", type=FormatType.resizing, width=1080, height=1080)
+    db_session.add_all([story, square])
+    db_session.flush()
+    for i, fmt in enumerate([story, story, square, story]):
+        db_session.add(GeneratedAsset(job_id=job.id, original_asset_id=asset.id, asset_format_id=fmt.id,
+                                      storage_path=f"/g/{i}.png", file_type="png", dimensions={"width": 1, "height": 1}))
+    job_id = job.id
+    login(seed.user)
+
+    selects = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "generated_assets" in statement and statement.lstrip().startswith("SELECT"):
+            selects.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        resp = client.get(f"/api/v1/generate/{job_id}/results")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert resp.status_code == 200
+    assert len(selects) == 1
+    body = resp.json()
+    assert sorted(body) == ["Generic", "Instagram"]
+    assert [r["formatName"] for r in body["Instagram"]] == ["Story"] * 3
+    assert {r["platformName"] for r in body["Instagram"]} == {"Instagram"}
+    assert body["Generic"][0]["platformName"] is None
+
+    etag = resp.headers["ETag"]
+    assert "max-age" in resp.headers["Cache-Control"]
+    cached = client.get(f"/api/v1/generate/{job_id}/results", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+
+def test_identical_target_sizes_are_rendered_once(db_session, seed_project, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, "GENERATED_DIR", str(tmp_path / "generated"))
+    (tmp_path / "generated").mkdir()
+    source = tmp_path / "source.png"
+    Image.new("RGB", (1600, 1200), (90, 140, 200)).save(source)
+    seed = seed_project("dedup", source=str(source), job_status=JobStatus.processing)
+    project, asset, job = seed.project, seed.asset, seed.job
+    square_a = AssetFormat(name="Square A", type=FormatType.resizing, width=540, height=540)
+    square_b = AssetFormat(name="Square B", type=FormatType.resizing, width=540, height=540)
+    db_session.add_all([square_a, square_b])
+    db_session.commit()
+    targets = [str(square_a.id), str(square_b.id), "custom:540x540", "custom:300x200"]
+
+    stored = _generate_asset_formats(db_session, str(job.id), str(project.id), str(asset.id), targets, len(targets))
+
+    rows = db_session.query(GeneratedAsset).filter(GeneratedAsset.job_id == job.id).all()
+    assert stored == 4
+    assert sorted((r.dimensions["width"], r.asset_format_id is None) for r in rows) == [
+        (300, True), (540, False), (540, False), (540, True)
+    ]
+    # Three 540x540 records share one render; the custom 300x200 size is the other file.
+    assert len({r.storage_path for r in rows}) == 2
+    assert len(list((tmp_path / "generated").iterdir())) == 2
+
+
+def test_strategies_left_out_of_local_rendering_go_to_the_provider(db_session, seed_project, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, "GENERATED_DIR", str(tmp_path))
+    source = tmp_path / "source.png"
+    Image.new("RGB", (800, 600), (90, 140, 200)).save(source)
+    seed = seed_project("provider-only", source=str(source), job_status=JobStatus.processing)
+    db_session.commit()
+    provider = MockProvider()
+    monkeypatch.setattr(tasks_generation, "get_ai_provider", lambda: provider)
+    set_rule(db_session, "ai-behavior", {**DEFAULT_AI_BEHAVIOR, "localStrategies": ["extend-canvas"]})
+    try:
+        stored = _generate_asset_formats(db_session, str(seed.job.id), str(seed.project.id), str(seed.asset.id),
+                                         ["custom:200x200"], 1)
+    finally:
+        set_rule(db_session, "ai-behavior", DEFAULT_AI_BEHAVIOR)
+
+    row = db_session.query(GeneratedAsset).filter(GeneratedAsset.job_id == seed.job.id).one()
+    assert stored == 1
+    assert provider.requests == 2  # the analysis and the generation; nothing rendered locally
+    assert row.storage_path == MockProvider()._generated()["url"]
+    assert os.listdir(tmp_path) == ["source.png"]
+
+
+def test_rerunning_a_unit_skips_checkpointed_targets(db_session, seed_project, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, "GENERATED_DIR", str(tmp_path))
+    source = tmp_path / "source.png"
+    Image.new("RGB", (800, 600), (90, 140, 200)).save(source)
+    seed = seed_project("resumer", source=str(source), job_status=JobStatus.processing)
+    project, asset, job = seed.project, seed.asset, seed.job
+    wide = AssetFormat(name="Wide", type=FormatType.resizing, width=320, height=180)
+    db_session.add(wide)
+    db_session.flush()
+    # The interrupted run had stored the wide format before the worker died.
+    db_session.add(GeneratedAsset(job_id=job.id, original_asset_id=asset.id, asset_format_id=wide.id,
+                                  storage_path="/g/wide.png", file_type="png", dimensions={"width": 320, "height": 180}))
+    db_session.commit()
+    targets = [str(wide.id), "custom:200x200"]
+
+    assert _generate_asset_formats(db_session, str(job.id), str(project.id), str(asset.id), targets, 2) == 1
+    assert _generate_asset_formats(db_session, str(job.id), str(project.id), str(asset.id), targets, 2) == 0
+    assert db_session.query(GeneratedAsset).filter(GeneratedAsset.job_id == job.id).count() == 2
+
+
+def test_long_units_keep_their_lease_while_rendering(db_session, seed_project, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, "GENERATED_DIR", str(tmp_path))
+    source = tmp_path / "source.png"
+    Image.new("RGB", (800, 600), (90, 140, 200)).save(source)
+    seed = seed_project("long-unit", source=str(source), job_status=JobStatus.processing)
+    db_session.commit()
+    provider = MockProvider()
+    provider.max_batch_size = provider.max_concurrency = 1
+    monkeypatch.setattr(tasks_generation, "get_ai_provider", lambda: provider)
+    targets = ["custom:100x100", "custom:200x100", "custom:300x100"]
+    renewals = []
+
+    _generate_asset_formats(db_session, str(seed.job.id), str(seed.project.id), str(seed.asset.id), targets, 3,
+                            keepalive=lambda: renewals.append("local"))
+    set_rule(db_session, "ai-behavior", {**DEFAULT_AI_BEHAVIOR, "localStrategies": []})
+    try:
+        _generate_asset_formats(db_session, str(seed.job.id), str(seed.project.id), str(seed.asset.id),
+                                ["custom:400x100", "custom:500x100"], 2, keepalive=lambda: renewals.append("remote"))
+    finally:
+        set_rule(db_session, "ai-behavior", DEFAULT_AI_BEHAVIOR)
+
+    # One renewal per local render and per provider round.
+    assert renewals == ["local"] * 3 + ["remote"] * 2
+
+
+def test_reaper_resumes_jobs_with_stale_heartbeats(db_engine, db_session, seed_project, monkeypatch):
+    seed = seed_project("reaped")
+    user, project = seed.user, seed.project
+    long_ago = datetime.now(timezone.utc) - timedelta(hours=2)
+    spec = {"assetIds": [str(uuid.uuid4())], "targetIds": ["custom:100x100"]}
+    stalled, queued, running, fresh, unplanned = (
+        GenerationJob(project_id=project.id, user_id=user.id, status=status, progress=40, spec=spec,
+                      heartbeat_at=heartbeat)
+        for status, heartbeat in (
+            (JobStatus.processing, long_ago),
+            (JobStatus.processing, long_ago),
+            (JobStatus.processing, long_ago),
+            (JobStatus.processing, datetime.now(timezone.utc)),
+            (JobStatus.pending, long_ago),
+        )
+    )
+    db_session.add_all([stalled, queued, running, fresh, unplanned])
+    db_session.commit()
+    stalled_id, unplanned_id = stalled.id, unplanned.id
+    # Units waiting for a fair-share slot, or running under a live lease, do not heartbeat,
+    # but their jobs are not stalled.
+    scheduler = FairShareScheduler()
+    scheduler.enqueue_job(str(user.id), str(queued.id), [{"asset_id": "a"}] * (settings.FAIR_SHARE_MAX_IN_FLIGHT_PER_USER + 1))
+    scheduler.enqueue_job(str(uuid.uuid4()), str(running.id), [{"asset_id": "a"}])
+    scheduler.dispatch(lambda unit: None)
+    monkeypatch.setattr(tasks_generation, "SessionLocal", sessionmaker(bind=db_engine))
+    resumed = []
+    monkeypatch.setattr(
+        tasks_generation, "process_generation_job", SimpleNamespace(apply_async=lambda args, queue: resumed.append(args))
+    )
+
+    assert reap_stale_jobs() == 2
+    assert reap_stale_jobs() == 0  # the heartbeat was refreshed on resume
+
+    assert sorted(resumed) == sorted([str(job_id), str(project.id), spec["assetIds"], spec["targetIds"]]
+                                     for job_id in (stalled_id, unplanned_id))
+    db_session.expire_all()
+    assert db_session.get(GenerationJob, stalled_id).resume_count == 1
+    assert db_session.get(GenerationJob, stalled_id).status == JobStatus.pending  # for the resumed run to claim
+    assert db_session.get(GenerationJob, unplanned_id).resume_count == 0
+
+
+def test_only_pending_jobs_are_planned(db_engine, db_session, seed_project, monkeypatch):
+    seed = seed_project("planned-once", job_status=JobStatus.processing)
+    db_session.commit()
+    monkeypatch.setattr(tasks_generation, "SessionLocal", sessionmaker(bind=db_engine))
+    monkeypatch.setattr(tasks_generation, "get_ai_provider", lambda: pytest.fail("a duplicate message was planned"))
+
+    tasks_generation.process_generation_job(str(seed.job.id), str(seed.project.id), [], ["custom:100x100"])
+
+    db_session.expire_all()
+    assert db_session.get(GenerationJob, seed.job.id).status == JobStatus.processing
+    assert db_session.get(GenerationJob, seed.job.id).spec is None
+
+
+def test_outputs_of_deleted_formats_are_not_custom_checkpoints(db_session, seed_project):
+    seed = seed_project("format-gone", source="/a", job_status=JobStatus.processing)
+    # Stored for a 200x200 format that was deleted since (its row's format is now NULL).
+    db_session.add(GeneratedAsset(job_id=seed.job.id, original_asset_id=seed.asset.id, asset_format_id=None,
+                                  storage_path="/g/gone.png", file_type="png", dimensions={"width": 200, "height": 200}))
+    db_session.flush()
+    asset_id = str(seed.asset.id)
+
+    assert completed_targets(db_session, seed.job.id, [str(uuid.uuid4())]) == {}
+    assert completed_targets(db_session, seed.job.id, ["custom:200x200"]) == {asset_id: {"custom:200x200"}}
@@ -0,0 +1,44 @@
+import asyncio
+
+from PIL import Image
+
+from app.utils.image_utils import open_pyramid, probe_image, probe_images, render_targets
+
+
+def test_probe_image_reads_header_fields(tmp_path):
+    path = tmp_path / "photo.jpg"
+    Image.new("CMYK", (320, 200)).save(path, "JPEG", dpi=(300, 300))
+
+    info = probe_image(str(path))
+
+    assert info == {"width": 320, "height": 200, "dpi": 300, "mode": "CMYK", "layers": None}
+
+
+def test_probe_images_keeps_order_and_tolerates_bad_files(tmp_path):
+    good = tmp_path / "a.png"
+    Image.new("RGBA", (64, 32)).save(good)
+    bad = tmp_path / "b.png"
+    bad.write_bytes(b"not an image")
+
+    results = asyncio.run(probe_images([str(bad), str(good), str(good)]))
+
+    assert results[0] == {}
+    assert results[1]["width"] == 64 and results[1]["mode"] == "RGBA"
+    assert results[2] == results[1]
+
+
+def test_render_targets_decodes_once_for_all_sizes(tmp_path):
+    source = tmp_path / "source.jpg"
+    Image.new("RGB", (1600, 1200), "orange").save(source, "JPEG")
+    targets = [
+        {"width": 200, "height": 150, "path": str(tmp_path / "small.png")},
+        {"width": 90, "height": 90, "path": str(tmp_path / "square.jpg"), "box": (200, 0, 1400, 1200)},
+        {"width": 400, "height": 100, "path": str(tmp_path / "banner.png")},
+    ]
+
+    paths = render_targets(str(source), targets)
+
+    assert [Image.open(p).size for p in paths] == [(200, 150), (90, 90), (400, 100)]
+    # The JPEG decoder is asked for no more pixels than the largest target needs.
+    pyramid = open_pyramid(str(source), targets)
+    assert pyramid.levels[0].width < 1600
@@ -1,5 +1,13 @@
 import io
+from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.dependencies import get_current_user
+from app.main import app
+from app.models.asset import Asset
+from app.models.project import Project, ProjectStatus
+from app.models.user import User
 
 
 def test_upload_and_status(client: TestClient):
@@ -18,3 +26,65 @@ def test_upload_and_status(client: TestClient):
     status_resp = client.get(f"/api/v1/projects/{project_id}/status")
     assert status_resp.status_code == 200
     assert "status" in status_resp.json()
+
+
+def test_list_projects_query_count_is_constant(client: TestClient, db_session):
+    user = User(username="counter", email="counter@example.com", hashed_password="x", preferences={})
+    db_session.add(user)
+    db_session.commit()
+    for i in range(6):
+        project = Project(user_id=user.id, name=f"P{i}", status=ProjectStatus.ready_for_review)
+        db_session.add(project)
+        db_session.flush()
+        for ext in ("png", "jpg", "PSD", "png"):
+            db_session.add(
+                Asset(project_id=project.id, original_filename=f"f.{ext}", storage_path="/x", file_type=ext, file_size_bytes=1)
+            )
+    db_session.commit()
+    db_session.refresh(user)
+    app.dependency_overrides[get_current_user] = lambda: user
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for limit in (1, 3, 6):
+            statements.clear()
+            resp = client.get(f"/api/v1/projects?limit={limit}")
+            assert resp.status_code == 200
+            assert len(resp.json()) == limit
+            assert resp.json()[0]["fileCounts"] == {"psd": 1, "jpg": 1, "png": 2}
+            assert len(statements) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def test_list_projects_cursor_pagination(client: TestClient, db_session):
+    user = User(username="pager", email="pager@example.com", hashed_password="x", preferences={})
+    db_session.add(user)
+    db_session.commit()
+    base = datetime(2025, 1, 1, 12, 0, 0, 500000)
+    for i in range(5):
+        # Two projects share each timestamp so the id tie-breaker is exercised.
+        db_session.add(Project(user_id=user.id, name=f"P{i}", created_at=base + timedelta(seconds=i // 2)))
+    db_session.commit()
+    db_session.refresh(user)
+    app.dependency_overrides[get_current_user] = lambda: user
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/api/v1/projects?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        resp = client.get(url)
+        assert resp.status_code == 200
+        seen.extend(p["id"] for p in resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert len(seen) == len(set(seen)) == 5
+    assert client.get("/api/v1/projects?cursor=garbage").status_code == 400
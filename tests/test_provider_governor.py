@@ -0,0 +1,139 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.ai_provider.governor import CircuitOpen, ProviderGovernor, ProviderThrottled, ProviderUnavailable
+from app.services.state_store import InMemoryStateStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _status_error(code, headers=None):
+    request = httpx.Request("POST", "http://provider/generate")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, headers=headers, request=request))
+
+
+def _run(governor, result=None, error=None, max_wait=None):
+    async def call():
+        if error is not None:
+            raise error
+        return result
+
+    return asyncio.run(governor.run(call, max_wait=max_wait))
+
+
+def test_token_bucket_is_shared_and_parks_long_waits():
+    store, clock = InMemoryStateStore(), Clock()
+    first = ProviderGovernor("p", store=store, rate=2, clock=clock)
+    second = ProviderGovernor("p", store=store, rate=2, clock=clock)  # another worker process
+
+    assert _run(first, "a") == "a"
+    assert _run(second, "b") == "b"
+    # The bucket (capacity 2) is empty for both; waiting 0.5s is longer than allowed here.
+    with pytest.raises(ProviderThrottled) as info:
+        _run(first, "c", max_wait=0.1)
+    assert info.value.retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert _run(second, "d") == "d"
+
+
+def test_429_halves_concurrency_and_successes_grow_it_back():
+    store, clock = InMemoryStateStore(), Clock()
+    governor = ProviderGovernor("p", store=store, max_concurrency=16, clock=clock)
+
+    with pytest.raises(ProviderThrottled) as info:
+        _run(governor, error=_status_error(429, {"Retry-After": "7"}))
+    assert info.value.retry_after == 7
+    with pytest.raises(ProviderThrottled):
+        _run(governor, error=_status_error(429))  # same window: no second halving
+    assert governor.state()["limit"] == 8
+
+    for _ in range(8):
+        _run(governor, "ok")
+    assert 8.9 < governor.state()["limit"] < 9.1
+    assert governor.state()["in_flight"] == 0
+
+
+def test_circuit_opens_after_repeated_failures_then_recovers(monkeypatch):
+    store, clock = InMemoryStateStore(), Clock()
+    governor = ProviderGovernor("p", store=store, clock=clock)
+    monkeypatch.setattr("app.services.ai_provider.governor.settings.PROVIDER_BREAKER_THRESHOLD", 3)
+    monkeypatch.setattr("app.services.ai_provider.governor.settings.PROVIDER_BREAKER_COOLDOWN_SECONDS", 30.0)
+
+    for _ in range(2):
+        # Below the threshold a failure parks the call briefly instead of failing its job.
+        with pytest.raises(ProviderUnavailable) as info:
+            _run(governor, error=_status_error(503))
+        assert info.value.retry_after == pytest.approx(5.0)
+    assert governor.state()["limit"] == governor.max_concurrency / 2
+    with pytest.raises(CircuitOpen):
+        _run(governor, error=_status_error(503))
+
+    # While open, calls are rejected without reaching the provider.
+    with pytest.raises(CircuitOpen) as info:
+        _run(governor, error=AssertionError("provider must not be called"))
+    assert info.value.retry_after == pytest.approx(30.0)
+
+    clock.now += 30
+    assert _run(governor, "ok") == "ok"
+    assert governor.state()["failures"] == 0
+
+
+def test_client_errors_do_not_trip_the_breaker():
+    governor = ProviderGovernor("p", store=InMemoryStateStore(), clock=Clock())
+    for _ in range(10):
+        with pytest.raises(httpx.HTTPStatusError):
+            _run(governor, error=_status_error(400))
+    assert governor.state()["failures"] == 0
+
+
+def test_leases_of_dead_calls_expire():
+    store, clock = InMemoryStateStore(), Clock()
+    governor = ProviderGovernor("p", store=store, max_concurrency=1, clock=clock)
+    asyncio.run(governor._acquire_slot(clock.now + 1))  # a worker died holding this slot
+
+    with pytest.raises(ProviderThrottled):
+        _run(governor, "blocked", max_wait=0)
+
+    clock.now += governor.lease_seconds + 1
+    assert _run(governor, "ok") == "ok"
+    assert governor.state()["in_flight"] == 0
+
+
+def test_only_a_probe_after_the_cooldown_closes_the_circuit(monkeypatch):
+    store, clock = InMemoryStateStore(), Clock()
+    governor = ProviderGovernor("p", store=store, clock=clock)
+    monkeypatch.setattr("app.services.ai_provider.governor.settings.PROVIDER_BREAKER_THRESHOLD", 1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "late"
+
+        async def failing():
+            raise _status_error(503)
+
+        straggler = asyncio.create_task(governor.run(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpen):
+            await governor.run(failing)
+        release.set()
+        return await straggler
+
+    # Admitted before the circuit opened: its success must not close it.
+    assert asyncio.run(scenario()) == "late"
+    assert governor.state()["open_until"] > clock.now
+
+    clock.now = governor.state()["open_until"]
+    assert _run(governor, "probe") == "probe"
+    assert governor.state()["open_until"] == 0
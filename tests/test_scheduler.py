@@ -0,0 +1,139 @@
+from app.services.scheduler import FairShareScheduler
+from app.services.state_store import InMemoryStateStore
+
+
+def _units(n):
+    return [{"asset_id": str(i)} for i in range(n)]
+
+
+def test_bulk_user_does_not_starve_others(monkeypatch):
+    monkeypatch.setattr("app.services.scheduler.settings.FAIR_SHARE_MAX_IN_FLIGHT_PER_USER", 2)
+    scheduler = FairShareScheduler(store=InMemoryStateStore())
+    sent = []
+
+    scheduler.enqueue_job("bulk", "job-bulk", _units(20))
+    scheduler.dispatch(sent.append)
+    scheduler.enqueue_job("small", "job-small", _units(3))
+    scheduler.dispatch(sent.append)
+
+    # Both users run at their cap even though "bulk" queued 20 units first.
+    assert [u["user_id"] for u in sent] == ["bulk", "bulk", "small", "small"]
+
+    # As slots free up, each user's next unit is dispatched; "small" finishes without waiting for "bulk".
+    finished = []
+    while sent:
+        unit = sent.pop(0)
+        if scheduler.complete(unit):
+            finished.append(unit["job_id"])
+        scheduler.dispatch(sent.append)
+    assert finished == ["job-small", "job-bulk"]
+
+
+def test_weights_scale_the_share(monkeypatch):
+    monkeypatch.setattr("app.services.scheduler.settings.FAIR_SHARE_MAX_IN_FLIGHT_PER_USER", 1)
+    monkeypatch.setattr("app.services.scheduler.settings.FAIR_SHARE_WEIGHTS", {"team-a": 3})
+    scheduler = FairShareScheduler(store=InMemoryStateStore())
+    scheduler.enqueue_job("team-a", "a", _units(10))
+    scheduler.enqueue_job("team-b", "b", _units(10))
+
+    sent = []
+    scheduler.dispatch(sent.append)
+
+    assert sorted(u["user_id"] for u in sent) == ["team-a"] * 3 + ["team-b"]
+
+
+def test_failed_job_units_are_dropped_and_depths_reported(monkeypatch):
+    monkeypatch.setattr("app.services.scheduler.settings.FAIR_SHARE_MAX_IN_FLIGHT_PER_USER", 1)
+    scheduler = FairShareScheduler(store=InMemoryStateStore())
+    scheduler.enqueue_job("u1", "doomed", _units(3))
+    scheduler.enqueue_job("u1", "next", _units(1))
+    sent = []
+    scheduler.dispatch(sent.append)
+    assert scheduler.queue_depths() == [
+        {"userId": "u1", "queued": 3, "inFlight": 1, "maxInFlight": 1, "weight": 1}
+    ]
+
+    scheduler.fail(sent.pop())
+    scheduler.dispatch(sent.append)
+
+    assert [u["job_id"] for u in sent] == ["next"]
+    assert scheduler.complete(sent.pop()) is True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_slots_of_vanished_workers_are_given_back(monkeypatch):
+    monkeypatch.setattr("app.services.scheduler.settings.FAIR_SHARE_MAX_IN_FLIGHT_PER_USER", 1)
+    monkeypatch.setattr("app.services.scheduler.settings.FAIR_SHARE_LEASE_SECONDS", 60)
+    clock = Clock()
+    scheduler = FairShareScheduler(store=InMemoryStateStore(), clock=clock)
+    scheduler.enqueue_job("u1", "job", _units(2))
+    sent = []
+    scheduler.dispatch(sent.append)  # this unit's worker never reports back
+
+    clock.now += 30
+    scheduler.renew(sent[0])  # ... until now: it is alive and keeps the slot
+    clock.now += 45
+    assert scheduler.dispatch(sent.append) == 0
+
+    clock.now += 30
+    assert scheduler.dispatch(sent.append) == 1
+    assert [u["asset_id"] for u in sent] == ["0", "1"]
+
+
+def test_job_counters_are_dropped_with_the_last_unit():
+    store = InMemoryStateStore()
+    scheduler = FairShareScheduler(store=store)
+    scheduler.enqueue_job("u1", "done", _units(2))
+    scheduler.enqueue_job("u1", "doomed", _units(2))
+    sent = []
+    scheduler.dispatch(sent.append)
+
+    assert scheduler.complete(sent[0]) is False
+    assert scheduler.complete(sent[1]) is True
+    scheduler.fail(sent[2])
+    scheduler.complete(sent[3])
+
+    assert store.hgetall("fair-share:job:done") == {}
+    assert store.hgetall("fair-share:job:doomed") == {}
+    assert scheduler.queue_depths()[0]["inFlight"] == 0
+    assert store.zcard("fair-share:job-leases:done") == 0
+
+
+def test_units_only_count_once_while_their_lease_is_held(monkeypatch):
+    monkeypatch.setattr("app.services.scheduler.settings.FAIR_SHARE_LEASE_SECONDS", 60)
+    clock = Clock()
+    scheduler = FairShareScheduler(store=InMemoryStateStore(), clock=clock)
+    scheduler.enqueue_job("u1", "job", _units(2))
+    sent = []
+    scheduler.dispatch(sent.append)
+    assert scheduler.outstanding_units("job") == 2  # running, not stalled
+
+    assert scheduler.complete(sent[0]) is False
+    assert scheduler.complete(sent[0]) is None  # a redelivered task reporting again
+    assert scheduler.outstanding_units("job") == 1
+
+    clock.now += 61  # the other unit's worker vanished; the job is resumed with that unit
+    assert scheduler.outstanding_units("job") == 0
+    scheduler.enqueue_job("u1", "job", _units(1))
+    scheduler.dispatch(sent.append)
+    scheduler.renew(sent[1])  # the stale unit's lease is not revived
+    assert scheduler.complete(sent[1]) is None
+    assert scheduler.complete(sent[2]) is True
+
+
+def test_depths_include_users_with_only_work_in_flight():
+    scheduler = FairShareScheduler(store=InMemoryStateStore())
+    scheduler.enqueue_job("u1", "job", _units(1))
+    sent = []
+    scheduler.dispatch(sent.append)  # the queue is empty now, the unit still runs
+
+    assert [(d["userId"], d["queued"], d["inFlight"]) for d in scheduler.queue_depths()] == [("u1", 0, 1)]
+    scheduler.complete(sent[0])
+    assert scheduler.queue_depths() == []
@@ -0,0 +1,33 @@
+from PIL import Image, ImageDraw
+
+from app.utils.smart_crop import focal_region, plan_crops, plan_smart_crops, saliency_map
+
+
+def _scene():
+    img = Image.new("RGB", (1600, 900), (40, 60, 80))
+    ImageDraw.Draw(img).ellipse((1200, 300, 1400, 500), fill=(224, 172, 140))  # skin-toned subject, right side
+    return img
+
+
+def test_focal_point_follows_the_subject():
+    (fx, fy), _ = focal_region(saliency_map(_scene(), "face-centric"))
+    assert 0.7 < fx < 0.9
+    assert 0.35 < fy < 0.55
+
+
+def test_crops_match_aspect_and_keep_subject_in_safe_zone():
+    safe = {"top": 0.05, "bottom": 0.05, "left": 0.1, "right": 0.1}
+    sizes = [(1080, 1080), (1080, 1920), (1200, 628)]
+
+    boxes = plan_smart_crops(_scene(), (1600, 900), sizes, "face-centric", safe)
+
+    for (w, h), (x0, y0, x1, y1) in zip(sizes, boxes):
+        assert abs((x1 - x0) / (y1 - y0) - w / h) < 1e-6
+        assert 0 <= x0 and x1 <= 1600 and 0 <= y0 and y1 <= 900
+        crop_w = x1 - x0
+        assert x0 + crop_w * safe["left"] <= 1200 and 1400 <= x1 - crop_w * safe["right"]
+
+
+def test_plan_crops_is_clamped_to_the_image():
+    boxes = plan_crops((1000, 500), [(100, 100)], focal=(0.0, 0.0), subject=(0.0, 0.0, 0.1, 0.1))
+    assert boxes == [(0.0, 0.0, 500.0, 500.0)]
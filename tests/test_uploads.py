@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.api.routers import projects
+from app.main import RequestSizeLimitMiddleware
+from app.models.project import Project
+from app.models.stored_blob import StoredBlob
+from app.utils import file_utils
+from app.utils.file_utils import UploadTooLargeError, commit_blob, stream_upload_file
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_stream_upload_hashes_in_chunks(upload_dir):
+    payload = os.urandom(10_000)
+    upload = UploadFile(io.BytesIO(payload), filename="banner.png")
+
+    saved = asyncio.run(stream_upload_file(upload, "banner.png", max_bytes=20_000, chunk_size=1024))
+
+    assert saved["size"] == len(payload)
+    assert saved["sha256"] == hashlib.sha256(payload).hexdigest()
+    assert saved["path"] == file_utils.blob_path(saved["sha256"])
+    assert not os.path.exists(saved["path"])  # staged until the caller commits it
+    assert commit_blob(saved["tmp_path"], saved["sha256"]) == (saved["path"], True)
+    with open(saved["path"], "rb") as f:
+        assert f.read() == payload
+
+
+def test_stream_upload_deduplicates_identical_content(upload_dir):
+    payload = b"same brand logo"
+    first = asyncio.run(stream_upload_file(UploadFile(io.BytesIO(payload)), "logo.png", max_bytes=1024))
+    second = asyncio.run(stream_upload_file(UploadFile(io.BytesIO(payload)), "banner.png", max_bytes=1024))
+
+    assert first["path"] == second["path"]
+    assert commit_blob(first["tmp_path"], first["sha256"])[1]
+    assert not commit_blob(second["tmp_path"], second["sha256"])[1]
+    assert os.listdir(upload_dir / "tmp") == []
+
+
+def test_stream_upload_rejects_oversized_file(upload_dir):
+    upload = UploadFile(io.BytesIO(b"x" * 5000), filename="huge.png")
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(stream_upload_file(upload, "huge.png", max_bytes=4096, chunk_size=1024))
+
+    assert os.listdir(upload_dir / "tmp") == []
+    assert not os.path.exists(upload_dir / "blobs")
+
+
+def _blobs(upload_dir):
+    return sorted(name for _, _, names in os.walk(upload_dir / "blobs") for name in names)
+
+
+def test_rejected_upload_leaves_no_blobs_or_rows(client: TestClient, db_session, seed_project, login, upload_dir,
+                                                  monkeypatch):
+    user = seed_project("rejected").user
+    login(user)
+    monkeypatch.setattr(projects.settings, "UPLOAD_MAX_MB", 1)
+    files = [
+        ("files", ("ok.png", io.BytesIO(b"small enough"), "image/png")),
+        ("files", ("huge.png", io.BytesIO(b"x" * (1024 * 1024 + 1)), "image/png")),
+    ]
+
+    resp = client.post("/api/v1/projects/upload", data={"projectName": "Rejected"}, files=files)
+
+    assert resp.status_code == 413
+    assert _blobs(upload_dir) == []
+    assert os.listdir(upload_dir / "tmp") == []
+    assert db_session.query(Project).filter(Project.user_id == user.id).count() == 1  # only the seeded one
+
+
+def test_deleting_the_last_reference_removes_the_blob(client: TestClient, db_session, seed_project, login, upload_dir):
+    login(seed_project("deleter").user)
+    payload = b"shared bytes"
+    ids = []
+    for name in ("a.png", "b.png"):
+        resp = client.post("/api/v1/projects/upload", data={"projectName": name},
+                           files=[("files", (name, io.BytesIO(payload), "image/png"))])
+        assert resp.status_code == 202
+        project_id = resp.json()["projectId"]
+        asset_id = client.get(f"/api/v1/projects/{project_id}/preview").json()[0]["id"]
+        ids.append((project_id, asset_id))
+    sha256 = hashlib.sha256(payload).hexdigest()
+    assert _blobs(upload_dir) == [sha256]
+
+    assert client.delete(f"/api/v1/projects/{ids[0][0]}/assets/{ids[0][1]}").status_code == 204
+    assert _blobs(upload_dir) == [sha256]
+    assert client.delete(f"/api/v1/projects/{ids[1][0]}/assets/{ids[1][1]}").status_code == 204
+    assert _blobs(upload_dir) == []
+    db_session.expire_all()
+    assert db_session.get(StoredBlob, sha256) is None
+    assert client.delete(f"/api/v1/projects/{ids[1][0]}/assets/{ids[1][1]}").status_code == 404
+
+
+def test_request_bodies_are_cut_off_at_the_limit():
+    seen = []
+
+    async def endpoint(request):
+        seen.append(len(await request.body()))
+        return PlainTextResponse("ok")
+
+    limited = TestClient(RequestSizeLimitMiddleware(Starlette(routes=[Route("/", endpoint, methods=["POST"])]), 10))
+
+    def chunked(n):
+        for _ in range(n):
+            yield b"x" * 4
+
+    assert limited.post("/", content=chunked(2)).status_code == 200  # no Content-Length: counted as it arrives
+    assert limited.post("/", content=chunked(3)).status_code == 413
+    assert limited.post("/", content=b"x" * 11).status_code == 413  # refused on the declared length
+    assert seen == [8]